@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到 sys.path
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+from src.services.local_vector_store import LocalVectorStore
+
+def make_dataset(rows: int, dim: int, clusters: int, seed: int):
+    """带簇结构的合成向量（比纯随机向量更接近真实 embedding 分布）"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    data = centers[labels] + 0.5 * rng.standard_normal((rows, dim)).astype(np.float32)
+    queries = centers[rng.integers(0, clusters, size=1000)] + 0.5 * rng.standard_normal((1000, dim)).astype(np.float32)
+    return data, queries
+
+def ground_truth(data: np.ndarray, queries: np.ndarray, k: int):
+    """精确余弦 top-k（float32 全量计算），作为召回率基准"""
+    data = data / np.linalg.norm(data, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    results = []
+    for q in queries:
+        scores = data @ q
+        results.append({str(i) for i in np.argpartition(-scores, k - 1)[:k]})
+    return results
+
+async def run(store: LocalVectorStore, queries: np.ndarray, k: int):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        hits = await store.search(q.tolist(), k)
+        latencies.append(time.perf_counter() - start)
+        results.append({h["content"] for h in hits})
+    return results, np.array(latencies) * 1000
+
+def report(name: str, results, latencies: np.ndarray, truth):
+    recall = np.mean([len(r & t) / len(t) for r, t in zip(results, truth)])
+    print(f"{name:>12} {recall:>10.3f} {np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f}")
+
+async def benchmark(args):
+    data, queries = make_dataset(args.rows, args.dim, args.clusters, seed=0)
+    queries = queries[:args.queries]
+    truth = ground_truth(data, queries, args.k)
+
+    with tempfile.TemporaryDirectory() as path:
+        store = LocalVectorStore(path, args.dtype, index="ivf", nlist=args.nlist, min_rows=1)
+        build_start = time.perf_counter()
+        batch = 20000
+        for s in range(0, args.rows, batch):
+            await store.add_chunks([
+                {"content": str(i), "doc_id": i, "kb_type": "science", "tags": [], "source": "bench", "vector": data[i]}
+                for i in range(s, min(args.rows, s + batch))
+            ])
+        await store.close()
+        print(f"rows={args.rows} dim={args.dim} dtype={args.dtype} build={time.perf_counter() - build_start:.1f}s")
+
+        print(f"{'mode':>12} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p99 ms':>8}")
+        # 以不同 nprobe 重新打开同一份已持久化的索引
+        for nprobe in args.nprobe:
+            store = LocalVectorStore(path, args.dtype, index="ivf", nlist=args.nlist, nprobe=nprobe, min_rows=1)
+            await store.start()
+            report(f"nprobe={nprobe}", *await run(store, queries, args.k), truth)
+        # 最后以精确检索打开（flat 存储加载时会清理 IVF 文件）
+        store = LocalVectorStore(path, args.dtype, index="flat")
+        await store.start()
+        report("exact", *await run(store, queries, args.k), truth)
+
+def main():
+    parser = argparse.ArgumentParser(description="本地向量索引召回率 / 延迟对比（IVF vs 精确检索）")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16", "int8"])
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+    asyncio.run(benchmark(args))
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ from src.models.database import engine, Base
 from src.models.tables import User
 from src.utils.security import get_password_hash
 from sqlalchemy.future import select
+from sqlalchemy import inspect, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
 
@@ -18,6 +19,13 @@ async def init_db():
         # ⚠️ 注意：这会删除所有表！仅用于开发初期
         # await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+        # create_all 不会给已有表加列：补齐 knowledge_files.version
+        columns = await conn.run_sync(
+            lambda sync_conn: [c["name"] for c in inspect(sync_conn).get_columns("knowledge_files")]
+        )
+        if "version" not in columns:
+            print("Adding column knowledge_files.version")
+            await conn.execute(text("ALTER TABLE knowledge_files ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
 
     # Seed default user
     async_session = sessionmaker(
@@ -0,0 +1,56 @@
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 sys.path
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+from src.services.keyword_index import keyword_index
+from src.services.retrieval_cache import knowledge_generation
+from src.services.vector_service import vector_service
+
+BATCH = 500
+
+async def rebuild(force: bool):
+    """
+    从向量库回填 BM25 关键词索引
+    关键词索引上线前入库的文档只存在于向量库中：默认只补齐索引中缺失的文档，--force 时全部重建。
+    """
+    await vector_service.start()
+    await keyword_index.start()
+
+    existing = await keyword_index.doc_ids()
+    if force:
+        for doc_id in existing:
+            await keyword_index.delete_by_doc_id(doc_id)
+        existing = set()
+
+    batch, docs, added = [], set(), 0
+    for chunk in vector_service.iter_chunks():
+        if chunk["doc_id"] in existing:
+            continue
+        batch.append(chunk)
+        docs.add(chunk["doc_id"])
+        if len(batch) >= BATCH:
+            await keyword_index.add_chunks(batch)
+            added += len(batch)
+            batch = []
+    if batch:
+        await keyword_index.add_chunks(batch)
+        added += len(batch)
+
+    if added:
+        # 运行中的服务进程据此同步关键词索引并丢弃检索缓存
+        knowledge_generation.bump()
+    print(f"Backfilled {added} chunks from {len(docs)} documents into the keyword index")
+
+    keyword_index.close()
+    await vector_service.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从向量库回填 BM25 关键词索引")
+    parser.add_argument("--force", action="store_true", help="清空后全部重建")
+    args = parser.parse_args()
+    asyncio.run(rebuild(args.force))
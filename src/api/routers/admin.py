@@ -16,8 +16,18 @@ from src.schemas.admin import (
     RecordListItem,
     RecordDetailResponse,
     FunnelStep,
-    TrackDistributionItem
+    TrackDistributionItem,
+    LLMHealthResponse,
+    EmbeddingCacheStats,
+    VectorStoreHealth,
+    RetrievalCacheStats,
+    DocumentParserStats
 )
+from src.services.llm_service import llm_service
+from src.services.embedding_cache import embedding_cache
+from src.services.vector_service import vector_service
+from src.services.retrieval_cache import retrieval_cache
+from src.services.parse_pool import parse_pool
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
@@ -267,3 +277,53 @@ async def get_record_detail(
         created_at=session.created_at
     )
 
+
+
+# --- LLM 服务运维接口 ---
+
+@router.get("/llm/health", response_model=LLMHealthResponse)
+async def get_llm_health(
+    current_user = Depends(get_current_user)
+):
+    """获取各 LLM provider 的熔断状态与健康评分"""
+    return {"providers": llm_service.provider_health()}
+
+@router.post("/llm/breakers/{provider}/reset", response_model=LLMHealthResponse)
+async def reset_llm_breaker(
+    provider: str,
+    current_user = Depends(get_current_user)
+):
+    """手动重置指定 provider 的熔断器"""
+    breaker = llm_service.breakers.get(provider)
+    if not breaker:
+        raise HTTPException(status_code=404, detail="Provider not found")
+    breaker.reset()
+    return {"providers": llm_service.provider_health()}
+
+@router.get("/embedding/cache", response_model=EmbeddingCacheStats)
+async def get_embedding_cache_stats(
+    current_user = Depends(get_current_user)
+):
+    """获取 Embedding 缓存命中统计"""
+    return embedding_cache.snapshot()
+
+@router.get("/vector/health", response_model=VectorStoreHealth)
+async def get_vector_health(
+    current_user = Depends(get_current_user)
+):
+    """获取向量库连接状态"""
+    return await vector_service.health()
+
+@router.get("/retrieval/cache", response_model=RetrievalCacheStats)
+async def get_retrieval_cache_stats(
+    current_user = Depends(get_current_user)
+):
+    """获取检索结果缓存命中率与节省的延迟"""
+    return retrieval_cache.snapshot()
+
+@router.get("/parser/stats", response_model=DocumentParserStats)
+async def get_parser_stats(
+    current_user = Depends(get_current_user)
+):
+    """获取文档解析进程池状态与最近文档的 CPU 耗时"""
+    return parse_pool.snapshot()
@@ -1,10 +1,12 @@
+import json
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import desc
 from pydantic import BaseModel
 from typing import Optional, Dict, List
-from src.models.database import get_db
+from src.models.database import get_db, AsyncSessionLocal
 from src.models.tables import User, Session as DBSession, Message
 from src.api.dependencies import get_current_user
 from src.services.business_service import business_service
@@ -146,3 +148,41 @@ async def chat_message(
     result = await business_service.process_chat(db, request.session_id, request.content)
     
     return result
+
+@router.post("/message/stream")
+async def chat_message_stream(
+    request: ChatRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    流式对话 (Server-Sent Events)
+    事件格式: data: {"type": "delta" | "done" | "error", ...}
+    """
+    # 验证 session 属于当前用户
+    session = await business_service.get_session(db, request.session_id)
+    if not session or session.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Session not found or access denied")
+
+    async def event_stream():
+        # 流式响应的生命周期长于依赖注入的 db 会话，这里单独开一个会话
+        async with AsyncSessionLocal() as stream_db:
+            try:
+                async for event in business_service.process_chat_stream(
+                    stream_db, request.session_id, request.content
+                ):
+                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            except Exception as e:
+                await stream_db.rollback()
+                print(f"❌ Error in chat_message_stream: {e}")
+                error_event = {"type": "error", "detail": str(e)}
+                yield f"data: {json.dumps(error_event, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 关闭 Nginx 缓冲，保证逐段下发
+        }
+    )
@@ -1,15 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func
-from typing import List, Optional
+from sqlalchemy import select, desc, func, delete, update
+from typing import List, Literal, Optional
 import json
 
 from src.api.dependencies import get_db
-from src.models.tables.knowledge import KnowledgeFile, KBType, FileStatus
+from src.config.settings import settings
+from src.models.tables.knowledge import KnowledgeFile, KnowledgeChunk, KBType, FileStatus
 from src.services.knowledge_service import KnowledgeService
 from src.services.oss_service import OSSService
-from src.services.vector_service import VectorService
-from src.services.volc_service import VolcService
+from src.services.vector_service import vector_service
+from src.services.keyword_index import keyword_index
+from src.services.retrieval_service import retrieval_service
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -23,6 +25,7 @@ class FileResponse(BaseModel):
     tags: List[str]
     status: str
     error_msg: Optional[str]
+    version: int = 1
     created_at: str
 
     class Config:
@@ -37,13 +40,29 @@ class SearchRequest(BaseModel):
     kb_types: Optional[List[str]] = None
     tags: Optional[List[str]] = None
     limit: int = 5
+    mode: Literal["vector", "keyword", "hybrid"] = "vector"
+    rerank: bool = False  # 两阶段检索：一阶段多取候选后重排序
 
 class SearchResult(BaseModel):
     content: str
     doc_id: int
     kb_type: str
     source: str
-    distance: float
+    distance: Optional[float] = None  # 向量距离，仅关键词命中的结果为空
+    score: Optional[float] = None  # keyword: BM25 分数；hybrid: RRF 融合分数
+    rerank_score: Optional[float] = None
+
+class SearchBatchRequest(BaseModel):
+    queries: List[str]
+    kb_types: Optional[List[str]] = None
+    tags: Optional[List[str]] = None
+    limit: int = 5
+    mode: Literal["vector", "keyword", "hybrid"] = "vector"
+    rerank: bool = False  # 两阶段检索：一阶段多取候选后重排序
+
+class SearchBatchItem(BaseModel):
+    query: str
+    results: List[SearchResult]
 
 # --- Helpers ---
 def map_status(status: FileStatus, kb_type: KBType) -> str:
@@ -74,12 +93,35 @@ async def upload_knowledge(
     tags: str = Form(default="[]"), # JSON string
     db: AsyncSession = Depends(get_db)
 ):
-    """上传知识文件."""
+    """上传知识文件（同名同类型文件视为同一文档的新版本，按切片增量更新）."""
     try:
         tags_list = json.loads(tags)
     except:
         tags_list = []
 
+    # 同一逻辑文档 (filename + kb_type) 已存在时复用其记录
+    result = await db.execute(
+        select(KnowledgeFile)
+        .where(KnowledgeFile.filename == file.filename, KnowledgeFile.kb_type == kb_type)
+        .order_by(desc(KnowledgeFile.id))
+        .limit(1)
+    )
+    existing = result.scalar_one_or_none()
+    previous_status = None
+    if existing:
+        # 原子认领：并发的重复上传中只有一个能把记录从终态切换为 uploading 并递增版本号
+        previous_status = existing.status
+        claimed = await db.execute(
+            update(KnowledgeFile)
+            .where(KnowledgeFile.id == existing.id)
+            .where(KnowledgeFile.status.notin_([FileStatus.uploading, FileStatus.processing]))
+            .values(status=FileStatus.uploading, version=KnowledgeFile.version + 1)
+        )
+        await db.commit()
+        if claimed.rowcount != 1:
+            raise HTTPException(status_code=409, detail="File is still being processed")
+        await db.refresh(existing)
+
     # 1. 上传到 OSS
     oss = OSSService()
     file_content = await file.read()
@@ -95,21 +137,45 @@ async def upload_knowledge(
             category=f"knowledge/{kb_type.value}"
         )
     except Exception as e:
+        if existing:
+            # 释放认领，恢复为上一版本的状态
+            await db.execute(
+                update(KnowledgeFile)
+                .where(KnowledgeFile.id == existing.id)
+                .values(status=previous_status, version=KnowledgeFile.version - 1)
+            )
+            await db.commit()
         raise HTTPException(status_code=500, detail=f"OSS Upload Failed: {str(e)}")
 
-    # 2. 创建数据库记录
-    new_file = KnowledgeFile(
-        filename=file.filename,
-        object_key=upload_result["object_key"],
-        oss_url=upload_result["url"],
-        kb_type=kb_type,
-        tags=tags_list,
-        status=FileStatus.uploading
-    )
-    db.add(new_file)
+    # 2. 创建数据库记录；新版本沿用原记录 (doc_id 不变)，只有变化的切片需要重新向量化
+    previous_object_key = None
+    if existing:
+        previous_object_key = existing.object_key
+        new_file = existing
+        new_file.object_key = upload_result["object_key"]
+        new_file.oss_url = upload_result["url"]
+        new_file.tags = tags_list
+        new_file.error_msg = None
+    else:
+        new_file = KnowledgeFile(
+            filename=file.filename,
+            object_key=upload_result["object_key"],
+            oss_url=upload_result["url"],
+            kb_type=kb_type,
+            tags=tags_list,
+            status=FileStatus.uploading,
+            version=1
+        )
+        db.add(new_file)
     await db.commit()
     await db.refresh(new_file)
 
+    if previous_object_key and previous_object_key != new_file.object_key:
+        try:
+            oss.delete_file(previous_object_key)
+        except Exception as e:
+            print(f"Warning: Failed to delete previous OSS file: {e}")
+
     # 3. 触发后台处理任务
     service = KnowledgeService(db)
     background_tasks.add_task(service.process_file_background, new_file.id)
@@ -125,6 +191,7 @@ async def upload_knowledge(
         tags=new_file.tags,
         status=display_status,
         error_msg=new_file.error_msg,
+        version=new_file.version,
         created_at=new_file.created_at.isoformat()
     )
 
@@ -183,6 +250,7 @@ async def list_files(
             tags=f.tags,
             status=display_status,
             error_msg=f.error_msg,
+            version=f.version,
             created_at=f.created_at.isoformat()
         ))
     
@@ -210,16 +278,21 @@ async def delete_file(
     except Exception as e:
         print(f"Warning: Failed to delete OSS file: {e}")
 
-    # 2. 删除 Weaviate 向量
-    vector = VectorService()
+    # 2. 删除向量与关键词索引
     try:
-        vector.delete_by_doc_id(file_id)
+        await vector_service.delete_by_doc_id(file_id)
     except Exception as e:
         print(f"Warning: Failed to delete vectors: {e}")
+    try:
+        await keyword_index.delete_by_doc_id(file_id)
+    except Exception as e:
+        print(f"Warning: Failed to delete keyword index entries: {e}")
 
     # 3. 删除数据库记录
+    await db.execute(delete(KnowledgeChunk).where(KnowledgeChunk.file_id == file_id))
     await db.delete(file_record)
     await db.commit()
+    retrieval_service.invalidate()
     
     return {"message": "File deleted successfully"}
 
@@ -227,60 +300,40 @@ async def delete_file(
 async def search_knowledge(
     request: SearchRequest
 ):
-    """向量检索."""
-    # 1. 获取 Query Embedding
-    volc = VolcService()
+    """知识检索 (vector / keyword / hybrid)."""
     try:
-        embeddings = await volc.get_embeddings([request.query])
-        query_vector = embeddings[0]
+        return await retrieval_service.search(
+            query=request.query,
+            limit=request.limit,
+            kb_types=request.kb_types,
+            tags=request.tags,
+            mode=request.mode,
+            rerank=request.rerank
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Embedding Error: {str(e)}")
-        
-    # 2. 构建过滤条件
-    import weaviate.classes.query as wq
-    filters = None
-    
-    conditions = []
-    if request.kb_types:
-        # 知识库类型过滤 (OR)
-        kb_conditions = []
-        for kb in request.kb_types:
-            kb_conditions.append(wq.Filter.by_property("kb_type").equal(kb))
-        if len(kb_conditions) > 1:
-            conditions.append(wq.Filter.any_of(kb_conditions))
-        elif len(kb_conditions) == 1:
-            conditions.append(kb_conditions[0])
-            
-    if request.tags:
-        # 标签过滤 (OR - 只要包含任一标签即可，也可以根据需求改为 AND)
-        # Weaviate 数组包含检查
-        tag_conditions = []
-        for tag in request.tags:
-            # 注意：Weaviate 现在的 filter API 对 array 比较支持可能有限，
-            # 这里假设使用 text_array 类型的 contains_any
-            # 但 python client v4 语法可能不同，这里使用简单的 equal 尝试 (通常对 array 意味着 contains)
-            tag_conditions.append(wq.Filter.by_property("tags").contains_any([tag]))
-        
-        if len(tag_conditions) > 1:
-            conditions.append(wq.Filter.any_of(tag_conditions))
-        elif len(tag_conditions) == 1:
-            conditions.append(tag_conditions[0])
-    
-    if len(conditions) > 1:
-        filters = wq.Filter.all_of(conditions)
-    elif len(conditions) == 1:
-        filters = conditions[0]
+        raise HTTPException(status_code=500, detail=f"Search Error: {str(e)}")
 
-    # 3. 执行检索
-    vector = VectorService()
+@router.post("/search/batch", response_model=List[SearchBatchItem])
+async def search_knowledge_batch(
+    request: SearchBatchRequest
+):
+    """批量知识检索：所有查询一次向量化，共享过滤条件，结果与 queries 一一对应."""
+    if not request.queries:
+        return []
+    if len(request.queries) > settings.KNOWLEDGE_SEARCH_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many queries (max {settings.KNOWLEDGE_SEARCH_BATCH_MAX})"
+        )
     try:
-        results = vector.search(
-            query_vector=query_vector,
+        results = await retrieval_service.search_many(
+            queries=request.queries,
             limit=request.limit,
-            filters=filters
+            kb_types=request.kb_types,
+            tags=request.tags,
+            mode=request.mode,
+            rerank=request.rerank
         )
-        vector.close() # 记得关闭连接，或者使用单例模式管理连接
-        return results
     except Exception as e:
-        vector.close()
-        raise HTTPException(status_code=500, detail=f"Vector Search Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Search Error: {str(e)}")
+    return [{"query": q, "results": r} for q, r in zip(request.queries, results)]
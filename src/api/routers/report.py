@@ -6,8 +6,10 @@ from src.models.database import get_db
 from src.models.tables import Report, Session, User
 from src.api.dependencies import get_current_user
 from pydantic import BaseModel
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from datetime import datetime
+from src.services.report_worker import report_worker
+from src.config.settings import settings
 
 router = APIRouter()
 
@@ -29,6 +31,29 @@ class ReportListItem(BaseModel):
 class ReportListResponse(BaseModel):
     reports: List[ReportListItem]
 
+class ReportJobInfo(BaseModel):
+    status: str  # 'pending' | 'running' | 'completed' | 'failed'
+    progress: int
+    stage: Optional[str] = None
+    attempts: int
+    error: Optional[str] = None
+
+class ReportStatusResponse(BaseModel):
+    report_id: int
+    status: str  # 报告状态：'generating' | 'completed' | 'error'
+    job: Optional[ReportJobInfo] = None
+
+def job_info(job) -> Optional[Dict[str, Any]]:
+    if not job:
+        return None
+    return {
+        "status": job.status,
+        "progress": job.progress or 0,
+        "stage": job.stage,
+        "attempts": job.attempts or 0,
+        "error": job.error
+    }
+
 # ⚠️ 重要：具体路由必须在参数路由之前定义
 @router.get("/list", response_model=ReportListResponse)
 async def list_reports(
@@ -99,15 +124,45 @@ async def get_report(
         "created_at": report.created_at
     }
 
+@router.get("/{session_id}/status", response_model=ReportStatusResponse)
+async def get_report_status(
+    session_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """轻量级报告进度查询（不返回 HTML）"""
+    result = await db.execute(select(Session).where(Session.id == session_id))
+    session = result.scalar_one_or_none()
+    
+    if not session or session.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    report_result = await db.execute(select(Report).where(Report.session_id == session_id))
+    report = report_result.scalar_one_or_none()
+    
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    job = await report_worker.get_job(db, session_id)
+    return {
+        "report_id": report.id,
+        "status": report.content.get("status", "unknown"),
+        "job": job_info(job)
+    }
+
 @router.post("/{session_id}/generate")
 async def generate_report(
     session_id: int,
+    wait: bool = False,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """触发报告生成（如果尚未生成）"""
-    from src.services.business_service import business_service
-    
+    """
+    触发报告生成（如果尚未生成）
+    生成在后台任务中进行，接口立即返回；前端通过 GET /{session_id} 或 /{session_id}/status 轮询。
+    wait=true 时等待正在进行的生成完成（最长 REPORT_WAIT_TIMEOUT_SECONDS），
+    同一会话的并发请求共享同一次生成，不会重复调用 LLM。
+    """
     # 验证 session 归属
     result = await db.execute(select(Session).where(Session.id == session_id))
     session = result.scalar_one_or_none()
@@ -122,17 +177,28 @@ async def generate_report(
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
     
-    # 检查报告状态
+    # 生成失败的报告允许重试
+    if report.content.get("status") == "error":
+        report.content = {"status": "generating", "html": ""}
+        await db.commit()
+
+    job = await report_worker.get_job(db, session_id)
+    # 检查报告状态，提交后台任务（重复提交是幂等的）
     if report.content.get("status") == "generating":
-        # 调用生成逻辑
-        await business_service.generate_report_content(db, session_id)
+        await report_worker.enqueue(session_id)
+        job = await report_worker.get_job(db, session_id)
         await db.refresh(report)
+
+        if wait:
+            await report_worker.wait_for(session_id, settings.REPORT_WAIT_TIMEOUT_SECONDS)
+            await db.refresh(report)
+            job = await report_worker.get_job(db, session_id)
     
     return {
         "id": report.id,
         "score": report.score,
         "risk_level": report.risk_level,
         "content": report.content,
-        "created_at": report.created_at
+        "created_at": report.created_at,
+        "job": job_info(job)
     }
-
@@ -28,15 +28,146 @@ class Settings(BaseSettings):
     GEMINI_MODEL: str = "gemini-3-pro"
     GEMINI_TIMEOUT: int = 300
 
+    # LLM 截止时间 (秒，含重试)：low = 对话，high = 报告
+    GEMINI_DEADLINE_LOW: float = 60.0
+    GEMINI_DEADLINE_HIGH: float = 300.0
+    DEEP_SEEK_DEADLINE_LOW: float = 60.0
+    DEEP_SEEK_DEADLINE_HIGH: float = 300.0
+
+    # LLM 对冲请求 (Hedging)：主 provider 超过延迟阈值仍未返回时并行请求备用 provider
+    LLM_HEDGE_ENABLED: bool = True
+    LLM_HEDGE_PERCENTILE: float = 0.9  # 以主 provider 观测延迟的该分位作为阈值
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # 样本不足时使用下面的固定阈值
+    LLM_HEDGE_DELAY_LOW: float = 10.0
+    LLM_HEDGE_DELAY_HIGH: float = 90.0
+    LLM_HEDGE_MIN_DELAY_LOW: float = 3.0  # 观测分位数的下限，避免阈值过低导致大量对冲
+    LLM_HEDGE_MIN_DELAY_HIGH: float = 30.0
+
+    # LLM 熔断器 (Circuit Breaker)
+    LLM_BREAKER_WINDOW_SECONDS: float = 60.0  # 滚动统计窗口
+    LLM_BREAKER_MIN_REQUESTS: int = 5  # 窗口内请求数达到该值才评估
+    LLM_BREAKER_ERROR_RATE: float = 0.5
+    LLM_BREAKER_SLOW_RATE: float = 0.8
+    LLM_BREAKER_SLOW_CALL_LOW: float = 30.0  # 对话慢调用阈值 (秒)
+    LLM_BREAKER_SLOW_CALL_HIGH: float = 180.0  # 报告慢调用阈值 (秒)
+    LLM_BREAKER_OPEN_SECONDS: float = 30.0  # 打开后多久进入半开探测
+    LLM_BREAKER_HALF_OPEN_PROBES: int = 2
+
+    # LLM 出站并发控制：对话优先排队，报告生成单独限流
+    LLM_GEMINI_MAX_CONCURRENCY: int = 16
+    LLM_DEEPSEEK_MAX_CONCURRENCY: int = 16
+    LLM_REPORT_MAX_CONCURRENCY: int = 4  # 每个 provider 上报告生成的并发上限
+
+    # 共享 HTTP 连接池 (LLM / Embedding 等外部调用复用)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    HTTP_ENABLE_HTTP2: bool = False  # 需要安装 h2
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    HTTP_DEFAULT_TIMEOUT: float = 60.0
+
+    # 对话上下文窗口 (不含系统提示词的 token 预算)
+    CHAT_CONTEXT_MAX_TOKENS: int = 3000
+    CHAT_CONTEXT_RECENT_TURNS: int = 6  # 原文保留的最近用户轮数
+    CHAT_CONTEXT_SUMMARY_MAX_TOKENS: int = 800  # 较早对话摘要的 token 上限
+    CHAT_CONTEXT_FOLD_TURNS: int = 3  # 窗口超出该轮数后才批量折叠，保持前缀缓存稳定
+
+    # 报告生成后台任务
+    REPORT_WORKER_COUNT: int = 2  # 每个进程的 worker 数
+    REPORT_WORKER_POLL_SECONDS: float = 5.0
+    REPORT_JOB_HEARTBEAT_SECONDS: float = 15.0
+    REPORT_JOB_STALE_SECONDS: float = 120.0  # 心跳超时后视为 worker 崩溃
+    REPORT_JOB_MAX_ATTEMPTS: int = 2
+    REPORT_WAIT_TIMEOUT_SECONDS: float = 60.0  # POST /generate?wait=true 的最长等待时间
+    # 推测式报告生成：最后一题发出时预热报告输入，最后一个回答到达时在同一请求内立即开始生成
+    REPORT_SPECULATIVE_ENABLED: bool = False
+    REPORT_SPECULATIVE_CACHE_SIZE: int = 1000  # 预热缓存的最大会话数
+
     # Volcengine (火山引擎)
     # 优先匹配 ARK_API_KEY
     VOLC_API_KEY: Optional[str] = Field(default=None, validation_alias="ARK_API_KEY")
     VOLC_EMBEDDING_MODEL: str = "ep-m-20251125184146-lsgvz"
     VOLC_API_BASE: str = "https://ark.cn-beijing.volces.com/api/v3"
 
+    # 向量化后端: volc (远程 API) / hashing (确定性哈希向量，离线测试) / sentence_transformers (本地模型)
+    # 注意：不同后端的向量维度不同，切换后需要重建向量库
+    EMBEDDING_BACKEND: str = "volc"
+    EMBEDDING_LOCAL_MODEL: str = "BAAI/bge-small-zh-v1.5"
+    EMBEDDING_HASHING_DIM: int = 1024
+    EMBEDDING_LOCAL_THREADS: int = 2  # 本地推理线程数
+    EMBEDDING_LOCAL_BATCH_SIZE: int = 64
+
+    # Embedding 缓存 (内存 LRU + SQLite 持久化)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: Path = BASE_DIR / "data" / "embedding_cache.db"
+    EMBEDDING_CACHE_MEMORY_SIZE: int = 20000  # 内存中缓存的向量条数
+
+    # 入库向量化调度 (并发批次 + 自适应批大小)
+    EMBEDDING_MAX_IN_FLIGHT: int = 4  # 同时在途的批次数
+    EMBEDDING_BATCH_SIZE: int = 16  # 初始批大小
+    EMBEDDING_MAX_BATCH_SIZE: int = 64
+    EMBEDDING_MAX_BATCH_TOKENS: int = 8000  # 单批 token 上限
+    EMBEDDING_TARGET_BATCH_SECONDS: float = 2.0  # 单批目标延迟
+    EMBEDDING_MAX_RETRIES: int = 3
+
+    # 流式入库流水线 (解析 -> 切片 -> 向量化 -> 写入，阶段间有界队列)
+    INGEST_QUEUE_SIZE: int = 4  # 阶段间队列长度（背压）
+    INGEST_GROUP_SIZE: int = 64  # 每组切片数（向量化与写入的单位）
+    INGEST_CHUNK_SIZE: int = 500
+    INGEST_CHUNK_OVERLAP: int = 50
+    INGEST_DOWNLOAD_CHUNK_BYTES: int = 1024 * 1024
+
+    # 文档解析进程池（避免 pypdf 等纯 Python 解析阻塞事件循环）
+    PARSE_WORKERS: int = 2  # 0 表示不启用进程池，在线程中解析
+    PARSE_TIMEOUT_SECONDS: float = 300  # 单个文件的解析超时
+    PARSE_PDF_SHARD_PAGES: int = 20  # 大 PDF 每个分片的页数
+
+    # 检索查询向量微批 (合并并发的单条查询)
+    EMBEDDING_QUERY_BATCH_WINDOW_MS: float = 5.0  # 收集窗口
+    EMBEDDING_QUERY_MAX_BATCH: int = 32  # 攒满即发送
+
+    # 向量库后端: weaviate / local (进程内 NumPy 索引，memmap 持久化，无需外部服务)
+    VECTOR_BACKEND: str = "weaviate"
+    LOCAL_VECTOR_PATH: Path = BASE_DIR / "data" / "vectors"
+    LOCAL_VECTOR_DTYPE: str = "float32"  # float32 / float16 / int8
+    LOCAL_VECTOR_INDEX: str = "flat"  # flat (精确) / ivf (近似)
+    LOCAL_VECTOR_IVF_NLIST: int = 0  # 簇数，0 表示按 4*sqrt(N) 自动选择
+    LOCAL_VECTOR_IVF_NPROBE: int = 8  # 检索时探查的簇数，越大召回越高、越慢
+    LOCAL_VECTOR_IVF_MIN_ROWS: int = 10000  # 少于该行数时直接精确检索
+
+    # 关键词检索 (BM25) 与混合检索
+    KEYWORD_INDEX_PATH: Path = BASE_DIR / "data" / "keyword_index.db"
+    HYBRID_CANDIDATE_MULTIPLIER: int = 4  # 混合检索每一路取 limit * N 个候选
+    HYBRID_RRF_K: int = 60
+    KNOWLEDGE_SEARCH_BATCH_MAX: int = 32  # 批量检索单次最多查询数
+
+    # 检索重排序 (两阶段检索): lexical (词面重合度，离线默认) / cross_encoder (本地模型)
+    RERANK_BACKEND: str = "lexical"
+    RERANK_MODEL: str = "BAAI/bge-reranker-base"
+    RERANK_CANDIDATES: int = 50  # 一阶段候选数
+    RERANK_TIMEOUT_MS: float = 300  # 超时则按一阶段顺序返回
+    RERANK_BATCH_SIZE: int = 32
+    RERANK_THREADS: int = 2
+    RERANK_MAX_PENDING: int = 4  # 未完成的打分（含超时放弃仍在执行的）达到该数时跳过重排
+
+    # 检索结果缓存 (TTL + LRU，知识库变更时通过版本号失效)
+    RETRIEVAL_CACHE_ENABLED: bool = True
+    RETRIEVAL_CACHE_SIZE: int = 2000
+    RETRIEVAL_CACHE_TTL_SECONDS: float = 600
+    KNOWLEDGE_GENERATION_PATH: Path = BASE_DIR / "data" / "knowledge_generation"
+
+    # 会话级 RAG：赛道锁定后检索各知识库内容，注入报告输入
+    RAG_ENABLED: bool = True
+    RAG_CHUNKS_PER_TYPE: int = 3  # 每种知识库类型检索的切片数
+    RAG_CONTEXT_MAX_TOKENS: int = 1500  # 注入报告的知识片段 token 预算
+    RAG_SEARCH_MODE: str = "hybrid"
+    RAG_RERANK: bool = True
+    RAG_QUERY_ANSWERS: int = 5  # 查询中包含最近几条问卷回答
+
     # Weaviate
     WEAVIATE_URL: str = "http://localhost:8080"
     WEAVIATE_API_KEY: Optional[str] = None
+    WEAVIATE_MAX_WORKERS: int = 8  # 同步客户端调用的线程池大小
 
     # Aliyun OSS
     OSS_ACCESS_KEY_ID: Optional[str] = None
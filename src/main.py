@@ -1,11 +1,42 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from src.config.settings import settings
 from src.api.routers import auth, chat, report, admin, knowledge
+from src.services.http_client import http_client
+from src.services.report_worker import report_worker
+from src.services.embedding_cache import embedding_cache
+from src.services import embedding_providers
+from src.services.vector_service import vector_service
+from src.services.keyword_index import keyword_index
+from src.services.reranker import rerank_service
+from src.services.parse_pool import parse_pool
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动：创建共享连接池与 Weaviate 连接，启动报告生成 worker
+    await http_client.start()
+    await vector_service.start()
+    await keyword_index.start()
+    await embedding_providers.start_provider()
+    await rerank_service.start()
+    await report_worker.start()
+    parse_pool.start()
+    yield
+    # 关闭：先停止 worker，再释放连接
+    await report_worker.stop()
+    parse_pool.close()
+    await http_client.close()
+    await vector_service.close()
+    embedding_cache.close()
+    keyword_index.close()
+    rerank_service.close()
+    embedding_providers.shutdown_executor()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # CORS
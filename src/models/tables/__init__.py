@@ -1,3 +1,4 @@
 from .user import User
 from .chat import Session, Message, Report
-from .knowledge import KnowledgeFile
+from .knowledge import KnowledgeFile, KnowledgeChunk
+from .report_job import ReportJob
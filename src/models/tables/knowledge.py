@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.sql import func
 from src.models.database import Base
 import enum
@@ -25,6 +25,17 @@ class KnowledgeFile(Base):
     tags = Column(JSON, default=[])  # Store as JSON array
     status = Column(SQLEnum(FileStatus), default=FileStatus.uploading)
     error_msg = Column(String, nullable=True)
+    # 同一逻辑文档 (filename + kb_type) 重新上传时复用记录并递增版本号
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+class KnowledgeChunk(Base):
+    """已入库切片的内容哈希，重新上传时据此只处理新增/消失的切片"""
+    __tablename__ = "knowledge_chunks"
+    __table_args__ = (UniqueConstraint("file_id", "chunk_hash"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, ForeignKey("knowledge_files.id"), nullable=False, index=True)
+    chunk_hash = Column(String(64), nullable=False)
+
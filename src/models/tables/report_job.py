@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, func
+from src.models.database import Base
+
+class ReportJob(Base):
+    __tablename__ = "report_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # 每个会话只有一个报告任务，唯一约束保证重复入队不会产生多条任务
+    session_id = Column(Integer, ForeignKey("sessions.id"), unique=True, index=True)
+    # status: 'pending', 'running', 'completed', 'failed'
+    status = Column(String, default="pending", index=True)
+    progress = Column(Integer, default=0)  # 0-100
+    stage = Column(String, nullable=True)  # 当前阶段描述
+    attempts = Column(Integer, default=0)
+    # 认领该任务的 worker（进程级标识），用于行级认领与崩溃恢复
+    worker_id = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
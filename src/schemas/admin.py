@@ -56,3 +56,94 @@ class RecordDetailResponse(BaseModel):
     report_html: str # HTML 报告快照
     created_at: datetime
 
+
+
+# --- LLM 服务运维相关 ---
+
+class LatencyStats(BaseModel):
+    count: int
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p99: Optional[float] = None
+
+class AdmissionStats(BaseModel):
+    max_concurrency: int
+    class_limits: Dict[str, int]
+    in_flight: Dict[str, int]  # 按类别 ("chat" / "report") 统计
+    queued: Dict[str, int]
+    admitted: Dict[str, int]
+    wait: Dict[str, LatencyStats]  # 排队等待时间 (秒)
+
+class TokenUsage(BaseModel):
+    requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int  # 命中 provider 前缀缓存的输入 token
+    cache_hit_ratio: float
+
+class ProviderHealth(BaseModel):
+    provider: str
+    state: str  # "closed" | "open" | "half_open"
+    requests: int
+    error_rate: float
+    slow_rate: float
+    avg_latency: Optional[float] = None
+    health_score: float
+    retry_in_seconds: Optional[float] = None
+    last_error: Optional[str] = None
+    latency: Dict[str, LatencyStats]
+    admission: AdmissionStats
+    usage: TokenUsage
+
+class LLMHealthResponse(BaseModel):
+    providers: List[ProviderHealth]
+
+
+# --- Embedding 缓存相关 ---
+
+class EmbeddingCacheStats(BaseModel):
+    memory_entries: int
+    memory_hits: int
+    disk_hits: int
+    misses: int
+    hit_ratio: float
+
+
+# --- 向量库相关 ---
+
+class VectorStoreHealth(BaseModel):
+    connected: bool
+    ready: bool
+    reconnects: int
+
+
+# --- 检索缓存相关 ---
+
+class RetrievalCacheStats(BaseModel):
+    entries: int
+    hits: int
+    misses: int
+    hit_ratio: float
+    hit_latency: LatencyStats
+    miss_latency: LatencyStats
+    estimated_seconds_saved: Optional[float] = None  # (未命中 p50 - 命中 p50) * 命中次数
+
+
+# --- 文档解析相关 ---
+
+class DocumentParseStats(BaseModel):
+    filename: str
+    status: str  # completed / timeout / failed / cancelled
+    pages: Optional[int] = None
+    shards: int
+    cpu_seconds: float  # 解析进程中累计的 CPU 时间
+    wall_seconds: float
+
+class DocumentParserStats(BaseModel):
+    workers: int
+    running: bool
+    documents: int
+    timeouts: int
+    failures: int
+    cpu_seconds: float
+    recent: List[DocumentParseStats]
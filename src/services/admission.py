@@ -0,0 +1,102 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from src.utils.metrics import LatencyTracker
+
+# 优先级：数值越小越优先；交互式对话优先于报告生成
+PRIORITIES = {"chat": 0, "report": 1}
+
+class AdmissionController:
+    """
+    单个 provider 的出站并发控制
+    - max_concurrency: provider 总并发预算
+    - class_limits: 按请求类别的并发上限（如限制报告生成，给对话保留名额）
+    - 名额不足时按优先级排队，同优先级先到先得
+    """
+
+    def __init__(self, name: str, max_concurrency: int, class_limits: Optional[Dict[str, int]] = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.class_limits = class_limits or {}
+
+        self._in_flight: Dict[str, int] = {cls: 0 for cls in PRIORITIES}
+        # (priority, seq, request_class, future)
+        self._queue: List[Tuple[int, int, str, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+        self._admitted: Dict[str, int] = {cls: 0 for cls in PRIORITIES}
+        self._wait: Dict[str, LatencyTracker] = {cls: LatencyTracker() for cls in PRIORITIES}
+
+    @asynccontextmanager
+    async def slot(self, request_class: str) -> AsyncIterator[None]:
+        """获取一个并发名额，退出时归还"""
+        await self.acquire(request_class)
+        try:
+            yield
+        finally:
+            self.release(request_class)
+
+    async def acquire(self, request_class: str):
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (PRIORITIES[request_class], next(self._seq), request_class, future))
+        # 有空闲名额时立即放行（future 已完成，await 不会挂起）
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名额已分配但调用方被取消，归还名额
+                self.release(request_class)
+            else:
+                future.cancel()
+                self._dispatch()
+            raise
+        self._wait[request_class].record(time.monotonic() - start)
+
+    def release(self, request_class: str):
+        self._in_flight[request_class] = max(0, self._in_flight[request_class] - 1)
+        self._dispatch()
+
+    def snapshot(self) -> Dict[str, Any]:
+        queued = {cls: 0 for cls in PRIORITIES}
+        for _, _, cls, future in self._queue:
+            if not future.done():
+                queued[cls] += 1
+        return {
+            "max_concurrency": self.max_concurrency,
+            "class_limits": dict(self.class_limits),
+            "in_flight": dict(self._in_flight),
+            "queued": queued,
+            "admitted": dict(self._admitted),
+            "wait": {cls: tracker.snapshot() for cls, tracker in self._wait.items()},
+        }
+
+    def _can_admit(self, request_class: str) -> bool:
+        if sum(self._in_flight.values()) >= self.max_concurrency:
+            return False
+        limit = self.class_limits.get(request_class)
+        return limit is None or self._in_flight[request_class] < limit
+
+    def _admit(self, request_class: str):
+        self._in_flight[request_class] += 1
+        self._admitted[request_class] += 1
+
+    def _dispatch(self):
+        """按优先级唤醒可放行的等待者；被类别上限挡住的等待者保留在队列中"""
+        blocked = []
+        while self._queue and sum(self._in_flight.values()) < self.max_concurrency:
+            item = heapq.heappop(self._queue)
+            _, _, request_class, future = item
+            if future.done():
+                continue
+            if not self._can_admit(request_class):
+                blocked.append(item)
+                continue
+            self._admit(request_class)
+            future.set_result(None)
+        for item in blocked:
+            heapq.heappush(self._queue, item)
@@ -1,12 +1,25 @@
 import re
-import json
+import asyncio
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Optional, Set, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from src.config.settings import settings
+from src.models.database import AsyncSessionLocal
 from src.models.tables import Session, Message, Report
 from src.services.llm_service import llm_service
-from src.services.prompts import PHASE_0_CHECK, REPORT_GENERATION
+from src.services.context_service import context_service
+from src.services.knowledge_context_service import knowledge_context_service
+from src.services.report_worker import report_worker
+from src.services.prompts import PHASE_0_CHECK, REPORT_GENERATION, REPORT_INPUT
 
 class BusinessService:
+    def __init__(self):
+        # 推测式预热：最后一题发出时预先序列化的报告输入 {session_id: {...}}
+        self._report_prep: "OrderedDict[int, dict]" = OrderedDict()
+        # 持有后台预热任务的引用，避免被垃圾回收
+        self._background: Set[asyncio.Task] = set()
+
     async def create_session(self, db: AsyncSession, user_id: int) -> Session:
         session = Session(user_id=user_id, status="active", meta_data={})
         db.add(session)
@@ -28,6 +41,62 @@ class BusinessService:
                 "report_data": dict | None
             }
         """
+        session, report_result = await self._begin_chat_turn(db, session_id, user_input)
+        if report_result:
+            return report_result
+
+        # --- 普通/问卷生成阶段 ---
+        api_messages = await context_service.build_messages(db, session)
+
+        # 调用 LLM (对话阶段使用低思考模式)
+        response_text = await llm_service.chat_completion(
+            messages=api_messages,
+            system_prompt=PHASE_0_CHECK,
+            thinking_level="low"
+        )
+
+        return await self._complete_chat_turn(db, session, response_text)
+
+    async def process_chat_stream(
+        self, db: AsyncSession, session_id: int, user_input: str
+    ) -> AsyncIterator[dict]:
+        """
+        流式处理聊天逻辑
+        Yields:
+            {"type": "delta", "content": str}  # 给用户的回复片段（已剔除思维链）
+            {"type": "done", ...}              # 与 process_chat 返回值相同的最终结果
+        """
+        session, report_result = await self._begin_chat_turn(db, session_id, user_input)
+        if report_result:
+            yield {"type": "done", **report_result}
+            return
+
+        api_messages = await context_service.build_messages(db, session)
+
+        splitter = _ReplyStreamSplitter()
+        pieces = []
+        async for piece in llm_service.chat_completion_stream(
+            messages=api_messages,
+            system_prompt=PHASE_0_CHECK,
+            thinking_level="low"
+        ):
+            pieces.append(piece)
+            visible = splitter.feed(piece)
+            if visible:
+                yield {"type": "delta", "content": visible}
+
+        response_text = "".join(pieces).strip()
+        result = await self._complete_chat_turn(db, session, response_text)
+        yield {"type": "done", **result}
+
+    async def _begin_chat_turn(
+        self, db: AsyncSession, session_id: int, user_input: str
+    ) -> Tuple[Session, Optional[dict]]:
+        """
+        保存用户消息并推进问卷计数
+        Returns:
+            (session, report_result) —— 若所有问题已回答完毕，report_result 为进入报告阶段的返回值
+        """
         session = await self.get_session(db, session_id)
         if not session:
             raise ValueError("Session not found")
@@ -52,6 +121,9 @@ class BusinessService:
             # 立即更新到 session (先不 commit)
             meta = dict(session.meta_data) if session.meta_data else {}
             meta["answered_count"] = answered_count
+            # 保留最近的回答文本，用于构造知识检索查询
+            answers = meta.get("answers", []) + [user_input.strip()[:200]]
+            meta["answers"] = answers[-settings.RAG_QUERY_ANSWERS:]
             session.meta_data = meta
             print(f"DEBUG: Updated answered_count to {answered_count}")
         
@@ -71,13 +143,107 @@ class BusinessService:
         
         print(f"DEBUG: Should generate? {should_generate_report} (Existing: {bool(existing_report)})")
         
-        if should_generate_report:
-            # --- 生成报告阶段 ---
-            
-            # 1. 准备结束语（固定格式，不调用LLM）
-            thank_you_msg = "收到！您的答案我们已记录。正在为您生成健康报告..."
+        if not should_generate_report:
+            return session, None
+
+        # --- 生成报告阶段 ---
+
+        # 1. 准备结束语（固定格式，不调用LLM）
+        thank_you_msg = "收到！您的答案我们已记录。正在为您生成健康报告..."
+        
+        # 2. 创建空的报告记录（status = "generating"）
+        new_report = Report(
+            session_id=session_id,
+            score=0,  # 初始值
+            risk_level="生成中",  # 初始值
+            content={"status": "generating", "html": ""}
+        )
+        db.add(new_report)
+        
+        # 3. 更新会话状态
+        session.status = "generating_report"
+        
+        # 4. 保存 AI 的感谢语消息
+        ai_msg = Message(session_id=session_id, role="assistant", content=thank_you_msg)
+        db.add(ai_msg)
+        
+        await db.commit()
+        await db.refresh(new_report)  # 获取 report ID
+        report_data = {"id": new_report.id, "status": "generating"}
+
+        # 5. 提交后台生成任务（推测模式下在本请求内立即开始生成）
+        await report_worker.enqueue(session_id)
+        if settings.REPORT_SPECULATIVE_ENABLED:
+            await report_worker.start_now(session_id)
+        
+        # 6. 立即返回，让前端跳转
+        return session, {
+            "response": thank_you_msg,
+            "action": "report",
+            "report_data": report_data
+        }
+
+    async def _complete_chat_turn(self, db: AsyncSession, session: Session, response_text: str) -> dict:
+        """解析 LLM 完整回复：更新赛道/问题计数，保存 AI 消息"""
+        session_id = session.id
+
+        # 解析思维链
+        ai_thinking = ""
+        user_reply = response_text
+        
+        if "【给用户的回复】" in response_text:
+            parts = response_text.split("【给用户的回复】")
+            ai_thinking = parts[0]
+            user_reply = parts[1].strip()
+        
+        # 更新 session metadata
+        meta = dict(session.meta_data) if session.meta_data else {}
+        
+        # 提取关键槽位（用于上下文窗口的固定信息与报告生成）
+        profile_match = re.search(r"用户画像[:：]\s*(.+)", ai_thinking)
+        if profile_match:
+            meta["profile"] = profile_match.group(1).strip()
+        if not meta.get("user_info"):
+            complaint_match = re.search(r"用户主诉[:：]\s*(.+)", ai_thinking)
+            if complaint_match:
+                meta["user_info"] = complaint_match.group(1).strip()
+
+        # 检查是否锁定赛道
+        previous_track = meta.get("track")
+        track_match = re.search(r"锁定赛道[:：]\s*(.+)", ai_thinking)
+        if track_match:
+            track = track_match.group(1).strip()
+            meta["track"] = track
+        
+        # 提取问题总数（仅在首次设置）
+        if "question_count" not in meta or meta["question_count"] == 0:
+            question_count_match = re.search(r"总问题数[:：]\s*(\d+)", ai_thinking)
+            if question_count_match:
+                meta["question_count"] = int(question_count_match.group(1))
+                # 初始化 answered_count 为 0（还没开始回答）
+                if "answered_count" not in meta:
+                    meta["answered_count"] = 0
+        
+        # 检测是否发送了问题（通过检测当前问题编号）
+        current_question_match = re.search(r"当前问题编号[:：]\s*(\d+)", ai_thinking)
+        if current_question_match:
+            # 说明 AI 刚发送了一个问题，标记状态
+            meta["last_question_sent"] = True
+        
+        # 保存 metadata
+        if meta != session.meta_data:
+            session.meta_data = meta
+            db.add(session)
+        
+        # 格式化AI回复
+        formatted_reply = self._format_question(user_reply)
+        
+        # 关键修复：检测 AI 是否自行结束了对话（即使状态机认为还没结束）
+        # 如果 AI 回复中包含结束语，强制进入报告生成流程
+        if "生成健康报告" in formatted_reply or "正在为您生成" in formatted_reply:
+            print(f"DEBUG: AI triggered completion. Text: {formatted_reply[:30]}...")
             
-            # 2. 创建空的报告记录（status = "generating"）
+            # 1. 创建空的报告记录（status = "generating"）
             new_report = Report(
                 session_id=session_id,
                 score=0,  # 初始值
@@ -86,122 +252,56 @@ class BusinessService:
             )
             db.add(new_report)
             
-            # 3. 更新会话状态
+            # 2. 更新会话状态
             session.status = "generating_report"
             
-            # 4. 保存 AI 的感谢语消息
-            ai_msg = Message(session_id=session_id, role="assistant", content=thank_you_msg)
+            # 3. 保存 AI 的消息
+            ai_msg = Message(session_id=session_id, role="assistant", content=formatted_reply)
             db.add(ai_msg)
             
             await db.commit()
-            await db.refresh(new_report)  # 获取 report ID
-            
-            # 5. 立即返回，让前端跳转
-            return {
-                "response": thank_you_msg,
-                "action": "report",
-                "report_data": {"id": new_report.id, "status": "generating"}
-            }
+            await db.refresh(new_report)
+            report_data = {"id": new_report.id, "status": "generating"}
 
-        else:
-            # --- 普通/问卷生成阶段 ---
-            db_messages = await db.execute(
-                select(Message).where(Message.session_id == session_id).order_by(Message.created_at)
-            )
-            history_msgs = db_messages.scalars().all()
-            
-            api_messages = []
-            for msg in history_msgs:
-                api_messages.append({"role": msg.role, "content": msg.content})
-            
-            # 调用 LLM (对话阶段使用低思考模式)
-            response_text = await llm_service.chat_completion(
-                messages=api_messages,
-                system_prompt=PHASE_0_CHECK,
-                thinking_level="low"
-            )
-            
-            # 解析思维链
-            ai_thinking = ""
-            user_reply = response_text
-            
-            if "【给用户的回复】" in response_text:
-                parts = response_text.split("【给用户的回复】")
-                ai_thinking = parts[0]
-                user_reply = parts[1].strip()
-            
-            # 更新 session metadata
-            meta = dict(session.meta_data) if session.meta_data else {}
-            
-            # 检查是否锁定赛道
-            track_match = re.search(r"锁定赛道[:：]\s*(.+)", ai_thinking)
-            if track_match:
-                track = track_match.group(1).strip()
-                meta["track"] = track
-            
-            # 提取问题总数（仅在首次设置）
-            if "question_count" not in meta or meta["question_count"] == 0:
-                question_count_match = re.search(r"总问题数[:：]\s*(\d+)", ai_thinking)
-                if question_count_match:
-                    meta["question_count"] = int(question_count_match.group(1))
-                    # 初始化 answered_count 为 0（还没开始回答）
-                    if "answered_count" not in meta:
-                        meta["answered_count"] = 0
-            
-            # 检测是否发送了问题（通过检测当前问题编号）
-            current_question_match = re.search(r"当前问题编号[:：]\s*(\d+)", ai_thinking)
-            if current_question_match:
-                # 说明 AI 刚发送了一个问题，标记状态
-                meta["last_question_sent"] = True
-            
-            # 保存 metadata
-            if meta != session.meta_data:
-                session.meta_data = meta
-                db.add(session)
-            
-            # 格式化AI回复
-            formatted_reply = self._format_question(user_reply)
-            
-            # 关键修复：检测 AI 是否自行结束了对话（即使状态机认为还没结束）
-            # 如果 AI 回复中包含结束语，强制进入报告生成流程
-            if "生成健康报告" in formatted_reply or "正在为您生成" in formatted_reply:
-                print(f"DEBUG: AI triggered completion. Text: {formatted_reply[:30]}...")
-                
-                # 1. 创建空的报告记录（status = "generating"）
-                new_report = Report(
-                    session_id=session_id,
-                    score=0,  # 初始值
-                    risk_level="生成中",  # 初始值
-                    content={"status": "generating", "html": ""}
-                )
-                db.add(new_report)
-                
-                # 2. 更新会话状态
-                session.status = "generating_report"
-                
-                # 3. 保存 AI 的消息
-                ai_msg = Message(session_id=session_id, role="assistant", content=formatted_reply)
-                db.add(ai_msg)
-                
-                await db.commit()
-                await db.refresh(new_report)
-                
-                return {
-                    "response": formatted_reply,
-                    "action": "report",
-                    "report_data": {"id": new_report.id, "status": "generating"}
-                }
-            
-            # 保存AI回复
-            ai_msg = Message(session_id=session_id, role="assistant", content=formatted_reply)
-            db.add(ai_msg)
-            await db.commit()
+            # 4. 提交后台生成任务（推测模式下在本请求内立即开始生成）
+            await report_worker.enqueue(session_id)
+            if settings.REPORT_SPECULATIVE_ENABLED:
+                await report_worker.start_now(session_id)
             
             return {
                 "response": formatted_reply,
-                "action": "chat",
-                "report_data": None
+                "action": "report",
+                "report_data": report_data
             }
+        
+        # 保存AI回复
+        ai_msg = Message(session_id=session_id, role="assistant", content=formatted_reply)
+        db.add(ai_msg)
+        await db.commit()
+
+        # 赛道刚锁定：后台预取知识库上下文，报告生成时只需增量刷新
+        if meta.get("track") and meta.get("track") != previous_track:
+            self._spawn(knowledge_context_service.warm(session_id))
+
+        # 推测模式：最后一题已发出，提前在后台预热报告输入，用户回答后即可直接开始生成
+        if (
+            settings.REPORT_SPECULATIVE_ENABLED
+            and current_question_match
+            and meta.get("question_count")
+            and int(current_question_match.group(1)) >= meta["question_count"]
+        ):
+            self._spawn(self._warm_report_inputs(session_id))
+        
+        return {
+            "response": formatted_reply,
+            "action": "chat",
+            "report_data": None
+        }
+
+    def _spawn(self, coro: Awaitable[None]):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
 
     def _format_question(self, response_text: str) -> str:
         """
@@ -220,14 +320,57 @@ class BusinessService:
         return formatted.strip()
 
     async def _get_chat_history(self, db, session_id) -> str:
-        result = await db.execute(
-            select(Message).where(Message.session_id == session_id).order_by(Message.created_at)
-        )
+        # 若已预热，只需追加预热之后的新消息
+        prep = self._report_prep.pop(session_id, None)
+        query = select(Message).where(Message.session_id == session_id)
+        if prep:
+            query = query.where(Message.id > prep["upto"])
+        result = await db.execute(query.order_by(Message.created_at))
         msgs = result.scalars().all()
-        return "\n".join([f"{m.role}: {m.content}" for m in msgs])
+        lines = [f"{m.role}: {m.content}" for m in msgs]
+        if prep:
+            lines = prep["lines"] + lines
+        return "\n".join(lines)
+
+    async def _warm_report_inputs(self, session_id: int):
+        """
+        推测式预热：最后一题发出时预先加载并序列化对话历史，并刷新知识库上下文
+        使用独立的数据库会话，不增加当前请求的延迟。
+        """
+        await knowledge_context_service.warm(session_id)
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(Message).where(Message.session_id == session_id).order_by(Message.created_at)
+                )
+                msgs = result.scalars().all()
+            if not msgs:
+                return
+            self._report_prep[session_id] = {
+                "lines": [f"{m.role}: {m.content}" for m in msgs],
+                "upto": max(m.id for m in msgs)
+            }
+            self._report_prep.move_to_end(session_id)
+            while len(self._report_prep) > settings.REPORT_SPECULATIVE_CACHE_SIZE:
+                self._report_prep.popitem(last=False)
+        except Exception as e:
+            print(f"Warning: Failed to warm report inputs for session {session_id}: {e}")
+
+    async def generate_report_content(
+        self,
+        db: AsyncSession,
+        session_id: int,
+        on_progress: Optional[Callable[[int, str], Awaitable[None]]] = None
+    ):
+        """
+        生成报告内容（LLM调用）
+        由报告任务池调用；同一会话只会被一个 worker 执行（report_jobs 的行级认领保证，包括进程内）。
+        on_progress: 可选的进度回调 (progress 0-100, stage)，由后台任务用于上报进度
+        """
+        async def progress(value: int, stage: str):
+            if on_progress:
+                await on_progress(value, stage)
 
-    async def generate_report_content(self, db: AsyncSession, session_id: int):
-        """生成报告内容（LLM调用）"""
         # 获取 session 和 report
         session = await self.get_session(db, session_id)
         if not session:
@@ -245,24 +388,37 @@ class BusinessService:
             return  # 已生成，无需重复
         
         try:
-            # 获取历史消息
-            history = await self._get_chat_history(db, session_id)
+            # 获取历史消息，同时（并发）增量刷新知识库上下文；后者不访问数据库
+            await progress(10, "整理问卷答案")
+            history, (knowledge, rag) = await asyncio.gather(
+                self._get_chat_history(db, session_id),
+                knowledge_context_service.get_context(session.meta_data or {})
+            )
             current_track = session.meta_data.get("track", "未知")
+            if rag != session.meta_data.get("rag"):
+                meta = dict(session.meta_data)
+                meta["rag"] = rag
+                session.meta_data = meta
             
             # 调用 LLM 生成报告
-            report_prompt = REPORT_GENERATION.format(
+            # 静态指令作为系统提示词（稳定前缀，可命中 provider 前缀缓存），用户数据追加在其后
+            report_input = REPORT_INPUT.format(
                 user_info=session.meta_data.get("user_info", "未提取"),
                 track=current_track,
-                qa_pairs=f"Full Context: {history}"
+                qa_pairs=f"Full Context: {history}",
+                knowledge=knowledge or "无"
             )
             
             # 调用 LLM 生成报告 (报告阶段使用高思考模式)
+            await progress(30, "AI 分析中")
             raw_report = await llm_service.chat_completion(
-                messages=[{"role": "user", "content": "请生成HTML报告"}],
-                system_prompt=report_prompt,
+                messages=[{"role": "user", "content": report_input}],
+                system_prompt=REPORT_GENERATION,
                 thinking_level="high"
             )
             
+            await progress(90, "排版报告")
+
             # 清理 Markdown 标记
             clean_report = re.sub(r"```html\s*|\s*```", "", raw_report).strip()
             
@@ -297,4 +453,34 @@ class BusinessService:
             await db.commit()
             raise
 
+class _ReplyStreamSplitter:
+    """
+    流式拆分 LLM 输出：缓冲【给用户的回复】之前的思维链，只转发其后的内容
+    若整段回复都没有分隔标记，最终结果以 done 事件中的完整回复为准。
+    """
+    MARKER = "【给用户的回复】"
+
+    def __init__(self):
+        self._buffer = ""
+        self._passthrough = False
+        self._started = False
+
+    def feed(self, piece: str) -> str:
+        if not self._passthrough:
+            self._buffer += piece
+            idx = self._buffer.find(self.MARKER)
+            if idx == -1:
+                return ""
+            self._passthrough = True
+            piece = self._buffer[idx + len(self.MARKER):]
+            self._buffer = ""
+
+        if not self._started:
+            # 与非流式路径的 strip() 保持一致
+            piece = piece.lstrip()
+            if not piece:
+                return ""
+            self._started = True
+        return piece
+
 business_service = BusinessService()
@@ -0,0 +1,168 @@
+import enum
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+class CircuitState(str, enum.Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+class CircuitBreaker:
+    """
+    单个 provider 的熔断器
+    - closed: 正常放行，按滚动时间窗口统计错误率与慢调用率
+    - open: 直接拒绝，open_seconds 后进入 half_open
+    - half_open: 仅放行少量探测请求，全部成功则恢复 closed，任一失败重新 open
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = 60.0,
+        min_requests: int = 5,
+        error_rate_threshold: float = 0.5,
+        slow_rate_threshold: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_probes: int = 2
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_rate_threshold = slow_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        # (timestamp, ok, slow, latency)
+        self._events: Deque[Tuple[float, bool, bool, Optional[float]]] = deque()
+        self._state = CircuitState.closed
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._last_error: Optional[str] = None
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def allow_request(self) -> bool:
+        """是否放行一次请求（half_open 时会占用一个探测名额）"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CircuitState.closed:
+                return True
+            if self._state == CircuitState.half_open and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            return False
+
+    def release(self):
+        """被放行的请求未产生结果（如被取消）时归还探测名额"""
+        with self._lock:
+            if self._state == CircuitState.half_open and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def record_success(self, latency: Optional[float] = None, slow: bool = False):
+        with self._lock:
+            self._record(True, slow, latency)
+            if self._state == CircuitState.half_open:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if slow:
+                    self._trip()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._close()
+            elif self._state == CircuitState.closed:
+                self._evaluate()
+
+    def record_failure(self, error: Optional[str] = None, latency: Optional[float] = None):
+        with self._lock:
+            self._record(False, False, latency)
+            self._last_error = error
+            if self._state == CircuitState.half_open:
+                self._trip()
+            elif self._state == CircuitState.closed:
+                self._evaluate()
+
+    def reset(self):
+        with self._lock:
+            self._events.clear()
+            self._last_error = None
+            self._close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_half_open()
+            self._prune(time.monotonic())
+            total, error_rate, slow_rate = self._rates()
+            latencies = [e[3] for e in self._events if e[3] is not None]
+            retry_in = None
+            if self._state == CircuitState.open:
+                retry_in = max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+            return {
+                "provider": self.name,
+                "state": self._state.value,
+                "requests": total,
+                "error_rate": round(error_rate, 4),
+                "slow_rate": round(slow_rate, 4),
+                "avg_latency": round(sum(latencies) / len(latencies), 3) if latencies else None,
+                # 健康分：1 表示完全健康，错误与慢调用都会扣分
+                "health_score": round(max(0.0, 1.0 - error_rate - 0.5 * slow_rate), 4),
+                "retry_in_seconds": round(retry_in, 1) if retry_in is not None else None,
+                "last_error": self._last_error,
+            }
+
+    # --- 内部方法（调用方需持有锁） ---
+
+    def _record(self, ok: bool, slow: bool, latency: Optional[float]):
+        now = time.monotonic()
+        self._events.append((now, ok, slow, latency))
+        self._prune(now)
+
+    def _prune(self, now: float):
+        cutoff = now - self.window_seconds
+        while self._events and self._events[0][0] < cutoff:
+            self._events.popleft()
+
+    def _rates(self) -> Tuple[int, float, float]:
+        total = len(self._events)
+        if total == 0:
+            return 0, 0.0, 0.0
+        errors = sum(1 for e in self._events if not e[1])
+        slows = sum(1 for e in self._events if e[2])
+        return total, errors / total, slows / total
+
+    def _evaluate(self):
+        total, error_rate, slow_rate = self._rates()
+        if total < self.min_requests:
+            return
+        if error_rate >= self.error_rate_threshold or slow_rate >= self.slow_rate_threshold:
+            self._trip()
+
+    def _trip(self):
+        self._state = CircuitState.open
+        self._opened_at = time.monotonic()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def _close(self):
+        self._state = CircuitState.closed
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        # 恢复后从干净的窗口重新统计，避免旧错误立即再次触发熔断
+        self._events.clear()
+
+    def _maybe_half_open(self):
+        if self._state == CircuitState.open and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = CircuitState.half_open
+            self._probes_in_flight = 0
+            self._probe_successes = 0
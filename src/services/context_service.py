@@ -0,0 +1,119 @@
+from typing import Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from src.config.settings import settings
+from src.models.tables import Session, Message
+from src.utils.tokens import estimate_tokens
+
+class ConversationContextService:
+    """
+    对话上下文窗口
+    每轮只发送：固定的关键信息（赛道、主诉、问卷进度） + 较早轮次的滚动摘要 + 最近 N 轮原文。
+    摘要增量更新：只有新滑出窗口的消息会被折叠进摘要，已折叠的消息不再从数据库加载。
+    """
+
+    def __init__(self):
+        self.max_tokens = settings.CHAT_CONTEXT_MAX_TOKENS
+        self.recent_turns = settings.CHAT_CONTEXT_RECENT_TURNS
+        self.summary_max_tokens = settings.CHAT_CONTEXT_SUMMARY_MAX_TOKENS
+        self.fold_turns = settings.CHAT_CONTEXT_FOLD_TURNS
+
+    async def build_messages(self, db: AsyncSession, session: Session) -> List[Dict[str, str]]:
+        """
+        构建发送给 LLM 的历史消息（不含系统提示词）
+        会更新 session.meta_data 中的摘要游标，由调用方负责 commit。
+        """
+        meta = dict(session.meta_data) if session.meta_data else {}
+        summary_upto = meta.get("summary_upto", 0)
+
+        # 只加载尚未折叠进摘要的消息
+        result = await db.execute(
+            select(Message)
+            .where(Message.session_id == session.id)
+            .where(Message.id > summary_upto)
+            .order_by(Message.created_at, Message.id)
+        )
+        pending = result.scalars().all()
+
+        recent = self._select_recent(pending, self.recent_turns + self.fold_turns)
+        if len(recent) < len(pending):
+            # 超出窗口时一次性折叠到 recent_turns，使摘要按批变化，而不是每轮都改变缓存前缀
+            recent = self._select_recent(pending, self.recent_turns)
+        folded = pending[:len(pending) - len(recent)]
+
+        summary_lines = list(meta.get("history_summary", []))
+        if folded:
+            summary_lines.extend(self._summarize(m) for m in folded)
+            summary_lines = self._trim_summary(summary_lines)
+            meta["history_summary"] = summary_lines
+            meta["summary_upto"] = folded[-1].id
+            session.meta_data = meta
+
+        # 布局按变化频率排序，尽量延长可命中 provider 前缀缓存的稳定前缀：
+        # 系统提示词 → 较早对话摘要（仅在折叠时变化） → 最近原文（只追加） → 固定信息（每轮变化）
+        api_messages = []
+        if summary_lines:
+            api_messages.append({"role": "system", "content": "【较早对话摘要】\n" + "\n".join(summary_lines)})
+        api_messages.extend({"role": m.role, "content": m.content} for m in recent)
+        facts_block = self._facts_block(meta)
+        if facts_block:
+            # 不使用对话末尾的 system 消息（部分 provider 不支持或会弱化其权重）：
+            # 固定信息作为最后一条用户消息的前缀发送，只影响本轮请求，不写入数据库
+            if api_messages and api_messages[-1]["role"] == "user":
+                latest = api_messages[-1]["content"]
+                api_messages[-1] = {"role": "user", "content": f"{facts_block}\n\n【用户最新回复】\n{latest}"}
+            else:
+                api_messages.append({"role": "user", "content": facts_block})
+        return api_messages
+
+    def _select_recent(self, messages: List[Message], max_turns: int) -> List[Message]:
+        """从末尾取最近 N 轮（以用户消息计轮），并保证不超过 token 预算"""
+        budget = self.max_tokens - self.summary_max_tokens
+        selected: List[Message] = []
+        user_turns = 0
+        used = 0
+        for msg in reversed(messages):
+            cost = estimate_tokens(msg.content)
+            if selected and used + cost > budget:
+                break
+            if msg.role == "user":
+                if user_turns >= max_turns:
+                    break
+                user_turns += 1
+            selected.append(msg)
+            used += cost
+        selected.reverse()
+        return selected
+
+    def _summarize(self, msg: Message) -> str:
+        """抽取式压缩：用户回答保留原文（截断），顾问消息只保留首行（通常是问题）"""
+        content = (msg.content or "").strip()
+        if msg.role == "user":
+            return f"用户: {content[:120]}"
+        first_line = content.split("\n", 1)[0]
+        return f"顾问: {first_line[:80]}"
+
+    def _trim_summary(self, lines: List[str]) -> List[str]:
+        """摘要超出预算时丢弃最早的条目"""
+        total = sum(estimate_tokens(line) for line in lines)
+        while lines and total > self.summary_max_tokens:
+            total -= estimate_tokens(lines[0])
+            lines = lines[1:]
+        return lines
+
+    def _facts_block(self, meta: dict) -> Optional[str]:
+        facts = []
+        if meta.get("profile"):
+            facts.append(f"用户画像: {meta['profile']}")
+        if meta.get("user_info"):
+            facts.append(f"用户主诉: {meta['user_info']}")
+        if meta.get("track"):
+            facts.append(f"锁定赛道: {meta['track']}")
+        if meta.get("question_count"):
+            facts.append(f"问卷进度: 已回答 {meta.get('answered_count', 0)}/{meta['question_count']} 题")
+
+        if not facts:
+            return None
+        return "【已确认信息】\n" + "\n".join(facts)
+
+context_service = ConversationContextService()
@@ -0,0 +1,82 @@
+import codecs
+import os
+import time
+from typing import Iterator, List, Tuple
+import pypdf
+import docx
+import openpyxl
+
+# 非分页格式按约 N 个字符聚合为一个片段
+SEGMENT_CHARS = 4000
+
+def iter_text_segments(path: str, filename: str) -> Iterator[str]:
+    """
+    按片段逐步提取文本（PDF 按页，其他格式按约 SEGMENT_CHARS 字符），
+    供入库流水线边解析边切片，避免一次性拼接整份文档。
+    """
+    ext = os.path.splitext(filename)[1].lower()
+
+    if ext == '.pdf':
+        reader = pypdf.PdfReader(path)
+        for page in reader.pages:
+            yield (page.extract_text() or "") + "\n"
+    elif ext in ['.docx', '.doc']:
+        doc = docx.Document(path)
+        yield from _group_lines(para.text for para in doc.paragraphs)
+    elif ext == '.txt':
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(64 * 1024)
+                if not block:
+                    break
+                text = decoder.decode(block)
+                if text:
+                    yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+    elif ext in ['.xlsx', '.xls']:
+        wb = openpyxl.load_workbook(path, read_only=True)
+        try:
+            for ws in wb.worksheets:
+                yield from _group_lines(
+                    " ".join([str(cell) for cell in row if cell]) for row in ws.values
+                )
+        finally:
+            wb.close()
+    else:
+        raise Exception(f"Unsupported file type: {ext}")
+
+# 以下函数在解析进程池的子进程中执行：只接收路径等可序列化参数，返回 (结果, 子进程 CPU 秒数)
+
+def pdf_page_count(path: str) -> Tuple[int, float]:
+    started = time.process_time()
+    pages = len(pypdf.PdfReader(path).pages)
+    return pages, time.process_time() - started
+
+def parse_pdf_pages(path: str, start: int, end: int) -> Tuple[List[str], float]:
+    """解析 PDF 的 [start, end) 页（大文件按页段分片到多个进程）"""
+    started = time.process_time()
+    reader = pypdf.PdfReader(path)
+    texts = [(reader.pages[i].extract_text() or "") + "\n" for i in range(start, end)]
+    return texts, time.process_time() - started
+
+def parse_document(path: str, filename: str) -> Tuple[List[str], float]:
+    """整体解析非分页格式，返回片段列表"""
+    started = time.process_time()
+    segments = list(iter_text_segments(path, filename))
+    return segments, time.process_time() - started
+
+def _group_lines(lines: Iterator[str]) -> Iterator[str]:
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line) + 1
+        if size >= SEGMENT_CHARS:
+            yield "\n".join(buffer) + "\n"
+            buffer = []
+            size = 0
+    if buffer:
+        yield "\n".join(buffer) + "\n"
@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from src.config.settings import settings
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    内容寻址的向量缓存，key = (model, sha256(text))
+    - 内存 LRU 作为前端，SQLite 文件作为持久化存储（跨进程、跨重启共享）
+    - 向量以 float32 二进制存储
+    """
+
+    def __init__(self, path: Path, memory_size: int):
+        self.path = Path(path)
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    async def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """批量查询，未命中的位置返回 None"""
+        keys = [(model, text_hash(t)) for t in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        disk_lookup: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                results[i] = vector
+                self.memory_hits += 1
+            else:
+                disk_lookup.setdefault(key[1], []).append(i)
+
+        if disk_lookup:
+            found = await asyncio.to_thread(self._load, model, list(disk_lookup.keys()))
+            for digest, indexes in disk_lookup.items():
+                vector = found.get(digest)
+                if vector is None:
+                    self.misses += len(indexes)
+                    continue
+                self.disk_hits += len(indexes)
+                self._remember((model, digest), vector)
+                for i in indexes:
+                    results[i] = vector
+        return results
+
+    async def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        rows = []
+        for text, vector in zip(texts, vectors):
+            digest = text_hash(text)
+            self._remember((model, digest), vector)
+            rows.append((model, digest, array("f", vector).tobytes(), time.time()))
+        if rows:
+            await asyncio.to_thread(self._store, rows)
+
+    def snapshot(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _remember(self, key: Tuple[str, str], vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _load(self, model: str, digests: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            # SQLite 默认最多 999 个绑定参数，分批查询
+            for i in range(0, len(digests), 500):
+                batch = digests[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for digest, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[digest] = vector.tolist()
+        return found
+
+    def _store(self, rows: List[tuple]):
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, created_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            conn.commit()
+
+embedding_cache = EmbeddingCache(
+    path=settings.EMBEDDING_CACHE_PATH,
+    memory_size=settings.EMBEDDING_CACHE_MEMORY_SIZE
+)
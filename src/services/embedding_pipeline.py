@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from src.config.settings import settings
+from src.services.embedding_providers import EmbeddingPayloadError
+from src.services.volc_service import VolcService
+from src.utils.tokens import estimate_tokens
+
+logger = logging.getLogger("healthy_rag")
+
+EmbedFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+class EmbeddingScheduler:
+    """
+    并发、自适应批量的向量化调度器
+    - 多个批次并发请求，同时在途的批次数不超过 max_in_flight
+    - 批大小受条数与 token 上限约束，并根据观测延迟自适应增减
+    - 失败的批次单独按指数退避重试，不影响其他批次；只有超出后端限制的批次才对半拆分并收紧批大小
+    - 结果按输入顺序返回
+    """
+
+    def __init__(
+        self,
+        embed_fn: EmbedFn,
+        max_in_flight: int = settings.EMBEDDING_MAX_IN_FLIGHT,
+        initial_batch_size: int = settings.EMBEDDING_BATCH_SIZE,
+        max_batch_size: int = settings.EMBEDDING_MAX_BATCH_SIZE,
+        max_batch_tokens: int = settings.EMBEDDING_MAX_BATCH_TOKENS,
+        target_batch_seconds: float = settings.EMBEDDING_TARGET_BATCH_SECONDS,
+        max_retries: int = settings.EMBEDDING_MAX_RETRIES
+    ):
+        self.embed_fn = embed_fn
+        self.max_in_flight = max_in_flight
+        self.batch_size = initial_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.target_batch_seconds = target_batch_seconds
+        self.max_retries = max_retries
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        slots = asyncio.Semaphore(self.max_in_flight)
+        tasks: List[asyncio.Task] = []
+        cursor = 0
+        try:
+            while cursor < len(texts):
+                # 拿到空闲名额后再决定批大小，使用最新的自适应结果
+                await slots.acquire()
+                end = self._next_batch_end(texts, cursor)
+                tasks.append(asyncio.create_task(self._run_batch(texts, cursor, end, results, slots)))
+                cursor = end
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return results
+
+    def _next_batch_end(self, texts: List[str], start: int) -> int:
+        end = start
+        tokens = 0
+        while end < len(texts) and end - start < self.batch_size:
+            cost = estimate_tokens(texts[end])
+            if end > start and tokens + cost > self.max_batch_tokens:
+                break
+            tokens += cost
+            end += 1
+        return end
+
+    async def _run_batch(
+        self,
+        texts: List[str],
+        start: int,
+        end: int,
+        results: List[Optional[List[float]]],
+        slots: asyncio.Semaphore
+    ):
+        try:
+            await self._embed_range(texts, start, end, results)
+        finally:
+            slots.release()
+
+    async def _embed_range(
+        self,
+        texts: List[str],
+        start: int,
+        end: int,
+        results: List[Optional[List[float]]]
+    ):
+        attempt = 0
+        while True:
+            began = time.monotonic()
+            try:
+                vectors = await self.embed_fn(texts[start:end])
+                break
+            except EmbeddingPayloadError as e:
+                if end - start <= 1:
+                    raise
+                # 批次超出后端限制：对半拆分，后续批次（包括按延迟扩大时）也不再超过拆分后的大小
+                logger.warning(f"Embedding batch [{start}:{end}] exceeds provider limits ({e}), splitting")
+                self.max_batch_size = max(1, min(self.max_batch_size, (end - start) // 2))
+                self.batch_size = min(self.batch_size, self.max_batch_size)
+                mid = (start + end) // 2
+                await self._embed_range(texts, start, mid, results)
+                await self._embed_range(texts, mid, end, results)
+                return
+            except Exception as e:
+                # 限流、超时、5xx 等瞬时错误：原批次退避后重试，不改变批大小
+                if attempt >= self.max_retries:
+                    raise
+                delay = min(2 ** attempt, 10)
+                logger.warning(f"Embedding batch [{start}:{end}] failed ({e}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+        if len(vectors) != end - start:
+            raise Exception(f"Embedding count mismatch: expected {end - start}, got {len(vectors)}")
+        results[start:end] = vectors
+        self._adapt(end - start, time.monotonic() - began)
+
+    def _adapt(self, size: int, elapsed: float):
+        """延迟明显低于目标时扩大批次，超过目标时缩小"""
+        if elapsed > self.target_batch_seconds and self.batch_size > 1:
+            self.batch_size = max(1, self.batch_size // 2)
+        elif elapsed < self.target_batch_seconds / 2 and size >= self.batch_size:
+            self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+
+class EmbeddingMicroBatcher:
+    """
+    查询向量微批处理
+    在很短的窗口内收集并发的单条查询，合并为一次 API 调用后把结果分发回各调用方；
+    攒满 max_batch 条时立即发送，不等窗口结束。
+    """
+
+    def __init__(
+        self,
+        embed_fn: EmbedFn,
+        window_ms: float = settings.EMBEDDING_QUERY_BATCH_WINDOW_MS,
+        max_batch: int = settings.EMBEDDING_QUERY_MAX_BATCH
+    ):
+        self.embed_fn = embed_fn
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # 持有发送中批次的任务引用，避免被垃圾回收
+        self._dispatching: Set[asyncio.Task] = set()
+
+        self.requests = 0
+        self.batches = 0
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """调用方已自行成批时直接发送，不经过收集窗口"""
+        self.requests += len(texts)
+        self.batches += 1
+        return await self.embed_fn(texts)
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # 已取消的调用方不再参与本批
+        batch = [(text, future) for text, future in self._pending if not future.done()]
+        self._pending = []
+        if batch:
+            self.batches += 1
+            task = asyncio.ensure_future(self._dispatch(batch))
+            self._dispatching.add(task)
+            task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            vectors = await self.embed_fn([text for text, _ in batch])
+            if len(vectors) != len(batch):
+                raise Exception(f"Embedding count mismatch: expected {len(batch)}, got {len(vectors)}")
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        except asyncio.CancelledError:
+            # 关闭时被取消：未完成的调用方一并取消，不能一直等待
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+# 检索路径共享的查询向量微批器
+query_embedder = EmbeddingMicroBatcher(VolcService().get_embeddings)
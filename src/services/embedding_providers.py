@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import re
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import numpy as np
+from src.config.settings import settings
+from src.services.http_client import http_client
+
+logger = logging.getLogger("healthy_rag")
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+def _get_executor() -> ThreadPoolExecutor:
+    """本地推理使用的线程池（NumPy 运算 / 模型推理期间释放 GIL，不阻塞事件循环）"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.EMBEDDING_LOCAL_THREADS,
+            thread_name_prefix="embedding"
+        )
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+class EmbeddingPayloadError(Exception):
+    """请求超出后端的条数/token 限制；拆小批次后可能成功，原样重试不会成功"""
+
+class EmbeddingProvider(ABC):
+    """
+    向量化后端接口
+    model 作为向量缓存的 key 之一，不同后端/模型的向量互不混用；
+    cacheable 为 False 的后端（计算成本低于查缓存）不写入向量缓存。
+    """
+
+    model: str = ""
+    cacheable: bool = True
+
+    async def start(self):
+        """预先加载模型等资源（应用启动时调用）；默认无需准备"""
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        ...
+
+class VolcEmbeddingProvider(EmbeddingProvider):
+    """火山引擎远程 /embeddings 接口"""
+
+    def __init__(self):
+        self.api_key = settings.VOLC_API_KEY
+        self.model = settings.VOLC_EMBEDDING_MODEL
+        self.base_url = settings.VOLC_API_BASE
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        response = await http_client.client.post(
+            f"{self.base_url}/embeddings",
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.api_key}"
+            },
+            json={
+                "model": self.model,
+                "input": texts,
+                "encoding_format": "float"
+            },
+            timeout=60.0
+        )
+
+        if response.status_code != 200:
+            if self._is_payload_error(response.status_code, response.text):
+                raise EmbeddingPayloadError(f"Volcengine API Error: {response.text}")
+            raise Exception(f"Volcengine API Error: {response.text}")
+
+        data = response.json()
+        return [item["embedding"] for item in data["data"]]
+
+    _PAYLOAD_ERROR_HINTS = ("token", "too long", "too large", "too many", "exceed", "length", "limit")
+
+    def _is_payload_error(self, status_code: int, text: str) -> bool:
+        """413 或提示超出条数/长度限制的 400 视为请求体过大，其余（限流、5xx 等）按瞬时错误处理"""
+        if status_code == 413:
+            return True
+        if status_code != 400:
+            return False
+        text = text.lower()
+        return any(hint in text for hint in self._PAYLOAD_ERROR_HINTS)
+
+class _LocalProvider(EmbeddingProvider):
+    """本地后端：按 EMBEDDING_LOCAL_BATCH_SIZE 分批，在线程池中推理"""
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        batch_size = settings.EMBEDDING_LOCAL_BATCH_SIZE
+        vectors: List[List[float]] = []
+        for i in range(0, len(texts), batch_size):
+            matrix = await loop.run_in_executor(_get_executor(), self._encode, texts[i:i + batch_size])
+            vectors.extend(matrix.tolist())
+        return vectors
+
+    @abstractmethod
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        ...
+
+class HashingEmbeddingProvider(_LocalProvider):
+    """
+    确定性哈希向量（字符 1/2-gram + 英文单词的 signed feature hashing，L2 归一化）
+    无需模型与网络，适合离线测试与入库基准；语义能力有限，不建议用于线上检索。
+    字符 n-gram 由码点直接组合成整数特征，哈希与累加都在 NumPy 中批量完成。
+    """
+
+    cacheable = False
+    _WORD_PATTERN = re.compile(r"[a-z0-9]+")
+    # 不同类型的特征放在不同的整数区间，互不冲突（码点 < 2^21）
+    _BIGRAM_OFFSET = np.uint64(1 << 21)
+    _WORD_OFFSET = np.uint64(1 << 63)
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.model = f"hashing-{dim}"
+
+    def _features(self, text: str) -> np.ndarray:
+        text = re.sub(r"\s+", " ", text.lower()).strip()
+        chars = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        bigrams = (chars[:-1] << np.uint64(21) | chars[1:]) + self._BIGRAM_OFFSET
+        words = np.array(
+            [zlib.crc32(w.encode("utf-8")) for w in self._WORD_PATTERN.findall(text)], dtype=np.uint64
+        ) | self._WORD_OFFSET
+        return np.concatenate([chars, bigrams, words])
+
+    @staticmethod
+    def _mix(keys: np.ndarray) -> np.ndarray:
+        """splitmix64：把结构化的整数特征打散为均匀分布的 64 位哈希"""
+        keys = keys + np.uint64(0x9E3779B97F4A7C15)
+        keys = (keys ^ (keys >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        keys = (keys ^ (keys >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return keys ^ (keys >> np.uint64(31))
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        features = [self._features(text) for text in texts]
+        rows = np.repeat(np.arange(len(texts)), [len(f) for f in features])
+        digests = self._mix(np.concatenate(features)) if features else np.zeros(0, dtype=np.uint64)
+        indexes = (digests % np.uint64(self.dim)).astype(np.int64)
+        signs = np.where((digests >> np.uint64(63)) == 1, -1.0, 1.0)
+        matrix = np.bincount(
+            rows * self.dim + indexes, weights=signs, minlength=len(texts) * self.dim
+        ).reshape(len(texts), self.dim).astype(np.float32)
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+class SentenceTransformerProvider(_LocalProvider):
+    """本地 sentence-transformers 模型（可选依赖，应用启动时或首次使用时在线程池中加载一次）"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.model = f"st:{model_name}"
+        self._model = None
+        self._load_lock = threading.Lock()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_get_executor(), self._load)
+
+    def _load(self):
+        with self._load_lock:
+            if self._model is not None:
+                return self._model
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError:
+                raise RuntimeError("EMBEDDING_BACKEND=sentence_transformers requires 'sentence-transformers' to be installed")
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+            logger.info(f"Loaded local embedding model {self.model_name}")
+            return self._model
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self._load().encode(
+            texts,
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        ).astype(np.float32)
+
+_provider: Optional[EmbeddingProvider] = None
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """按 settings.EMBEDDING_BACKEND 创建进程内共享的向量化后端"""
+    global _provider
+    if _provider is None:
+        backend = settings.EMBEDDING_BACKEND
+        if backend == "volc":
+            _provider = VolcEmbeddingProvider()
+        elif backend == "hashing":
+            _provider = HashingEmbeddingProvider(settings.EMBEDDING_HASHING_DIM)
+        elif backend == "sentence_transformers":
+            _provider = SentenceTransformerProvider(settings.EMBEDDING_LOCAL_MODEL)
+        else:
+            raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+    return _provider
+
+async def start_provider():
+    """预先加载向量化后端（本地模型在线程池中加载，不阻塞事件循环）"""
+    await get_embedding_provider().start()
@@ -0,0 +1,66 @@
+import logging
+import httpx
+from typing import Optional
+from src.config.settings import settings
+
+logger = logging.getLogger("healthy_rag")
+
+class HTTPClientManager:
+    """
+    进程级共享的 httpx.AsyncClient 连接池
+    由 FastAPI lifespan 负责创建与关闭，所有外部服务调用复用同一个连接池，
+    避免每次请求重新进行 DNS / TCP / TLS 握手。
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self.http2 = False
+
+    def _build_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+        )
+        http2 = settings.HTTP_ENABLE_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+            except ImportError:
+                logger.warning("HTTP/2 enabled but 'h2' is not installed, falling back to HTTP/1.1")
+                http2 = False
+        self.http2 = http2
+
+        return httpx.AsyncClient(
+            limits=limits,
+            http2=http2,
+            timeout=httpx.Timeout(settings.HTTP_DEFAULT_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+        )
+
+    async def start(self):
+        """创建连接池（应用启动时调用）"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+            logger.info(
+                f"HTTP client pool started (max_connections={settings.HTTP_MAX_CONNECTIONS}, "
+                f"http2={self.http2})"
+            )
+
+    async def close(self):
+        """关闭连接池（应用关闭时调用）"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("HTTP client pool closed")
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        获取共享客户端
+        在 lifespan 之外（如脚本中）使用时惰性创建
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+http_client = HTTPClientManager()
@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from src.config.settings import settings
+from src.services.embedding_pipeline import EmbeddingScheduler
+from src.services.parse_pool import DocumentParsePool, parse_pool
+
+logger = logging.getLogger("healthy_rag")
+
+_END = object()
+
+def chunk_hash(content: str, tags: Optional[List[str]]) -> str:
+    """
+    切片指纹：内容 + 标签
+    标签参与计算，标签变化时切片按新增处理（重新写入带新标签的切片，向量可命中 Embedding 缓存）
+    """
+    payload = json.dumps(sorted(tags or []), ensure_ascii=False) + "\n" + content
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class StreamingSplitter:
+    """
+    增量切片：按"锚点行"把文本划分为段落块，每块再按 chunk_size 切片
+    锚点由行内容的哈希决定（而非累计长度），修改一段文字只影响所在的块，
+    其后的块边界保持不变，重新上传时未改动部分的切片哈希不变。
+    缓冲区只保留未完成的块，内存与文件大小无关。
+    """
+
+    ANCHOR_PERIOD = 8  # 平均每 N 个非空行出现一个锚点
+    MAX_BLOCK_CHUNKS = 8  # 块长度上限（chunk_size 的倍数），超出时在行尾强制切块
+
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        self.chunk_size = chunk_size
+        self._splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=["\n\n", "\n", "。", "！", "？", " ", ""]
+        )
+        self._buffer = ""  # 尚未以换行结束的行
+        self._block: List[str] = []
+        self._block_size = 0
+
+    def _is_anchor(self, line: str) -> bool:
+        line = line.strip()
+        return bool(line) and zlib.crc32(line.encode("utf-8")) % self.ANCHOR_PERIOD == 0
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        chunks: List[str] = []
+        for line in lines:
+            self._block.append(line)
+            self._block_size += len(line) + 1
+            if self._block_size >= self.chunk_size and (
+                self._is_anchor(line) or self._block_size >= self.chunk_size * self.MAX_BLOCK_CHUNKS
+            ):
+                chunks.extend(self._flush())
+        return chunks
+
+    def _flush(self) -> List[str]:
+        block = "\n".join(self._block)
+        self._block = []
+        self._block_size = 0
+        return self._splitter.split_text(block) if block.strip() else []
+
+    def finish(self) -> List[str]:
+        if self._buffer:
+            self._block.append(self._buffer)
+            self._buffer = ""
+        return self._flush()
+
+class IngestionPipeline:
+    """
+    流式入库流水线：解析 → 切片 → 向量化 → 写入
+    各阶段是独立的 asyncio 任务，通过有界队列连接（满时上游等待，形成背压），
+    前面的页已在向量化/写入时后面的页仍在解析；任一阶段失败时取消其余阶段，并撤回本次写入的切片。
+    切片阶段计算内容哈希：已入库 (known_hashes) 或文档内重复的切片不再向量化与写入。
+    """
+
+    def __init__(
+        self,
+        embedder: EmbeddingScheduler,
+        vector,
+        keywords,
+        parser: DocumentParsePool = parse_pool,
+        queue_size: int = settings.INGEST_QUEUE_SIZE,
+        group_size: int = settings.INGEST_GROUP_SIZE
+    ):
+        self.embedder = embedder
+        self.parser = parser
+        self.vector = vector
+        self.keywords = keywords
+        self.queue_size = queue_size
+        self.group_size = group_size
+
+    async def run(
+        self,
+        path: str,
+        doc: Dict[str, Any],
+        on_first_batch=None,
+        known_hashes: Optional[Set[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        处理一个已下载到本地的文件
+        doc: 切片公共字段 (doc_id / kb_type / tags / source)
+        on_first_batch: 第一批切片可检索后调用（可选）
+        known_hashes: 该文档已入库切片的哈希，这些切片跳过
+        返回 {"hashes": 新版本全部切片哈希, "added": 本次写入的切片哈希}
+        """
+        segments: asyncio.Queue = asyncio.Queue(self.queue_size)
+        groups: asyncio.Queue = asyncio.Queue(self.queue_size)
+        embedded: asyncio.Queue = asyncio.Queue(self.queue_size)
+        stats = {"hashes": set(), "added": set(), "first_batch": None, "write": None}
+        started = time.monotonic()
+
+        tasks = [
+            asyncio.create_task(self._extract(path, doc["source"], segments)),
+            asyncio.create_task(self._split(segments, groups, doc["tags"], known_hashes or set(), stats)),
+            asyncio.create_task(self._embed(groups, embedded)),
+            asyncio.create_task(self._upsert(embedded, doc, stats, started, on_first_batch)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # 取消不会中断已在线程中执行的写入：等它结束后再撤回，避免留下未记录哈希的切片
+            if stats["write"] is not None:
+                await asyncio.gather(stats["write"], return_exceptions=True)
+            await self._discard(doc["doc_id"], stats["added"])
+            raise
+
+        logger.info(
+            f"Ingested doc {doc['doc_id']}: {len(stats['hashes'])} chunks ({len(stats['added'])} new) "
+            f"in {time.monotonic() - started:.1f}s (first searchable after {stats['first_batch'] or 0:.1f}s)"
+        )
+        return {"hashes": stats["hashes"], "added": stats["added"]}
+
+    async def _write(self, records: List[Dict[str, Any]]):
+        await self.vector.add_chunks(records)
+        await self.keywords.add_chunks(records)
+
+    async def _discard(self, doc_id: int, hashes: Set[str]):
+        """撤回本次已写入的切片，保持上一版本的切片不变"""
+        if not hashes:
+            return
+        try:
+            await self.vector.delete_chunks(doc_id, list(hashes))
+            await self.keywords.delete_chunks(doc_id, list(hashes))
+        except Exception as e:
+            logger.warning(f"Failed to discard partial chunks of doc {doc_id}: {e}")
+
+    async def _extract(self, path: str, filename: str, out: asyncio.Queue):
+        # 解析在进程池中执行，不占用事件循环所在进程的 GIL
+        segments = self.parser.iter_segments(path, filename)
+        try:
+            async for segment in segments:
+                await out.put(segment)
+        finally:
+            # 被取消时及时关闭生成器，撤销尚未开始的解析分片
+            await segments.aclose()
+        await out.put(_END)
+
+    async def _split(
+        self,
+        inp: asyncio.Queue,
+        out: asyncio.Queue,
+        tags: Optional[List[str]],
+        known: Set[str],
+        stats: dict
+    ):
+        splitter = StreamingSplitter(settings.INGEST_CHUNK_SIZE, settings.INGEST_CHUNK_OVERLAP)
+        pending: List[Tuple[str, str]] = []  # (hash, content)
+        seen = stats["hashes"]
+
+        def collect(chunks: List[str]):
+            for chunk in chunks:
+                h = chunk_hash(chunk, tags)
+                if h in seen:
+                    continue
+                seen.add(h)
+                if h not in known:
+                    pending.append((h, chunk))
+
+        while True:
+            segment = await inp.get()
+            if segment is _END:
+                break
+            collect(splitter.feed(segment))
+            while len(pending) >= self.group_size:
+                await out.put(pending[:self.group_size])
+                pending = pending[self.group_size:]
+        collect(splitter.finish())
+        for i in range(0, len(pending), self.group_size):
+            await out.put(pending[i:i + self.group_size])
+        await out.put(_END)
+
+    async def _embed(self, inp: asyncio.Queue, out: asyncio.Queue):
+        while True:
+            group = await inp.get()
+            if group is _END:
+                break
+            vectors = await self.embedder.embed([chunk for _, chunk in group])
+            await out.put((group, vectors))
+        await out.put(_END)
+
+    async def _upsert(self, inp: asyncio.Queue, doc: Dict[str, Any], stats: dict, started: float, on_first_batch):
+        await self.vector.init_schema()
+        while True:
+            item = await inp.get()
+            if item is _END:
+                break
+            group, vectors = item
+            records = [
+                {**doc, "content": chunk, "chunk_hash": h, "vector": vector}
+                for (h, chunk), vector in zip(group, vectors)
+            ]
+            # 先记录再写入：写入中途失败时也能撤回
+            stats["added"].update(h for h, _ in group)
+            stats["write"] = asyncio.ensure_future(self._write(records))
+            await asyncio.shield(stats["write"])
+            if stats["first_batch"] is None:
+                stats["first_batch"] = time.monotonic() - started
+                if on_first_batch:
+                    on_first_batch()
@@ -0,0 +1,133 @@
+import logging
+import math
+from pathlib import Path
+from typing import Callable, List, Optional
+import numpy as np
+
+logger = logging.getLogger("healthy_rag")
+
+# rows -> 归一化后的 float32 向量
+VectorReader = Callable[[np.ndarray], np.ndarray]
+
+class IVFIndex:
+    """
+    倒排文件 (IVF-Flat) 近似最近邻索引，供 LocalVectorStore 使用
+    - 球面 k-means 把向量划分到 nlist 个簇，检索时只对最近的 nprobe 个簇内的行做精确打分
+    - 新增行直接分配到最近的簇（增量插入）；数据量增长到训练时的 RETRAIN_FACTOR 倍后重新训练
+    - 删除沿用存储层的墓碑标记，候选行在打分前按存活/过滤掩码筛掉
+    """
+
+    RETRAIN_FACTOR = 4
+    KMEANS_ITERATIONS = 10
+    SAMPLES_PER_LIST = 64
+    ASSIGN_BLOCK = 16384
+    SCORE_BLOCK = 1 << 22  # 分配簇时一次计算的相似度个数上限（行数 × 簇数）
+
+    def __init__(self, nlist: int = 0, nprobe: int = 8, min_rows: int = 10000):
+        self.nlist_setting = nlist
+        self.nprobe = nprobe
+        self.min_rows = min_rows
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_rows = 0
+        self._lists: List[np.ndarray] = []
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def should_train(self, count: int) -> bool:
+        if count < self.min_rows:
+            return False
+        return not self.trained or count > self.trained_rows * self.RETRAIN_FACTOR
+
+    def empty_copy(self) -> "IVFIndex":
+        """参数相同的未训练索引（后台训练新索引时使用）"""
+        return IVFIndex(nlist=self.nlist_setting, nprobe=self.nprobe, min_rows=self.min_rows)
+
+    def train(self, count: int, read: VectorReader, seed: int = 0):
+        """从已存储向量中采样训练簇中心，并重新分配全部行"""
+        nlist = self.nlist_setting or max(1, int(4 * math.sqrt(count)))
+        nlist = min(nlist, count)
+        rng = np.random.default_rng(seed)
+        sample_size = min(count, nlist * self.SAMPLES_PER_LIST)
+        sample = read(np.sort(rng.choice(count, size=sample_size, replace=False)))
+
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+        for _ in range(self.KMEANS_ITERATIONS):
+            labels = self._nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            # 空簇保留原中心
+            filled = counts > 0
+            centroids[filled] = sums[filled]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids /= norms
+
+        self.centroids = centroids.astype(np.float32)
+        self.assignments = np.empty(count, dtype=np.int32)
+        for s in range(0, count, self.ASSIGN_BLOCK):
+            rows = np.arange(s, min(count, s + self.ASSIGN_BLOCK))
+            self.assignments[rows] = self._nearest(read(rows))
+        self.trained_rows = count
+        self._rebuild_lists()
+        logger.info(f"IVF index trained: {count} rows, {nlist} lists")
+
+    def reset(self):
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_rows = 0
+        self._lists = []
+
+    def add(self, start: int, vectors: np.ndarray) -> Optional[np.ndarray]:
+        """为新追加的行 [start, start + len(vectors)) 分配簇，返回分配结果（未训练时为 None）"""
+        if not self.trained:
+            return None
+        labels = self._nearest(vectors)
+        self.assignments = np.concatenate([self.assignments, labels])
+        rows = np.arange(start, start + len(vectors))
+        for c in np.unique(labels):
+            self._lists[c] = np.concatenate([self._lists[c], rows[labels == c]])
+        return labels
+
+    def compact(self, keep: np.ndarray):
+        """存储层压缩后行号重排：保留行的簇分配不变"""
+        if not self.trained:
+            return
+        self.assignments = self.assignments[keep]
+        self._rebuild_lists()
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """返回最近 nprobe 个簇内的行号"""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        sims = self.centroids @ query
+        probe = np.argpartition(-sims, nprobe - 1)[:nprobe]
+        return np.concatenate([self._lists[c] for c in probe])
+
+    def save(self, path: Path):
+        """保存簇中心；逐行的簇分配由存储层追加写入"""
+        np.savez(path, centroids=self.centroids, trained_rows=self.trained_rows)
+
+    def load(self, path: Path, assignments: np.ndarray):
+        data = np.load(path)
+        self.centroids = data["centroids"]
+        self.trained_rows = int(data["trained_rows"])
+        self.assignments = assignments.astype(np.int32)
+        self._rebuild_lists()
+
+    def _nearest(self, vectors: np.ndarray, centroids: Optional[np.ndarray] = None) -> np.ndarray:
+        """分块计算最近簇，避免一次生成 (行数 × 簇数) 的完整相似度矩阵"""
+        if centroids is None:
+            centroids = self.centroids
+        labels = np.empty(len(vectors), dtype=np.int32)
+        block = max(1, self.SCORE_BLOCK // len(centroids))
+        for s in range(0, len(vectors), block):
+            labels[s:s + block] = np.argmax(vectors[s:s + block] @ centroids.T, axis=1)
+        return labels
+
+    def _rebuild_lists(self):
+        order = np.argsort(self.assignments, kind="stable")
+        bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+        self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
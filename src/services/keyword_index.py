@@ -0,0 +1,304 @@
+import asyncio
+import heapq
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+from src.config.settings import settings
+from src.services.retrieval_cache import KnowledgeGeneration, knowledge_generation
+
+try:
+    import jieba
+    jieba.setLogLevel(logging.WARNING)
+except ImportError:
+    jieba = None
+
+logger = logging.getLogger("healthy_rag")
+
+_CJK_RUN = re.compile(r"[\u4e00-\u9fff]+")
+_WORD = re.compile(r"[a-z0-9]+")
+_TOKEN = re.compile(r"[\u4e00-\u9fffa-z0-9]")
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文感知分词：安装了 jieba 时使用搜索引擎模式分词，否则中文按字符 bigram 切分
+    英文与数字按单词切分并转小写。
+    """
+    text = text.lower()
+    if jieba is not None:
+        return [t for t in jieba.lcut_for_search(text) if _TOKEN.search(t)]
+
+    tokens = _WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+class KeywordIndex:
+    """
+    切片内容的 BM25 倒排索引
+    - 切片持久化在 SQLite 中（按 doc_id 增量写入/删除），倒排表在内存中，启动时从 SQLite 重建
+    - 多进程部署时其他进程写入的切片不在本进程的倒排表中：知识库版本号变化后检查 SQLite 是否
+      被其他连接修改过（PRAGMA data_version），是则增量同步新增/删除的行
+    - kb_types / tags 过滤语义与向量检索一致
+    """
+
+    K1 = 1.2
+    B = 0.75
+    SYNC_BATCH = 500
+
+    def __init__(self, path: Path, generation: Optional[KnowledgeGeneration] = None):
+        self.path = Path(path)
+        self.generation = generation
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._seen_generation: Optional[str] = None
+        self._data_version: Optional[int] = None
+
+        self._chunks: Dict[int, Dict[str, Any]] = {}  # chunk_id -> doc_id / kb_type / tags / source / content
+        self._lengths: Dict[int, int] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}  # term -> {chunk_id: tf}
+        self._by_doc: Dict[int, List[int]] = {}
+        self._total_length = 0
+
+    async def start(self):
+        await asyncio.to_thread(self._ensure_loaded)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def add_chunks(self, chunks: List[Dict[str, Any]]):
+        """批量添加切片（字段同 VectorService.add_chunks，忽略 vector）"""
+        await asyncio.to_thread(self._add_chunks, chunks)
+
+    async def delete_by_doc_id(self, doc_id: int):
+        await asyncio.to_thread(self._delete, doc_id)
+
+    async def delete_chunks(self, doc_id: int, chunk_hashes: List[str]):
+        """删除指定文档中给定内容哈希的切片"""
+        await asyncio.to_thread(self._delete, doc_id, set(chunk_hashes))
+
+    async def doc_ids(self) -> Set[int]:
+        """索引中已有切片的文档 id"""
+        await asyncio.to_thread(self._sync, True)
+        with self._lock:
+            return set(self._by_doc)
+
+    async def search(
+        self,
+        query: str,
+        limit: int = 5,
+        kb_types: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._search, query, limit, kb_types, tags)
+
+    # --- 内部实现 ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, doc_id INTEGER NOT NULL, kb_type TEXT NOT NULL, "
+                "tags TEXT NOT NULL, source TEXT NOT NULL, content TEXT NOT NULL, chunk_hash TEXT)"
+            )
+            # 旧版本的索引文件没有 chunk_hash 列
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(chunks)")]
+            if "chunk_hash" not in columns:
+                conn.execute("ALTER TABLE chunks ADD COLUMN chunk_hash TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_chunks_doc_id ON chunks (doc_id)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._loaded:
+                return
+            # 先记下版本，加载期间其他进程的写入会在下次同步时补上
+            self._seen_generation = self.generation.current() if self.generation else None
+            conn = self._connect()
+            self._data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            rows = conn.execute(
+                "SELECT id, doc_id, kb_type, tags, source, content, chunk_hash FROM chunks"
+            ).fetchall()
+            self._index_rows(rows)
+            self._loaded = True
+            logger.info(f"Keyword index loaded: {len(self._chunks)} chunks")
+
+    def _index_rows(self, rows: Iterable[tuple]):
+        for chunk_id, doc_id, kb_type, tags, source, content, chunk_hash in rows:
+            self._index(chunk_id, {
+                "doc_id": doc_id,
+                "kb_type": kb_type,
+                "tags": json.loads(tags),
+                "source": source,
+                "content": content,
+                "chunk_hash": chunk_hash
+            })
+
+    def _sync(self, force: bool = False):
+        """
+        同步其他进程对 SQLite 的修改
+        force 为 False 时只在知识库版本号变化后检查（检索路径每次只需一次 stat）；
+        删除前强制检查，避免漏删其他进程写入的切片。
+        """
+        self._ensure_loaded()
+        generation = self.generation.current() if self.generation else None
+        if not force and self.generation and generation == self._seen_generation:
+            return
+        with self._lock:
+            self._seen_generation = generation
+            conn = self._connect()
+            # 本连接自己的提交不会改变 data_version
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return
+            self._data_version = version
+            ids = {row[0] for row in conn.execute("SELECT id FROM chunks")}
+            removed = [i for i in self._chunks if i not in ids]
+            added = sorted(ids.difference(self._chunks))
+            self._unindex(removed)
+            for i in range(0, len(added), self.SYNC_BATCH):
+                batch = added[i:i + self.SYNC_BATCH]
+                self._index_rows(conn.execute(
+                    "SELECT id, doc_id, kb_type, tags, source, content, chunk_hash FROM chunks "
+                    f"WHERE id IN ({','.join('?' * len(batch))})",
+                    batch
+                ))
+            if removed or added:
+                logger.info(f"Keyword index synced: +{len(added)} -{len(removed)} chunks from other processes")
+
+    def _index(self, chunk_id: int, chunk: Dict[str, Any]):
+        terms = Counter(tokenize(chunk["content"]))
+        self._chunks[chunk_id] = chunk
+        self._lengths[chunk_id] = sum(terms.values())
+        self._total_length += self._lengths[chunk_id]
+        self._by_doc.setdefault(chunk["doc_id"], []).append(chunk_id)
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[chunk_id] = tf
+
+    def _add_chunks(self, chunks: List[Dict[str, Any]]):
+        if not chunks:
+            return
+        self._ensure_loaded()
+        with self._lock:
+            conn = self._connect()
+            for c in chunks:
+                chunk = {
+                    "doc_id": c["doc_id"],
+                    "kb_type": c["kb_type"],
+                    "tags": c["tags"] or [],
+                    "source": c["source"],
+                    "content": c["content"],
+                    "chunk_hash": c.get("chunk_hash")
+                }
+                cursor = conn.execute(
+                    "INSERT INTO chunks (doc_id, kb_type, tags, source, content, chunk_hash) VALUES (?, ?, ?, ?, ?, ?)",
+                    (chunk["doc_id"], chunk["kb_type"], json.dumps(chunk["tags"], ensure_ascii=False),
+                     chunk["source"], chunk["content"], chunk["chunk_hash"])
+                )
+                self._index(cursor.lastrowid, chunk)
+            conn.commit()
+
+    def _unindex(self, chunk_ids: List[int]):
+        removed = set(chunk_ids)
+        docs = set()
+        for chunk_id in chunk_ids:
+            chunk = self._chunks.pop(chunk_id)
+            docs.add(chunk["doc_id"])
+            self._total_length -= self._lengths.pop(chunk_id)
+            for term in set(tokenize(chunk["content"])):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self._postings[term]
+        for doc_id in docs:
+            kept = [i for i in self._by_doc.get(doc_id, []) if i not in removed]
+            if kept:
+                self._by_doc[doc_id] = kept
+            else:
+                self._by_doc.pop(doc_id, None)
+
+    def _delete(self, doc_id: int, chunk_hashes: Optional[Set[str]] = None):
+        """删除文档的切片；给定 chunk_hashes 时只删除哈希匹配的切片"""
+        self._sync(force=True)
+        with self._lock:
+            conn = self._connect()
+            chunk_ids = self._by_doc.get(doc_id, [])
+            if chunk_hashes is None:
+                removed = list(chunk_ids)
+            else:
+                removed = [i for i in chunk_ids if self._chunks[i]["chunk_hash"] in chunk_hashes]
+            if not removed:
+                return
+            conn.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in removed])
+            conn.commit()
+            self._unindex(removed)
+
+    def _allowed(self, chunk: Dict[str, Any], kb_types: Optional[Set[str]], tags: Optional[Set[str]]) -> bool:
+        if kb_types and chunk["kb_type"] not in kb_types:
+            return False
+        if tags and not tags.intersection(chunk["tags"]):
+            return False
+        return True
+
+    def _search(
+        self,
+        query: str,
+        limit: int,
+        kb_types: Optional[List[str]],
+        tags: Optional[List[str]]
+    ) -> List[Dict[str, Any]]:
+        self._sync()
+        terms = set(tokenize(query))
+        kb_filter = set(kb_types) if kb_types else None
+        tag_filter = set(tags) if tags else None
+
+        with self._lock:
+            n = len(self._chunks)
+            if not n or not terms:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    norm = self.K1 * (1 - self.B + self.B * self._lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+
+            ranked = (
+                (score, chunk_id) for chunk_id, score in scores.items()
+                if self._allowed(self._chunks[chunk_id], kb_filter, tag_filter)
+            )
+            results = []
+            for score, chunk_id in heapq.nlargest(limit, ranked):
+                chunk = self._chunks[chunk_id]
+                results.append({
+                    "content": chunk["content"],
+                    "doc_id": chunk["doc_id"],
+                    "kb_type": chunk["kb_type"],
+                    "source": chunk["source"],
+                    "score": score
+                })
+            return results
+
+keyword_index = KeywordIndex(settings.KEYWORD_INDEX_PATH, knowledge_generation)
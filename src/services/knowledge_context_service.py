@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict, List, Tuple
+from sqlalchemy.future import select
+from src.config.settings import settings
+from src.models.database import AsyncSessionLocal
+from src.models.tables import Session
+from src.services.retrieval_cache import knowledge_generation
+from src.services.retrieval_service import retrieval_service
+from src.utils.tokens import estimate_tokens
+
+logger = logging.getLogger("healthy_rag")
+
+# (知识库类型, 报告输入中的小标题)，按优先级排列：token 预算不足时优先保留安全须知
+KB_SECTIONS = [("safety", "安全须知"), ("science", "健康科普"), ("product", "相关产品")]
+
+class KnowledgeContextService:
+    """
+    会话级 RAG 上下文
+    - 赛道锁定后按知识库类型分别构造查询，检索结果（doc_id / 来源 / 内容）缓存在 meta_data["rag"] 中
+    - 每种类型记录查询指纹（查询文本 + 知识库版本），只有指纹变化的类型才重新检索
+    - 渲染时按 RAG_CONTEXT_MAX_TOKENS 截断，供报告输入使用
+    """
+
+    def build_queries(self, meta: Dict[str, Any]) -> Dict[str, str]:
+        track = meta.get("track", "")
+        user_info = meta.get("user_info", "")
+        profile = meta.get("profile", "")
+        answers = " ".join(meta.get("answers", [])[-settings.RAG_QUERY_ANSWERS:])
+        return {
+            "safety": f"{track} {user_info} {profile} 禁忌 风险 注意事项".strip(),
+            "science": f"{track} {user_info} {answers}".strip(),
+            "product": f"{track} {profile} {answers}".strip(),
+        }
+
+    async def refresh(self, meta: Dict[str, Any]) -> Dict[str, Any]:
+        """返回更新后的 rag 缓存；检索失败的类型保留旧结果"""
+        cached = meta.get("rag") or {}
+        if not settings.RAG_ENABLED or not meta.get("track"):
+            return cached
+
+        generation = knowledge_generation.current()
+        stale = {}
+        for kb_type, query in self.build_queries(meta).items():
+            fingerprint = hashlib.sha1(f"{generation}|{query}".encode("utf-8")).hexdigest()[:16]
+            if cached.get(kb_type, {}).get("fingerprint") != fingerprint:
+                stale[kb_type] = (query, fingerprint)
+        if not stale:
+            return cached
+
+        # 各类型并发检索；查询向量经微批器合并为一次 API 调用
+        results = await asyncio.gather(*[
+            retrieval_service.search(
+                query=query,
+                limit=settings.RAG_CHUNKS_PER_TYPE,
+                kb_types=[kb_type],
+                mode=settings.RAG_SEARCH_MODE,
+                rerank=settings.RAG_RERANK
+            )
+            for kb_type, (query, _) in stale.items()
+        ], return_exceptions=True)
+
+        rag = dict(cached)
+        for (kb_type, (_, fingerprint)), found in zip(stale.items(), results):
+            if isinstance(found, Exception):
+                logger.warning(f"RAG retrieval for {kb_type} failed: {found}")
+                continue
+            rag[kb_type] = {
+                "fingerprint": fingerprint,
+                "chunks": [
+                    {"doc_id": r["doc_id"], "source": r["source"], "content": r["content"]}
+                    for r in found
+                ]
+            }
+        return rag
+
+    def render(self, rag: Dict[str, Any]) -> str:
+        """按优先级拼接知识片段，超出 token 预算的片段丢弃"""
+        budget = settings.RAG_CONTEXT_MAX_TOKENS
+        sections: List[str] = []
+        for kb_type, title in KB_SECTIONS:
+            lines = []
+            for chunk in rag.get(kb_type, {}).get("chunks", []):
+                line = f"- {chunk['content'].strip()}（来源：{chunk['source']}）"
+                cost = estimate_tokens(line)
+                if cost > budget:
+                    continue
+                budget -= cost
+                lines.append(line)
+            if lines:
+                sections.append(f"【{title}】\n" + "\n".join(lines))
+        return "\n".join(sections)
+
+    async def get_context(self, meta: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """返回 (知识上下文文本, 更新后的 rag 缓存)；不访问数据库，可与历史加载并发执行"""
+        rag = await self.refresh(meta)
+        return self.render(rag), rag
+
+    async def warm(self, session_id: int):
+        """在独立的数据库会话中预取并保存会话的 RAG 缓存（赛道锁定后 / 推测式预热时调用）"""
+        if not settings.RAG_ENABLED:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                session = (await db.execute(select(Session).where(Session.id == session_id))).scalars().first()
+                if not session or not session.meta_data or not session.meta_data.get("track"):
+                    return
+                rag = await self.refresh(session.meta_data)
+                if rag != session.meta_data.get("rag"):
+                    meta = dict(session.meta_data)
+                    meta["rag"] = rag
+                    session.meta_data = meta
+                    await db.commit()
+        except Exception as e:
+            logger.warning(f"Failed to warm RAG context for session {session_id}: {e}")
+
+knowledge_context_service = KnowledgeContextService()
@@ -1,28 +1,35 @@
 import os
-import io
 import asyncio
-from typing import List, Dict, Any
+import logging
+import tempfile
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-import pypdf
-import docx
-import openpyxl
+from sqlalchemy import select, delete
 
-from src.models.tables.knowledge import KnowledgeFile, FileStatus
+from src.config.settings import settings
+from src.models.tables.knowledge import KnowledgeFile, KnowledgeChunk, FileStatus
 from src.services.oss_service import OSSService
 from src.services.volc_service import VolcService
-from src.services.vector_service import VectorService
+from src.services.vector_service import vector_service
+from src.services.keyword_index import keyword_index
+from src.services.retrieval_service import retrieval_service
+from src.services.embedding_pipeline import EmbeddingScheduler
+from src.services.ingestion_pipeline import IngestionPipeline
+
+logger = logging.getLogger("healthy_rag")
 
 class KnowledgeService:
     def __init__(self, db: AsyncSession):
         self.db = db
         self.oss = OSSService()
         self.volc = VolcService()
-        self.vector = VectorService()
+        self.vector = vector_service
+        self.embedder = EmbeddingScheduler(self.volc.get_embeddings)
+        self.pipeline = IngestionPipeline(self.embedder, self.vector, keyword_index)
 
     async def process_file_background(self, file_id: int):
-        """后台处理文件：下载 -> 解析 -> 向量化 -> 存储"""
+        """后台处理文件：下载 -> 流式（解析 -> 切片 -> 向量化 -> 存储），按切片哈希增量更新"""
+        tmp_path = None
+        added = set()
         try:
             # 1. 获取文件记录
             result = await self.db.execute(select(KnowledgeFile).where(KnowledgeFile.id == file_id))
@@ -34,83 +41,101 @@ class KnowledgeService:
             file_record.status = FileStatus.processing
             await self.db.commit()
 
-            # 2. 下载文件
-            content = self.oss.download_file(file_record.oss_url)
-            
-            # 3. 提取文本
-            text_content = self._extract_text(content, file_record.filename)
-            
-            if not text_content.strip():
-                raise Exception("Empty text content extracted")
+            # 2. 已入库切片的哈希；没有哈希记录的旧数据无法比对，整体重建
+            known = set((await self.db.execute(
+                select(KnowledgeChunk.chunk_hash).where(KnowledgeChunk.file_id == file_id)
+            )).scalars().all())
+            if not known and file_record.version > 1:
+                await self.vector.delete_by_doc_id(file_id)
+                await keyword_index.delete_by_doc_id(file_id)
+            await self._remove_superseded(file_record)
 
-            # 4. 文本切片
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=500,
-                chunk_overlap=50,
-                separators=["\n\n", "\n", "。", "！", "？", " ", ""]
-            )
-            chunks = splitter.split_text(text_content)
+            # 3. 流式下载到临时文件（不在内存中保留整个文件）
+            suffix = os.path.splitext(file_record.filename)[1].lower()
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+                tmp_path = tmp.name
+                await asyncio.to_thread(
+                    self.oss.download_to_file, file_record.oss_url, tmp, settings.INGEST_DOWNLOAD_CHUNK_BYTES
+                )
 
-            # 5. 向量化 (分批处理)
-            batch_size = 10
-            vectors = []
-            for i in range(0, len(chunks), batch_size):
-                batch = chunks[i:i+batch_size]
-                batch_vectors = await self.volc.get_embeddings(batch)
-                vectors.extend(batch_vectors)
+            # 4. 流水线：边解析边切片，只向量化并写入新增的切片
+            doc = {
+                "doc_id": file_record.id,
+                "kb_type": file_record.kb_type.value,
+                "tags": file_record.tags,
+                "source": file_record.filename,
+            }
+            # 第一批切片写入后即可被检索到
+            ingested = await self.pipeline.run(
+                tmp_path, doc, on_first_batch=retrieval_service.invalidate, known_hashes=known
+            )
+            added = ingested["added"]
+            if not ingested["hashes"]:
+                raise Exception("Empty text content extracted")
 
-            # 6. 存储到 Weaviate
-            weaviate_chunks = []
-            for i, chunk in enumerate(chunks):
-                weaviate_chunks.append({
-                    "content": chunk,
-                    "doc_id": file_record.id,
-                    "kb_type": file_record.kb_type.value,
-                    "tags": file_record.tags,
-                    "source": file_record.filename,
-                    "vector": vectors[i]
-                })
-            
-            # 确保 Schema 存在
-            self.vector.init_schema()
-            self.vector.add_chunks(weaviate_chunks)
+            # 5. 先记录新增切片，再删除新版本中已消失的切片
+            self.db.add_all([KnowledgeChunk(file_id=file_id, chunk_hash=h) for h in added])
+            await self.db.commit()
+            added = set()
+            vanished = list(known - ingested["hashes"])
+            if vanished:
+                await self.vector.delete_chunks(file_id, vanished)
+                await keyword_index.delete_chunks(file_id, vanished)
+                for i in range(0, len(vanished), 500):
+                    await self.db.execute(delete(KnowledgeChunk).where(
+                        KnowledgeChunk.file_id == file_id,
+                        KnowledgeChunk.chunk_hash.in_(vanished[i:i + 500])
+                    ))
+            logger.info(
+                f"File {file_id} v{file_record.version}: {len(ingested['added'])} chunks added, "
+                f"{len(vanished)} removed, {len(ingested['hashes']) - len(ingested['added'])} unchanged"
+            )
 
-            # 7. 更新状态为完成
+            # 6. 更新状态为完成
             file_record.status = FileStatus.completed
             await self.db.commit()
+            retrieval_service.invalidate()
 
         except Exception as e:
-            print(f"Error processing file {file_id}: {e}")
+            logger.error(f"Error processing file {file_id}: {e}")
+            # 流水线失败时已自行撤回写入的切片；这里处理写入成功但未记录哈希的切片。
+            # 上一版本的切片保持不变，仍可检索
+            if added:
+                try:
+                    await self.vector.delete_chunks(file_id, list(added))
+                    await keyword_index.delete_chunks(file_id, list(added))
+                except Exception as cleanup_error:
+                    logger.warning(f"Failed to clean up partial chunks of file {file_id}: {cleanup_error}")
+            retrieval_service.invalidate()
             # 重新获取 session 避免 transaction 错误
             # 注意：在实际生产中，可能需要更好的错误恢复机制
             file_record.status = FileStatus.failed
             file_record.error_msg = str(e)
             await self.db.commit()
+        finally:
+            if tmp_path:
+                os.unlink(tmp_path)
 
-    def _extract_text(self, content: bytes, filename: str) -> str:
-        """根据文件扩展名提取文本."""
-        ext = os.path.splitext(filename)[1].lower()
-        file_stream = io.BytesIO(content)
-
-        if ext == '.pdf':
-            reader = pypdf.PdfReader(file_stream)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
-        elif ext in ['.docx', '.doc']:
-            doc = docx.Document(file_stream)
-            return "\n".join([para.text for para in doc.paragraphs])
-        elif ext == '.txt':
-            return content.decode('utf-8')
-        elif ext in ['.xlsx', '.xls']:
-            wb = openpyxl.load_workbook(file_stream)
-            text = ""
-            for sheet in wb.sheetnames:
-                ws = wb[sheet]
-                for row in ws.values:
-                    text += " ".join([str(cell) for cell in row if cell]) + "\n"
-            return text
-        else:
-            raise Exception(f"Unsupported file type: {ext}")
-
+    async def _remove_superseded(self, file_record: KnowledgeFile):
+        """清理同一逻辑文档 (filename + kb_type) 的旧记录（重新上传复用记录之前产生的重复记录）"""
+        result = await self.db.execute(select(KnowledgeFile).where(
+            KnowledgeFile.filename == file_record.filename,
+            KnowledgeFile.kb_type == file_record.kb_type,
+            # 只清理更早且不在处理中的记录，避免并发首次上传的两条记录互相删除
+            KnowledgeFile.id < file_record.id,
+            KnowledgeFile.status.notin_([FileStatus.uploading, FileStatus.processing])
+        ))
+        for old in result.scalars().all():
+            try:
+                await self.vector.delete_by_doc_id(old.id)
+                await keyword_index.delete_by_doc_id(old.id)
+            except Exception as e:
+                logger.warning(f"Failed to delete chunks of superseded file {old.id}: {e}")
+                continue
+            try:
+                self.oss.delete_file(old.object_key)
+            except Exception as e:
+                logger.warning(f"Failed to delete OSS file: {e}")
+            await self.db.execute(delete(KnowledgeChunk).where(KnowledgeChunk.file_id == old.id))
+            await self.db.delete(old)
+        await self.db.commit()
@@ -1,9 +1,15 @@
-import httpx
+import asyncio
+import json
 import logging
 import re
+import time
 from tenacity import retry, stop_after_attempt, wait_exponential
 from src.config.settings import settings
-from typing import List, Dict, Optional
+from src.services.http_client import http_client
+from src.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.services.admission import AdmissionController
+from src.utils.metrics import LatencyTracker, TokenUsageStats
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional
 
 logger = logging.getLogger("healthy_rag")
 
@@ -26,6 +32,46 @@ class LLMService:
         self.default_model = "deepseek-chat"  # Used as fallback/identifier
         self.reasoner_model = settings.DEEP_SEEK_MODEL_REASONER
 
+        # 每个 (provider, thinking_level) 的调用延迟（成功调用 + 对冲落败调用的下界），用于计算对冲阈值
+        self.latency: Dict[tuple, LatencyTracker] = {
+            (provider, level): LatencyTracker()
+            for provider in ("gemini", "deepseek")
+            for level in ("low", "high")
+        }
+
+        # 每个 provider 的 token 用量（含前缀缓存命中）
+        self.usage: Dict[str, TokenUsageStats] = {
+            provider: TokenUsageStats() for provider in ("gemini", "deepseek")
+        }
+
+        # 每个 provider 的熔断器：故障期间直接路由到备用 provider
+        self.breakers: Dict[str, CircuitBreaker] = {
+            provider: CircuitBreaker(
+                provider,
+                window_seconds=settings.LLM_BREAKER_WINDOW_SECONDS,
+                min_requests=settings.LLM_BREAKER_MIN_REQUESTS,
+                error_rate_threshold=settings.LLM_BREAKER_ERROR_RATE,
+                slow_rate_threshold=settings.LLM_BREAKER_SLOW_RATE,
+                open_seconds=settings.LLM_BREAKER_OPEN_SECONDS,
+                half_open_probes=settings.LLM_BREAKER_HALF_OPEN_PROBES
+            )
+            for provider in ("gemini", "deepseek")
+        }
+
+        # 每个 provider 的并发预算与优先级队列：对话优先，报告生成单独限流
+        self.admission: Dict[str, AdmissionController] = {
+            "gemini": AdmissionController(
+                "gemini",
+                max_concurrency=settings.LLM_GEMINI_MAX_CONCURRENCY,
+                class_limits={"report": settings.LLM_REPORT_MAX_CONCURRENCY}
+            ),
+            "deepseek": AdmissionController(
+                "deepseek",
+                max_concurrency=settings.LLM_DEEPSEEK_MAX_CONCURRENCY,
+                class_limits={"report": settings.LLM_REPORT_MAX_CONCURRENCY}
+            ),
+        }
+
     @retry(
         stop=stop_after_attempt(2), # Try Gemini twice before failing over
         wait=wait_exponential(multiplier=1, min=2, max=5)
@@ -55,17 +101,19 @@ class LLMService:
             }
         }
 
-        async with httpx.AsyncClient(timeout=self.gemini_timeout) as client:
-            logger.info(f"Calling Gemini API ({thinking_level} thinking)...")
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            result = response.json()
-            content = result["choices"][0]["message"]["content"].strip()
-            
-            # Strip <think> tags if present
-            content = re.sub(r"<think>.*?</think>", "", content, flags=re.DOTALL).strip()
-            
-            return content
+        logger.info(f"Calling Gemini API ({thinking_level} thinking)...")
+        response = await http_client.client.post(
+            url, json=payload, headers=headers, timeout=self.gemini_timeout
+        )
+        response.raise_for_status()
+        result = response.json()
+        self._record_usage("gemini", result.get("usage"))
+        content = result["choices"][0]["message"]["content"].strip()
+
+        # Strip <think> tags if present
+        content = re.sub(r"<think>.*?</think>", "", content, flags=re.DOTALL).strip()
+
+        return content
 
     @retry(
         stop=stop_after_attempt(2),
@@ -96,12 +144,14 @@ class LLMService:
         if temperature is not None:
             payload["temperature"] = temperature
 
-        async with httpx.AsyncClient(timeout=self.ds_timeout) as client:
-            logger.info(f"Calling DeepSeek API ({model})...")
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            result = response.json()
-            return result["choices"][0]["message"]["content"].strip()
+        logger.info(f"Calling DeepSeek API ({model})...")
+        response = await http_client.client.post(
+            url, json=payload, headers=headers, timeout=self.ds_timeout
+        )
+        response.raise_for_status()
+        result = response.json()
+        self._record_usage("deepseek", result.get("usage"))
+        return result["choices"][0]["message"]["content"].strip()
 
     async def chat_completion(
         self,
@@ -113,42 +163,433 @@ class LLMService:
         """
         Unified Chat Completion
         Prioritizes Gemini (with thinking_level).
-        Falls back to DeepSeek if Gemini fails.
+        Falls back to DeepSeek if Gemini fails, or hedges with DeepSeek in
+        parallel once Gemini is slower than the hedge delay.
         """
         
         # Construct messages
-        final_messages = []
-        if system_prompt:
-            final_messages.append({"role": "system", "content": system_prompt})
-        final_messages.extend(messages)
+        final_messages = self._build_messages(messages, system_prompt)
 
         # Determine config based on usage context
         # If model was passed as 'deepseek-reasoner', it implies high reasoning (Report)
         # If model was passed as 'deepseek-chat' or None, it implies low reasoning (Chat)
         
         effective_thinking_level = thinking_level
-        
-        # Try Gemini First
-        try:
-            return await self._call_gemini(
-                messages=final_messages,
-                thinking_level=effective_thinking_level
+        fallback_model, fallback_temp = self._fallback_params(effective_thinking_level)
+
+        def primary(admitted: Optional[asyncio.Event] = None) -> Awaitable[str]:
+            return self._run_provider(
+                "gemini",
+                effective_thinking_level,
+                lambda: self._call_gemini(
+                    messages=final_messages,
+                    thinking_level=effective_thinking_level
+                ),
+                admitted
             )
-        except Exception as e:
-            logger.error(f"Gemini API failed: {str(e)}. Falling back to DeepSeek.")
-            
-            # Fallback Logic
-            fallback_model = self.ds_chat_model
-            fallback_temp = 0.7
-            
-            if effective_thinking_level == "high":
-                fallback_model = self.ds_reasoner_model
-                fallback_temp = None # Reasoner doesn't support temperature
-            
-            return await self._call_deepseek(
+
+        async def fallback() -> str:
+            # 备用 provider 同样受熔断器保护；两个熔断器都打开时直接拒绝
+            if not self.breakers["deepseek"].allow_request():
+                raise CircuitOpenError("DeepSeek circuit open, no LLM provider available")
+            return await self._run_provider(
+                "deepseek",
+                effective_thinking_level,
+                lambda: self._call_deepseek(
+                    messages=final_messages,
+                    model=fallback_model,
+                    temperature=fallback_temp
+                )
+            )
+
+        if not self.breakers["gemini"].allow_request():
+            logger.warning("Gemini circuit open, routing directly to DeepSeek.")
+            return await fallback()
+
+        if not settings.LLM_HEDGE_ENABLED:
+            # Try Gemini First
+            try:
+                return await primary()
+            except Exception as e:
+                logger.error(f"Gemini API failed: {str(e)}. Falling back to DeepSeek.")
+                return await fallback()
+
+        return await self._hedged_call(
+            primary, fallback, self._hedge_delay(effective_thinking_level)
+        )
+
+    def _deadline(self, provider: str, thinking_level: str) -> float:
+        """单个 provider 调用（含重试）的总截止时间"""
+        if provider == "gemini":
+            return settings.GEMINI_DEADLINE_HIGH if thinking_level == "high" else settings.GEMINI_DEADLINE_LOW
+        return settings.DEEP_SEEK_DEADLINE_HIGH if thinking_level == "high" else settings.DEEP_SEEK_DEADLINE_LOW
+
+    def _request_class(self, thinking_level: str) -> str:
+        """high 思考等级对应报告生成，其余为交互式对话"""
+        return "report" if thinking_level == "high" else "chat"
+
+    def _slow_threshold(self, thinking_level: str) -> float:
+        """超过该耗时的成功调用计为慢调用（计入熔断统计）"""
+        return settings.LLM_BREAKER_SLOW_CALL_HIGH if thinking_level == "high" else settings.LLM_BREAKER_SLOW_CALL_LOW
+
+    def provider_health(self) -> List[Dict]:
+        """各 provider 的熔断状态与延迟统计（供管理后台查看）"""
+        health = []
+        for provider, breaker in self.breakers.items():
+            item = breaker.snapshot()
+            item["latency"] = {
+                level: self.latency[(provider, level)].snapshot()
+                for level in ("low", "high")
+            }
+            item["admission"] = self.admission[provider].snapshot()
+            item["usage"] = self.usage[provider].snapshot()
+            health.append(item)
+        return health
+
+    def _hedge_delay(self, thinking_level: str) -> float:
+        """
+        对冲阈值：主 provider 样本足够时取观测分位数（不低于配置的下限），否则使用配置的固定值
+        """
+        tracker = self.latency[("gemini", thinking_level)]
+        if thinking_level == "high":
+            default, floor = settings.LLM_HEDGE_DELAY_HIGH, settings.LLM_HEDGE_MIN_DELAY_HIGH
+        else:
+            default, floor = settings.LLM_HEDGE_DELAY_LOW, settings.LLM_HEDGE_MIN_DELAY_LOW
+        if tracker.count < settings.LLM_HEDGE_MIN_SAMPLES:
+            return default
+        return max(floor, tracker.percentile(settings.LLM_HEDGE_PERCENTILE) or default)
+
+    async def _run_provider(
+        self,
+        provider: str,
+        thinking_level: str,
+        call: Callable[[], Awaitable[str]],
+        admitted: Optional[asyncio.Event] = None
+    ) -> str:
+        """
+        获取并发名额后，在截止时间内执行一次 provider 调用，并记录延迟与熔断统计
+        排队等待时间不计入截止时间与延迟统计；拿到名额时设置 admitted（供对冲计时）。
+        """
+        breaker = self.breakers[provider]
+        try:
+            async with self.admission[provider].slot(self._request_class(thinking_level)):
+                start = time.monotonic()
+                if admitted is not None:
+                    admitted.set()
+                try:
+                    result = await asyncio.wait_for(call(), timeout=self._deadline(provider, thinking_level))
+                except asyncio.TimeoutError:
+                    breaker.record_failure("deadline exceeded", time.monotonic() - start)
+                    raise TimeoutError(f"{provider} exceeded {thinking_level} deadline")
+                except asyncio.CancelledError:
+                    # 对冲落败被取消时实际延迟至少为已耗时间，按下界计入样本；
+                    # 否则分位数只由获胜的较快调用构成，阈值会越来越低。
+                    # 未超过当前阈值就被取消（如客户端断开）的调用不提供信息，不记录
+                    elapsed = time.monotonic() - start
+                    if elapsed >= self._hedge_delay(thinking_level):
+                        self.latency[(provider, thinking_level)].record(elapsed)
+                    raise
+                except Exception as e:
+                    breaker.record_failure(str(e), time.monotonic() - start)
+                    raise
+        except asyncio.CancelledError:
+            # 对冲落败（或排队中）被取消，不计入成功或失败
+            breaker.release()
+            raise
+
+        elapsed = time.monotonic() - start
+        self.latency[(provider, thinking_level)].record(elapsed)
+        breaker.record_success(elapsed, slow=elapsed > self._slow_threshold(thinking_level))
+        return result
+
+    async def _hedged_call(
+        self,
+        primary: Callable[[asyncio.Event], Awaitable[str]],
+        fallback: Callable[[], Awaitable[str]],
+        delay: float
+    ) -> str:
+        """
+        对冲请求：先发主请求；主请求拿到并发名额后超过 delay 未返回则并行发起备用请求，
+        取先成功的结果并取消另一个。主请求提前失败时立即切换备用。
+        对冲计时与延迟样本口径一致，都不含排队时间。
+        """
+        admitted = asyncio.Event()
+        tasks = [asyncio.ensure_future(primary(admitted))]
+        try:
+            admission = asyncio.ensure_future(admitted.wait())
+            try:
+                await asyncio.wait([tasks[0], admission], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                admission.cancel()
+            if not tasks[0].done():
+                await asyncio.wait(tasks, timeout=delay)
+            if tasks[0].done():
+                try:
+                    return tasks[0].result()
+                except Exception as e:
+                    logger.error(f"Gemini API failed: {str(e)}. Falling back to DeepSeek.")
+                    return await fallback()
+
+            logger.warning(f"Gemini slower than {delay:.1f}s, hedging with DeepSeek.")
+            tasks.append(asyncio.ensure_future(fallback()))
+            pending = set(tasks)
+            last_error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    logger.error(f"Hedged LLM call failed: {str(last_error)}")
+            raise last_error
+        finally:
+            # 取消落败或仍在进行的请求
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _build_messages(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str]
+    ) -> List[Dict[str, str]]:
+        final_messages = []
+        if system_prompt:
+            final_messages.append({"role": "system", "content": system_prompt})
+        final_messages.extend(messages)
+        return final_messages
+
+    def _fallback_params(self, thinking_level: str):
+        """DeepSeek 兜底时使用的模型与温度"""
+        if thinking_level == "high":
+            return self.ds_reasoner_model, None  # Reasoner doesn't support temperature
+        return self.ds_chat_model, 0.7
+
+    def _record_usage(self, provider: str, usage: Optional[Dict]):
+        """
+        记录 provider 返回的 usage
+        DeepSeek 使用 prompt_cache_hit_tokens；OpenAI 兼容接口使用 prompt_tokens_details.cached_tokens
+        """
+        if not usage:
+            return
+        cached = usage.get("prompt_cache_hit_tokens")
+        if cached is None:
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+        prompt_tokens = usage.get("prompt_tokens", 0) or 0
+        completion_tokens = usage.get("completion_tokens", 0) or 0
+        self.usage[provider].record(prompt_tokens, completion_tokens, cached or 0)
+        logger.info(
+            f"{provider} usage: prompt={prompt_tokens} (cached={cached or 0}), completion={completion_tokens}"
+        )
+
+    async def _stream_completion(
+        self,
+        provider: str,
+        url: str,
+        headers: Dict[str, str],
+        payload: Dict,
+        timeout: float
+    ) -> AsyncIterator[str]:
+        """
+        OpenAI 兼容的流式接口 (SSE)，逐段产出 delta.content
+        最后一个 chunk 携带的 usage 会被记录（需要 stream_options.include_usage）
+        """
+        async with http_client.client.stream(
+            "POST", url, json=payload, headers=headers, timeout=timeout
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                if not data:
+                    continue
+                chunk = json.loads(data)
+                if chunk.get("usage"):
+                    self._record_usage(provider, chunk["usage"])
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    yield delta
+
+    async def _stream_gemini(
+        self,
+        messages: List[Dict[str, str]],
+        thinking_level: str = "low",
+        temperature: float = 1.0
+    ) -> AsyncIterator[str]:
+        if not self.gemini_api_key:
+            raise ValueError("Gemini API Key not configured")
+
+        payload = {
+            "model": self.gemini_model,
+            "messages": messages,
+            "max_tokens": 4000,
+            "temperature": temperature,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+            "extra_body": {
+                "thinking_level": thinking_level
+            }
+        }
+        headers = {
+            "Authorization": f"Bearer {self.gemini_api_key}",
+            "Content-Type": "application/json"
+        }
+
+        logger.info(f"Streaming Gemini API ({thinking_level} thinking)...")
+        stream = self._stream_completion(
+            "gemini", f"{self.gemini_base_url}/chat/completions", headers, payload, self.gemini_timeout
+        )
+        # Strip <think> tags if present
+        async for piece in _strip_think_stream(stream):
+            yield piece
+
+    async def _stream_deepseek(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        if not self.ds_api_key:
+            raise ValueError("DeepSeek API Key not configured")
+
+        payload = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": 4000,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+        if temperature is not None:
+            payload["temperature"] = temperature
+        headers = {
+            "Authorization": f"Bearer {self.ds_api_key}",
+            "Content-Type": "application/json"
+        }
+
+        logger.info(f"Streaming DeepSeek API ({model})...")
+        async for piece in self._stream_completion(
+            "deepseek", f"{self.ds_base_url}/v1/chat/completions", headers, payload, self.ds_timeout
+        ):
+            yield piece
+
+    async def chat_completion_stream(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: str = None,
+        thinking_level: str = "low"
+    ) -> AsyncIterator[str]:
+        """
+        流式 Chat Completion
+        优先 Gemini；若在产出第一个 token 之前失败，则切换到 DeepSeek。
+        已经开始输出后的失败直接抛出（无法无缝续写）。
+        """
+        final_messages = self._build_messages(messages, system_prompt)
+
+        if self.breakers["gemini"].allow_request():
+            started = False
+            try:
+                async for piece in self._track_stream(
+                    "gemini",
+                    thinking_level,
+                    self._stream_gemini(messages=final_messages, thinking_level=thinking_level)
+                ):
+                    started = True
+                    yield piece
+                return
+            except Exception as e:
+                if started:
+                    raise
+                logger.error(f"Gemini stream failed: {str(e)}. Falling back to DeepSeek.")
+        else:
+            logger.warning("Gemini circuit open, streaming from DeepSeek.")
+
+        if not self.breakers["deepseek"].allow_request():
+            raise CircuitOpenError("DeepSeek circuit open, no LLM provider available")
+
+        fallback_model, fallback_temp = self._fallback_params(thinking_level)
+        async for piece in self._track_stream(
+            "deepseek",
+            thinking_level,
+            self._stream_deepseek(
                 messages=final_messages,
                 model=fallback_model,
                 temperature=fallback_temp
             )
+        ):
+            yield piece
+
+    async def _track_stream(
+        self,
+        provider: str,
+        thinking_level: str,
+        stream: AsyncIterator[str]
+    ) -> AsyncIterator[str]:
+        """为流式调用占用并发名额，并记录熔断统计（以首 token 耗时作为延迟）"""
+        breaker = self.breakers[provider]
+        first_token_latency = None
+        start = time.monotonic()
+        try:
+            async with self.admission[provider].slot(self._request_class(thinking_level)):
+                start = time.monotonic()
+                async for piece in stream:
+                    if first_token_latency is None:
+                        first_token_latency = time.monotonic() - start
+                    yield piece
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端断开，不计入统计
+            breaker.release()
+            raise
+        except Exception as e:
+            breaker.record_failure(str(e), time.monotonic() - start)
+            raise
+
+        if first_token_latency is None:
+            first_token_latency = time.monotonic() - start
+        breaker.record_success(
+            first_token_latency,
+            slow=first_token_latency > self._slow_threshold(thinking_level)
+        )
+
+async def _strip_think_stream(stream: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    流式过滤 <think>...</think> 片段
+    标签可能跨多个 chunk，因此保留末尾可能是半个标签的字符直到下一段到达。
+    """
+    open_tag, close_tag = "<think>", "</think>"
+    buffer = ""
+    in_think = False
+
+    async for chunk in stream:
+        buffer += chunk
+        while buffer:
+            if in_think:
+                end = buffer.find(close_tag)
+                if end == -1:
+                    # 丢弃思考内容，只保留可能构成结束标签前缀的尾部
+                    buffer = buffer[-(len(close_tag) - 1):]
+                    break
+                buffer = buffer[end + len(close_tag):]
+                in_think = False
+            else:
+                start = buffer.find(open_tag)
+                if start == -1:
+                    keep = len(open_tag) - 1
+                    if len(buffer) > keep:
+                        yield buffer[:-keep]
+                        buffer = buffer[-keep:]
+                    break
+                if start > 0:
+                    yield buffer[:start]
+                buffer = buffer[start + len(open_tag):]
+                in_think = True
+
+    if buffer and not in_think:
+        yield buffer
 
 llm_service = LLMService()
@@ -0,0 +1,575 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set
+import numpy as np
+from src.services.ivf_index import IVFIndex
+
+logger = logging.getLogger("healthy_rag")
+
+_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+class LocalVectorStore:
+    """
+    进程内 NumPy 向量索引（与 VectorService 相同的异步接口，VECTOR_BACKEND=local 时启用）
+    - 向量归一化后按行存放在磁盘上的 .npy 文件中，通过 memmap 访问；可选 float16 / int8 量化
+    - doc_id / kb_type / tags 作为列存元数据，kb_type 与 tags 编码为位图，检索前先过滤
+    - 检索为分块矩阵乘 + argpartition 取 top-k，distance = 1 - cosine（与 Weaviate 默认一致）
+    - 追加写入，meta.json 原子提交；按 doc_id 删除只追加墓碑，墓碑比例过高时压缩
+    - index="ivf" 时数据量超过 min_rows 后启用 IVF 近似检索（见 IVFIndex）
+    """
+
+    COMPACT_RATIO = 0.3
+    SEARCH_BLOCK = 16384
+
+    def __init__(
+        self,
+        path: Path,
+        dtype: str = "float32",
+        index: str = "flat",
+        nlist: int = 0,
+        nprobe: int = 8,
+        min_rows: int = 10000
+    ):
+        if dtype not in _DTYPES:
+            raise ValueError(f"Unsupported LOCAL_VECTOR_DTYPE: {dtype}")
+        if index not in ("flat", "ivf"):
+            raise ValueError(f"Unsupported LOCAL_VECTOR_INDEX: {index}")
+        self.path = Path(path)
+        self.dtype = dtype
+        self._ivf = IVFIndex(nlist=nlist, nprobe=nprobe, min_rows=min_rows) if index == "ivf" else None
+        self._lock = threading.RLock()
+        self._loaded = False
+
+        self.dim: Optional[int] = None
+        self.count = 0
+        self._matrix: Optional[np.memmap] = None  # (capacity, dim)
+        self._scales = np.zeros(0, dtype=np.float32)  # int8 量化的逐行缩放系数
+        self._doc_ids = np.zeros(0, dtype=np.int64)
+        self._kb_bits = np.zeros(0, dtype=np.uint32)
+        self._tag_bits = np.zeros((0, 1), dtype=np.uint64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._records: List[Dict[str, Any]] = []  # content / source / kb_type / tags / chunk_hash
+        self._kb_vocab: List[str] = []
+        self._tag_vocab: List[str] = []
+        self._gen = 0  # 压缩代数
+        self._records_bytes = 0  # 已提交的 records 文件长度
+        self._tombstones = 0  # 已提交的墓碑数
+        self._ivf_gen = 0
+        self._ivf_rows = 0  # 已提交的簇分配行数
+        self._training = False  # 是否有线程正在锁外训练新的 IVF 索引
+
+    # --- 与 VectorService 一致的异步接口 ---
+
+    async def start(self):
+        await asyncio.to_thread(self._ensure_loaded)
+
+    async def close(self):
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+
+    async def health(self) -> Dict[str, Any]:
+        return {"connected": self._loaded, "ready": self._loaded, "reconnects": 0}
+
+    async def init_schema(self):
+        await asyncio.to_thread(self._ensure_loaded)
+
+    async def add_chunks(self, chunks: List[Dict[str, Any]]):
+        """批量添加切片."""
+        await asyncio.to_thread(self._add_chunks, chunks)
+
+    async def search(
+        self,
+        query_vector: List[float],
+        limit: int = 5,
+        kb_types: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """向量检索."""
+        results = await asyncio.to_thread(self._search, [query_vector], limit, kb_types, tags)
+        return results[0]
+
+    async def search_many(
+        self,
+        query_vectors: List[List[float]],
+        limit: int = 5,
+        kb_types: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """批量向量检索：一次过滤 + 一次矩阵乘"""
+        if not query_vectors:
+            return []
+        return await asyncio.to_thread(self._search, query_vectors, limit, kb_types, tags)
+
+    async def delete_by_doc_id(self, doc_id: int):
+        """删除指定文档的所有切片."""
+        await asyncio.to_thread(self._delete, doc_id)
+
+    async def delete_chunks(self, doc_id: int, chunk_hashes: List[str]):
+        """删除指定文档中给定内容哈希的切片（增量更新时删除已消失的切片）"""
+        await asyncio.to_thread(self._delete, doc_id, set(chunk_hashes))
+
+    def iter_chunks(self) -> Iterator[Dict[str, Any]]:
+        """遍历全部存活切片（不含向量）；同步调用，供重建关键词索引等离线脚本使用"""
+        self._ensure_loaded()
+        with self._lock:
+            rows = np.flatnonzero(self._alive)
+            doc_ids, records = self._doc_ids, self._records
+        for i in rows:
+            yield {"doc_id": int(doc_ids[i]), **records[i]}
+
+    # --- 存储 ---
+    # 文件布局（gen 为压缩代数，压缩时整体换一套新文件）：
+    #   vectors.{gen}.npy     向量矩阵（memmap，按容量预分配）
+    #   records.{gen}.jsonl   逐行元数据：doc_id / scale / content / source / kb_type / tags / chunk_hash
+    #   tombstones.{gen}.bin  已删除的行号 (int64)
+    #   ivf.{n}.npz / ivf.{n}.assign  IVF 簇中心 / 逐行簇分配 (int32)，每次训练换一套新文件
+    # 除整体重写外所有文件只追加；最后原子替换 meta.json 提交各文件的有效长度，
+    # 加载时截掉未提交的尾部，追加时也从已提交的位置开始写。
+
+    FORMAT = 2
+
+    def _file(self, name: str) -> Path:
+        return self.path / name
+
+    def _vectors_file(self) -> Path:
+        return self._file(f"vectors.{self._gen}.npy")
+
+    def _records_file(self) -> Path:
+        return self._file(f"records.{self._gen}.jsonl")
+
+    def _tombstones_file(self) -> Path:
+        return self._file(f"tombstones.{self._gen}.bin")
+
+    def _ivf_files(self):
+        return self._file(f"ivf.{self._ivf_gen}.npz"), self._file(f"ivf.{self._ivf_gen}.assign")
+
+    def _reset(self):
+        self.dim = None
+        self.count = 0
+        self._matrix = None
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._doc_ids = np.zeros(0, dtype=np.int64)
+        self._kb_bits = np.zeros(0, dtype=np.uint32)
+        self._tag_bits = np.zeros((0, 1), dtype=np.uint64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._records = []
+        self._kb_vocab = []
+        self._tag_vocab = []
+        self._gen = 0
+        self._records_bytes = 0
+        self._tombstones = 0
+        self._ivf_gen = 0
+        self._ivf_rows = 0
+        if self._ivf is not None:
+            self._ivf.reset()
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._reset()
+            self.path.mkdir(parents=True, exist_ok=True)
+            meta_file = self._file("meta.json")
+            if meta_file.exists():
+                meta = json.loads(meta_file.read_text(encoding="utf-8"))
+                if meta.get("format") != self.FORMAT:
+                    raise ValueError(f"Unsupported local vector store format in {self.path}, please rebuild it")
+                if meta["dtype"] != self.dtype:
+                    raise ValueError(f"Local vector store was built with dtype {meta['dtype']}, configured {self.dtype}")
+                self.dim = meta["dim"]
+                self._gen = meta["generation"]
+                self._records_bytes = meta["records_bytes"]
+                self._tombstones = meta["tombstones"]
+                self._load_rows(meta["count"])
+                ivf = meta.get("ivf")
+                if self._ivf is not None and ivf:
+                    self._ivf_gen = ivf["generation"]
+                    self._ivf_rows = ivf["rows"]
+                    centroids_file, assign_file = self._ivf_files()
+                    self._truncate(assign_file, self._ivf_rows * 4)
+                    self._ivf.load(centroids_file, np.fromfile(assign_file, dtype=np.int32, count=self._ivf_rows))
+            self._remove_stale_files()
+            self._loaded = True
+            logger.info(f"Local vector store loaded: {self.count} rows ({self.dtype}) from {self.path}")
+
+    def _load_rows(self, count: int):
+        # 截掉崩溃或写入失败留下的未提交数据，之后的追加从已提交位置开始
+        self._truncate(self._records_file(), self._records_bytes)
+        self._truncate(self._tombstones_file(), self._tombstones * 8)
+        if not count:
+            return
+        with open(self._records_file(), "rb") as f:
+            lines = f.read().splitlines()
+        if len(lines) != count:
+            raise ValueError(f"Local vector store is corrupted: {len(lines)} records for {count} rows")
+        records = [json.loads(line) for line in lines]
+        doc_ids = np.asarray([r.pop("doc_id") for r in records], dtype=np.int64)
+        scales = np.asarray([r.pop("scale") for r in records], dtype=np.float32)
+        self._matrix = np.load(self._vectors_file(), mmap_mode="r+")
+        self._append_metadata(doc_ids, scales, records)
+        if self._tombstones:
+            dead = np.fromfile(self._tombstones_file(), dtype=np.int64, count=self._tombstones)
+            self._alive[dead] = False
+
+    def _truncate(self, path: Path, size: int):
+        if path.exists() and path.stat().st_size > size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+
+    def _append(self, path: Path, offset: int, data: bytes) -> int:
+        """从已提交的 offset 处追加写入，返回新的文件长度"""
+        self._truncate(path, offset)
+        with open(path, "ab") as f:
+            f.write(data)
+            f.flush()
+        return offset + len(data)
+
+    def _commit(self):
+        """原子替换 meta.json，提交当前各文件的有效长度"""
+        ivf = None
+        if self._ivf is not None and self._ivf.trained:
+            ivf = {"generation": self._ivf_gen, "rows": self._ivf_rows}
+        meta = {
+            "format": self.FORMAT,
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "generation": self._gen,
+            "count": self.count,
+            "records_bytes": self._records_bytes,
+            "tombstones": self._tombstones,
+            "ivf": ivf,
+        }
+        tmp = self._file("meta.tmp.json")
+        tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self._file("meta.json"))
+
+    def _remove_stale_files(self):
+        """删除未被 meta.json 引用的文件（旧代数据、中途失败的压缩/训练留下的文件）"""
+        current = {self._vectors_file().name, self._records_file().name, self._tombstones_file().name, "meta.json"}
+        if self._ivf is not None and self._ivf.trained:
+            current.update(f.name for f in self._ivf_files())
+        for f in self.path.iterdir():
+            if f.name not in current and f.name.split(".")[0] in ("vectors", "records", "tombstones", "ivf", "meta"):
+                f.unlink()
+
+    def _ensure_capacity(self, needed: int):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if capacity >= needed:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        tmp = self._file("vectors.tmp.npy")
+        matrix = np.lib.format.open_memmap(tmp, mode="w+", dtype=_DTYPES[self.dtype], shape=(new_capacity, self.dim))
+        if self.count:
+            matrix[:self.count] = self._matrix[:self.count]
+        matrix.flush()
+        del matrix
+        os.replace(tmp, self._vectors_file())
+        self._matrix = np.load(self._vectors_file(), mmap_mode="r+")
+
+    def _encode(self, vectors: np.ndarray):
+        """返回 (存储用矩阵, 缩放系数)"""
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+            return quantized, scales.astype(np.float32)
+        return vectors.astype(_DTYPES[self.dtype]), np.ones(len(vectors), dtype=np.float32)
+
+    def _bit(self, vocab: List[str], value: str) -> int:
+        if value not in vocab:
+            vocab.append(value)
+        return vocab.index(value)
+
+    def _append_metadata(self, doc_ids: np.ndarray, scales: np.ndarray, records: List[Dict[str, Any]]):
+        """追加内存中的列存元数据（kb_type / tags 编码为位图）"""
+        kb_bits = np.zeros(len(records), dtype=np.uint32)
+        tag_indexes = []
+        for i, record in enumerate(records):
+            kb_bits[i] = 1 << self._bit(self._kb_vocab, record["kb_type"])
+            tag_indexes.append([self._bit(self._tag_vocab, t) for t in record["tags"]])
+        if len(self._kb_vocab) > 32:
+            raise ValueError("Local vector store supports at most 32 kb types")
+
+        words = max(1, (len(self._tag_vocab) + 63) // 64)
+        if self._tag_bits.shape[1] < words:
+            pad = np.zeros((self._tag_bits.shape[0], words - self._tag_bits.shape[1]), dtype=np.uint64)
+            self._tag_bits = np.hstack([self._tag_bits, pad])
+        tag_bits = np.zeros((len(records), words), dtype=np.uint64)
+        for i, indexes in enumerate(tag_indexes):
+            for t in indexes:
+                tag_bits[i, t // 64] |= np.uint64(1 << (t % 64))
+
+        self._scales = np.concatenate([self._scales, scales])
+        self._doc_ids = np.concatenate([self._doc_ids, doc_ids])
+        self._kb_bits = np.concatenate([self._kb_bits, kb_bits])
+        self._tag_bits = np.vstack([self._tag_bits, tag_bits])
+        self._alive = np.concatenate([self._alive, np.ones(len(records), dtype=bool)])
+        self._records.extend(records)
+        self.count += len(records)
+
+    def _record_lines(self, doc_ids: np.ndarray, scales: np.ndarray, records: List[Dict[str, Any]]) -> bytes:
+        return b"".join(
+            json.dumps({"doc_id": int(d), "scale": float(s), **r}, ensure_ascii=False).encode("utf-8") + b"\n"
+            for d, s, r in zip(doc_ids, scales, records)
+        )
+
+    def _add_chunks(self, chunks: List[Dict[str, Any]]):
+        if not chunks:
+            return
+        vectors = np.asarray([c["vector"] for c in chunks], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+
+        with self._lock:
+            self._ensure_loaded()
+            if self.dim is not None and vectors.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension mismatch: store has {self.dim}, got {vectors.shape[1]}")
+            try:
+                self._append_rows(chunks, vectors)
+            except BaseException:
+                # 内存状态可能只更新了一部分：丢弃，下次访问时从已提交的文件重新加载
+                self._loaded = False
+                raise
+            train = self._ivf is not None and not self._training and self._ivf.should_train(self.count)
+            if train:
+                self._training = True
+        if train:
+            try:
+                self._train_ivf()
+            finally:
+                self._training = False
+
+    def _append_rows(self, chunks: List[Dict[str, Any]], vectors: np.ndarray):
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        start = self.count
+        self._ensure_capacity(start + len(chunks))
+        encoded, scales = self._encode(vectors)
+        self._matrix[start:start + len(chunks)] = encoded
+        self._matrix.flush()
+
+        doc_ids = np.asarray([c["doc_id"] for c in chunks], dtype=np.int64)
+        records = [
+            {
+                "content": c["content"],
+                "source": c["source"],
+                "kb_type": c["kb_type"],
+                "tags": c["tags"] or [],
+                "chunk_hash": c.get("chunk_hash")
+            }
+            for c in chunks
+        ]
+        self._records_bytes = self._append(
+            self._records_file(), self._records_bytes, self._record_lines(doc_ids, scales, records)
+        )
+        self._append_metadata(doc_ids, scales, records)
+
+        if self._ivf is not None:
+            labels = self._ivf.add(start, vectors)
+            if labels is not None:
+                _, assign_file = self._ivf_files()
+                self._ivf_rows = self._append(assign_file, self._ivf_rows * 4, labels.tobytes()) // 4
+        self._commit()
+
+    def _train_ivf(self):
+        """
+        在快照上训练新索引：k-means 在锁外运行，训练期间检索与写入照常使用旧索引；
+        完成后补上训练期间追加的行再替换。期间发生过压缩（行号已重排）则放弃本次结果。
+        """
+        with self._lock:
+            count, gen = self.count, self._gen
+            matrix, scales = self._matrix, self._scales
+
+        def read(rows: np.ndarray) -> np.ndarray:
+            # 扩容会替换向量文件，但快照持有的旧 memmap 仍可读取前 count 行
+            return np.asarray(matrix[rows], dtype=np.float32) * scales[rows][:, None]
+
+        index = self._ivf.empty_copy()
+        index.train(count, read)
+
+        with self._lock:
+            if not self._loaded or self._gen != gen:
+                logger.info("Local vector store changed during IVF training, discarding the result")
+                return
+            if self.count > count:
+                index.add(count, self._read(np.arange(count, self.count)))
+            previous = self._ivf
+            self._ivf = index
+            try:
+                self._save_ivf()
+                self._commit()
+            except BaseException:
+                self._ivf = previous
+                self._loaded = False
+                raise
+            self._remove_stale_files()
+
+    def _save_ivf(self):
+        """训练/压缩后整体写出一套新的 IVF 文件（提交 meta.json 后旧文件才会被删除）"""
+        self._ivf_gen += 1
+        centroids_file, assign_file = self._ivf_files()
+        self._ivf.save(centroids_file)
+        self._ivf.assignments.astype(np.int32).tofile(assign_file)
+        self._ivf_rows = len(self._ivf.assignments)
+
+    def _delete(self, doc_id: int, chunk_hashes: Optional[Set[str]] = None):
+        with self._lock:
+            self._ensure_loaded()
+            if not self.count:
+                return
+            rows = (self._doc_ids == doc_id) & self._alive
+            if chunk_hashes is not None:
+                for i in np.flatnonzero(rows):
+                    if self._records[i].get("chunk_hash") not in chunk_hashes:
+                        rows[i] = False
+            if not rows.any():
+                return
+            try:
+                removed = np.flatnonzero(rows).astype(np.int64)
+                self._alive[removed] = False
+                dead = self.count - int(self._alive.sum())
+                if dead > self.count * self.COMPACT_RATIO:
+                    self._compact()
+                else:
+                    self._tombstones = self._append(
+                        self._tombstones_file(), self._tombstones * 8, removed.tobytes()
+                    ) // 8
+                    self._commit()
+            except BaseException:
+                self._loaded = False
+                raise
+
+    def _compact(self):
+        """丢弃墓碑行：写出新一代的向量与记录文件，提交 meta.json 后再删除旧文件"""
+        keep = np.flatnonzero(self._alive)
+        gen = self._gen + 1
+        vectors_file = self._file(f"vectors.{gen}.npy")
+        matrix = np.lib.format.open_memmap(
+            vectors_file, mode="w+", dtype=_DTYPES[self.dtype], shape=(max(len(keep), 1024), self.dim)
+        )
+        for s in range(0, len(keep), self.SEARCH_BLOCK):
+            rows = keep[s:s + self.SEARCH_BLOCK]
+            matrix[s:s + len(rows)] = self._matrix[rows]
+        matrix.flush()
+        del matrix
+
+        records = [self._records[i] for i in keep]
+        data = self._record_lines(self._doc_ids[keep], self._scales[keep], records)
+        with open(self._file(f"records.{gen}.jsonl"), "wb") as f:
+            f.write(data)
+
+        if self._ivf is not None and self._ivf.trained:
+            self._ivf.compact(keep)
+            self._save_ivf()
+
+        self._gen = gen
+        self._records_bytes = len(data)
+        self._tombstones = 0
+        self._matrix = np.load(vectors_file, mmap_mode="r+")
+        self._scales = self._scales[keep]
+        self._doc_ids = self._doc_ids[keep]
+        self._kb_bits = self._kb_bits[keep]
+        self._tag_bits = self._tag_bits[keep]
+        self._alive = self._alive[keep]
+        self._records = records
+        self.count = len(keep)
+        self._commit()
+        self._remove_stale_files()
+        logger.info(f"Local vector store compacted to {self.count} rows")
+
+    # --- 检索 ---
+
+    def _filter_mask(self, kb_types: Optional[List[str]], tags: Optional[List[str]]) -> np.ndarray:
+        """kb_types 之间为 OR，tags 之间为 OR（包含任一即可），两组条件之间为 AND"""
+        mask = self._alive.copy()
+        if kb_types:
+            bits = 0
+            for kb in kb_types:
+                if kb in self._kb_vocab:
+                    bits |= 1 << self._kb_vocab.index(kb)
+            mask &= (self._kb_bits & np.uint32(bits)) != 0
+        if tags:
+            wanted = np.zeros(self._tag_bits.shape[1], dtype=np.uint64)
+            for tag in tags:
+                if tag in self._tag_vocab:
+                    t = self._tag_vocab.index(tag)
+                    wanted[t // 64] |= np.uint64(1 << (t % 64))
+            mask &= ((self._tag_bits & wanted) != 0).any(axis=1)
+        return mask
+
+    def _read(self, rows: np.ndarray) -> np.ndarray:
+        """读取指定行并还原为 float32（int8 乘回缩放系数）"""
+        return np.asarray(self._matrix[rows], dtype=np.float32) * self._scales[rows][:, None]
+
+    def _score(self, queries: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """分块计算 (m, len(rows)) 的相似度矩阵，限制一次读入内存的向量行数"""
+        scores = np.empty((len(queries), len(rows)), dtype=np.float32)
+        for s in range(0, len(rows), self.SEARCH_BLOCK):
+            block_rows = rows[s:s + self.SEARCH_BLOCK]
+            block = np.asarray(self._matrix[block_rows], dtype=np.float32)
+            scores[:, s:s + len(block_rows)] = (queries @ block.T) * self._scales[block_rows]
+        return scores
+
+    def _search(
+        self,
+        query_vectors: List[List[float]],
+        limit: int,
+        kb_types: Optional[List[str]],
+        tags: Optional[List[str]],
+        nprobe: Optional[int] = None,
+        exact: bool = False
+    ) -> List[List[Dict[str, Any]]]:
+        """批量检索：多个查询共享同一次过滤与矩阵乘；IVF 可用时每个查询只对候选簇打分"""
+        self._ensure_loaded()
+        with self._lock:
+            if not self.count or limit <= 0:
+                return [[] for _ in query_vectors]
+            mask = self._filter_mask(kb_types, tags)
+            rows = np.flatnonzero(mask)
+            if rows.size == 0:
+                return [[] for _ in query_vectors]
+
+            queries = np.asarray(query_vectors, dtype=np.float32)
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            queries /= norms
+
+            if exact or self._ivf is None or not self._ivf.trained:
+                scores = self._score(queries, rows)
+                return [self._top_k(rows, row_scores, limit) for row_scores in scores]
+
+            results = []
+            for query in queries:
+                candidates = self._ivf.candidates(query, nprobe)
+                candidates = candidates[mask[candidates]]
+                # 过滤条件很严格时候选可能不足，退回精确检索
+                if len(candidates) < limit:
+                    candidates = rows
+                results.append(self._top_k(candidates, self._score(query[None, :], candidates)[0], limit))
+            return results
+
+    def _top_k(self, rows: np.ndarray, scores: np.ndarray, k: int) -> List[Dict[str, Any]]:
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            row = int(rows[i])
+            record = self._records[row]
+            results.append({
+                "content": record["content"],
+                "doc_id": int(self._doc_ids[row]),
+                "kb_type": record["kb_type"],
+                "source": record["source"],
+                "distance": float(1.0 - scores[i])
+            })
+        return results
@@ -197,3 +197,45 @@ class OSSService:
 
         return file_content
 
+    def download_to_file(self, url: str, file_obj: BinaryIO, chunk_size: int = 1024 * 1024) -> int:
+        """流式下载文件（通过URL或object_key）到 file_obj，按块写入避免整个文件驻留内存；返回字节数."""
+        object_key = self._resolve_object_key(url)
+        written = 0
+
+        if object_key is None:
+            # 不是我们的OSS，直接通过HTTP流式下载
+            import requests
+            with requests.get(url, timeout=60.0, stream=True) as response:
+                response.raise_for_status()
+                for block in response.iter_content(chunk_size=chunk_size):
+                    file_obj.write(block)
+                    written += len(block)
+            return written
+
+        self._ensure_configured()
+        result = self.bucket.get_object(object_key)
+        while True:
+            block = result.read(chunk_size)
+            if not block:
+                break
+            file_obj.write(block)
+            written += len(block)
+        return written
+
+    def _resolve_object_key(self, url: str) -> Optional[str]:
+        """从URL中提取object_key；不是本 bucket 的 URL 返回 None."""
+        if not url.startswith('http'):
+            return url
+
+        endpoint_domain = self.endpoint.replace('https://', '').replace('http://', '')
+        if not (self.bucket_name in url and endpoint_domain in url):
+            return None
+
+        parts = url.split(f'.{endpoint_domain}/')
+        if len(parts) > 1:
+            return unquote(parts[1].split('?')[0])  # 移除查询参数并解码
+        # 尝试另一种格式
+        parts = url.split(f'/{self.bucket_name}/')  # path style
+        if len(parts) > 1:
+            return unquote(parts[1].split('?')[0])
+        raise Exception(f"无法从URL提取object_key: {url}")
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+from src.config.settings import settings
+from src.services import document_parser
+
+logger = logging.getLogger("healthy_rag")
+
+def _next_timed(iterator, default):
+    started = time.thread_time()
+    item = next(iterator, default)
+    return item, time.thread_time() - started
+
+class _ParseTask:
+    """提交到进程池的解析任务，记录所在的进程池（进程池被重建时据此判断是否需要重新提交）"""
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+        self.future: Optional[Future] = None
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+class DocumentParsePool:
+    """
+    文档解析进程池
+    pypdf / python-docx / openpyxl 都是纯 Python 的 CPU 密集操作，放在线程里仍会持有 GIL，
+    解析大文件时拖慢整个事件循环上的对话请求；改为在独立进程中解析。
+    - 大 PDF 按 PARSE_PDF_SHARD_PAGES 页分片，多个进程并行解析，按页序产出
+    - 同时提交到进程池的任务不超过 workers 个，其余在事件循环中排队：提交即开始执行，
+      排队时间不计入超时（ProcessPoolExecutor 内部的 call queue 会把排队任务也标记为 running）
+    - 每个文件有整体超时，只累计其任务执行期间的时间；超时后终止工作进程（卡死的解析无法单独取消）
+      并重建进程池，其他文件随旧进程池被终止或取消的任务在新进程池中重新提交，不计入其超时
+    - 记录每个文档的子进程 CPU 时间与墙钟时间
+    PARSE_WORKERS 为 0 时退化为线程内逐段解析。
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.PARSE_WORKERS,
+        timeout: float = settings.PARSE_TIMEOUT_SECONDS,
+        shard_pages: int = settings.PARSE_PDF_SHARD_PAGES
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.shard_pages = max(1, shard_pages)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None  # 进程池中的在途任务名额
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=50)
+        self.documents = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.cpu_seconds = 0.0
+
+    def start(self):
+        if self.workers > 0 and self._executor is None:
+            # 使用 spawn：主进程中已有事件循环与多个线程池，fork 可能继承被持有的锁
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def close(self):
+        executor, self._executor = self._executor, None
+        self._slots = None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _recycle(self, executor: ProcessPoolExecutor):
+        """
+        终止 executor 的工作进程并重建进程池（超时或进程池损坏后调用）
+        executor 已不是当前进程池（已被其他文件重建过）时不做处理，避免连环终止新进程池
+        """
+        if executor is not self._executor:
+            return
+        self._executor = None
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+        self.start()
+
+    async def _submit(self, task: "_ParseTask") -> "_ParseTask":
+        """等到有空闲工作进程时再提交，保证提交后立即开始执行"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        slots = self._slots
+        await slots.acquire()
+        try:
+            if self._executor is None:
+                self.start()
+            task.executor = self._executor
+            task.future = task.executor.submit(task.fn, *task.args)
+        except BaseException:
+            slots.release()
+            raise
+        loop = asyncio.get_running_loop()
+        task.future.add_done_callback(lambda _: self._release(loop, slots))
+        return task
+
+    def _release(self, loop: asyncio.AbstractEventLoop, slots: asyncio.Semaphore):
+        # 在进程池的管理线程中回调
+        try:
+            loop.call_soon_threadsafe(slots.release)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    async def _result(self, task: "_ParseTask", clock: Dict[str, float]):
+        """等待结果，等待时间（任务提交后即在执行）从文件的超时预算中扣除"""
+        while True:
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(asyncio.wrap_future(task.future), max(0.0, clock["remaining"]))
+            except (BrokenProcessPool, asyncio.CancelledError) as e:
+                killed = isinstance(e, BrokenProcessPool) or task.future.cancelled()
+                if not killed or task.executor is self._executor:
+                    raise
+                # 进程池因其他文件超时被重建，本任务随旧进程池被终止/取消：
+                # 在新进程池中重新提交，被浪费的执行时间不计入本文件的超时
+                await self._submit(task)
+                continue
+            clock["remaining"] -= time.monotonic() - started
+            return result
+
+    async def iter_segments(self, path: str, filename: str) -> AsyncIterator[str]:
+        """按页序/文档顺序逐段产出文本；调用方负责在提前退出时 aclose()"""
+        ext = os.path.splitext(filename)[1].lower()
+        started = time.monotonic()
+        clock = {"remaining": self.timeout}
+        stats = {"filename": filename, "pages": None, "shards": 0, "cpu_seconds": 0.0}
+        pending: Deque[_ParseTask] = deque()
+        current: Optional[_ParseTask] = None
+        in_process = self.workers > 0 and ext != '.txt'
+        status = "failed"
+        try:
+            if not in_process:
+                # 纯文本解码开销很小，保持线程内流式读取
+                async for segment in self._iter_in_thread(path, filename, stats, started + self.timeout):
+                    yield segment
+            elif ext == '.pdf':
+                current = await self._submit(_ParseTask(document_parser.pdf_page_count, path))
+                pages, cpu = await self._result(current, clock)
+                stats["pages"] = pages
+                stats["cpu_seconds"] += cpu
+                shards = [(s, min(s + self.shard_pages, pages)) for s in range(0, pages, self.shard_pages)]
+                stats["shards"] = len(shards)
+                # 最多 workers 个分片在途：既能并行，又保留对下游的背压
+                next_shard = 0
+                while pending or next_shard < len(shards):
+                    while next_shard < len(shards) and len(pending) < self.workers:
+                        start, end = shards[next_shard]
+                        pending.append(await self._submit(_ParseTask(document_parser.parse_pdf_pages, path, start, end)))
+                        next_shard += 1
+                    current = pending.popleft()
+                    texts, cpu = await self._result(current, clock)
+                    stats["cpu_seconds"] += cpu
+                    for text in texts:
+                        yield text
+            else:
+                current = await self._submit(_ParseTask(document_parser.parse_document, path, filename))
+                segments, cpu = await self._result(current, clock)
+                stats["shards"] = 1
+                stats["cpu_seconds"] += cpu
+                for segment in segments:
+                    yield segment
+            status = "completed"
+        except asyncio.TimeoutError:
+            status = "timeout"
+            self.timeouts += 1
+            if current is not None:
+                # 卡死的解析无法单独取消，只能终止该任务所在进程池的工作进程
+                self._recycle(current.executor)
+            raise Exception(f"Parsing {filename} timed out after {self.timeout:.0f}s")
+        except (GeneratorExit, asyncio.CancelledError):
+            # 下游阶段失败或任务被取消，不计为解析失败
+            status = "cancelled"
+            raise
+        except BrokenProcessPool:
+            # 工作进程异常退出（如内存不足被杀），重建后让本文件失败
+            self._recycle(current.executor)
+            raise Exception(f"Parser process crashed while parsing {filename}")
+        finally:
+            for task in pending:
+                task.future.cancel()
+            if status == "failed":
+                self.failures += 1
+            self._record(stats, status, time.monotonic() - started)
+
+    async def _iter_in_thread(
+        self, path: str, filename: str, stats: Dict[str, Any], deadline: float
+    ) -> AsyncIterator[str]:
+        # 线程无法被终止，只能在片段之间检查超时
+        segments = document_parser.iter_text_segments(path, filename)
+        end = object()
+        while True:
+            segment, cpu = await asyncio.to_thread(_next_timed, segments, end)
+            stats["cpu_seconds"] += cpu
+            if segment is end:
+                break
+            stats["shards"] += 1
+            yield segment
+            if time.monotonic() > deadline:
+                raise asyncio.TimeoutError()
+
+    def _record(self, stats: Dict[str, Any], status: str, wall_seconds: float):
+        stats["status"] = status
+        stats["cpu_seconds"] = round(stats["cpu_seconds"], 3)
+        stats["wall_seconds"] = round(wall_seconds, 3)
+        self.documents += 1
+        self.cpu_seconds += stats["cpu_seconds"]
+        self._recent.append(stats)
+        logger.info(
+            f"Parsed {stats['filename']} ({status}): pages={stats['pages']} shards={stats['shards']} "
+            f"cpu={stats['cpu_seconds']:.2f}s wall={stats['wall_seconds']:.2f}s"
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": self._executor is not None,
+            "documents": self.documents,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "cpu_seconds": round(self.cpu_seconds, 3),
+            "recent": list(self._recent),
+        }
+
+parse_pool = DocumentParsePool()
@@ -58,6 +58,7 @@ Response Format (最终输出格式)
 
 【AI 思考】(这部分仅用于内部记录，不输出给用户)
 用户主诉: [用户输入]
+用户画像: [年龄/生命阶段] / [性别]
 锁定赛道: [赛道名称]
 当前问题编号: [1-5]
 总问题数: [3-5]
@@ -82,9 +83,7 @@ Role
 你是一名资深的【AI健康管理专家】。你的任务是基于用户的个人信息和问卷答案，生成一份结构清晰、通俗易懂、语气亲切的个性化健康报告。
 
 Input Data
-用户基本信息：{user_info}
-核心赛道：{track}
-问卷答案：{qa_pairs}
+用户的基本信息、核心赛道、问卷答案与知识库参考资料将在用户消息中提供（见 REPORT_INPUT）。
 
 Goal
 生成的内容将被直接渲染为可视化的 HTML 网页。你的任务是根据用户的具体情况，**动态设计**一份结构合理的健康报告。
@@ -163,3 +162,16 @@ Constraints
 3. 必须填充所有方括号 [] 中的内容。
 4. 不要添加任何额外的解释文字。
 """
+
+# 注意：REPORT_GENERATION 必须保持为不含任何用户数据的静态文本，
+# 以便作为字节完全一致的前缀命中 provider 侧的前缀缓存；用户数据统一放在 REPORT_INPUT 中追加在其后。
+REPORT_INPUT = """
+Input Data
+用户基本信息：{user_info}
+核心赛道：{track}
+问卷答案：{qa_pairs}
+知识库参考资料（仅在与用户情况相关时引用，安全须知须优先遵守；为空表示无）：
+{knowledge}
+
+请根据以上数据生成HTML报告。
+"""
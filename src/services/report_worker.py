@@ -0,0 +1,317 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from src.config.settings import settings
+from src.models.database import AsyncSessionLocal
+from src.models.tables import Report, ReportJob
+from src.utils.singleflight import SingleFlight
+
+logger = logging.getLogger("healthy_rag")
+
+class ReportWorkerPool:
+    """
+    报告生成后台任务池
+    - 任务持久化在 report_jobs 表中，进程重启后继续处理
+    - N 个 asyncio worker 通过条件 UPDATE（status='pending' → 'running'）认领任务，
+      多个 uvicorn 进程同时运行时也只有一个 worker 能认领成功
+    - running 状态的任务定期写心跳，心跳超时视为 worker 崩溃，任务重新入队
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._tasks: List[asyncio.Task] = []
+        # start_now 直接启动的任务（不占用 worker 名额）
+        self._adhoc: Set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running = False
+        # 进程内并发入队合并为一次；跨进程由 session_id 唯一约束兜底
+        self._enqueue_flight = SingleFlight()
+        # 本进程正在执行的会话 -> 结束事件（wait_for 无需轮询数据库）
+        self._local: Dict[int, asyncio.Event] = {}
+
+    async def start(self):
+        """启动 worker（应用启动时调用）"""
+        if self._running:
+            return
+        self._running = True
+        # 在运行中的事件循环里创建 Event（Python 3.9 会绑定创建时的 loop）
+        self._wakeup = asyncio.Event()
+        await self._recover()
+        for i in range(settings.REPORT_WORKER_COUNT):
+            self._tasks.append(asyncio.create_task(self._worker_loop(i)))
+        self._tasks.append(asyncio.create_task(self._maintenance_loop()))
+        logger.info(f"Report worker pool started ({settings.REPORT_WORKER_COUNT} workers, id={self.worker_id})")
+
+    async def stop(self):
+        """停止 worker（应用关闭时调用）；进行中的任务会因心跳超时被其他进程接管"""
+        self._running = False
+        tasks = self._tasks + list(self._adhoc)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._adhoc.clear()
+        logger.info("Report worker pool stopped")
+
+    def notify(self):
+        """唤醒空闲 worker 立即检查新任务"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def enqueue(self, session_id: int) -> int:
+        """
+        为会话创建报告任务（幂等），返回任务 id
+        已存在的 pending/running 任务保持不变；已结束（failed/completed）的任务重置为 pending，
+        调用方需保证报告处于 generating 状态（且已提交）。
+        """
+        job_id = await self._enqueue_flight.do(session_id, lambda: self._enqueue(session_id))
+        self.notify()
+        return job_id
+
+    async def _enqueue(self, session_id: int) -> int:
+        # 合并的并发调用方共享这次执行：使用独立会话，不借用其中某个请求的会话
+        async with AsyncSessionLocal() as db:
+            job = await self.get_job(db, session_id)
+            if job is None:
+                job = ReportJob(session_id=session_id, status="pending", progress=0, stage="排队中")
+                db.add(job)
+                try:
+                    await db.commit()
+                except IntegrityError:
+                    # 并发入队（可能来自其他进程），以已存在的任务为准
+                    await db.rollback()
+                    job = await self.get_job(db, session_id)
+                return job.id
+
+            # 手动重试是一次新的生成，重新计算自动重试次数；条件更新避免覆盖其他进程刚认领的任务
+            await db.execute(
+                update(ReportJob)
+                .where(ReportJob.id == job.id)
+                .where(ReportJob.status.in_(["failed", "completed"]))
+                .values(status="pending", progress=0, stage="排队中", error=None, worker_id=None, attempts=0)
+            )
+            await db.commit()
+            return job.id
+
+    async def start_now(self, session_id: int) -> bool:
+        """
+        立即在本进程认领并开始执行会话的报告任务，不等待 worker 轮询或空闲名额
+        认领失败（已被其他 worker 认领）时返回 False。
+        """
+        if not self._running:
+            return False
+        async with AsyncSessionLocal() as db:
+            job = await self.get_job(db, session_id)
+            if job is None:
+                return False
+            job_id = job.id
+        if not await self._claim(job_id):
+            return False
+
+        task = asyncio.create_task(self._run(job_id))
+        self._adhoc.add(task)
+        task.add_done_callback(self._adhoc.discard)
+        return True
+
+    async def wait_for(self, session_id: int, timeout: float):
+        """
+        等待会话的报告任务结束（或超时）
+        任务在本进程执行时直接等待其结束；否则轮询任务状态（任务可能在其他进程中执行）。
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            local = self._local.get(session_id)
+            if local is not None:
+                try:
+                    await asyncio.wait_for(local.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+                return
+
+            async with AsyncSessionLocal() as db:
+                job = await self.get_job(db, session_id)
+            if job is None or job.status in ("completed", "failed"):
+                return
+            await asyncio.sleep(min(1.0, remaining))
+
+    async def get_job(self, db: AsyncSession, session_id: int) -> Optional[ReportJob]:
+        # 任务状态由其他会话（worker、入队）更新：总是读取数据库中的最新值
+        result = await db.execute(
+            select(ReportJob)
+            .where(ReportJob.session_id == session_id)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalar_one_or_none()
+
+    # --- 内部实现 ---
+
+    async def _worker_loop(self, index: int):
+        while self._running:
+            try:
+                # 先清除信号再认领，避免认领期间到达的通知丢失
+                self._wakeup.clear()
+                job_id = await self._claim_next()
+                if job_id is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=settings.REPORT_WORKER_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Report worker {index} error: {e}")
+                await asyncio.sleep(settings.REPORT_WORKER_POLL_SECONDS)
+
+    async def _claim_next(self) -> Optional[int]:
+        """按创建顺序认领一个 pending 任务；条件更新失败说明已被其他 worker 抢先"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ReportJob.id)
+                .where(ReportJob.status == "pending")
+                .order_by(ReportJob.created_at, ReportJob.id)
+                .limit(5)
+            )
+            candidates = result.scalars().all()
+        for job_id in candidates:
+            if await self._claim(job_id):
+                return job_id
+        return None
+
+    async def _claim(self, job_id: int) -> bool:
+        """行级认领：仅当任务仍为 pending 时更新为 running"""
+        async with AsyncSessionLocal() as db:
+            now = datetime.utcnow()
+            claimed = await db.execute(
+                update(ReportJob)
+                .where(ReportJob.id == job_id)
+                .where(ReportJob.status == "pending")
+                .values(
+                    status="running",
+                    worker_id=self.worker_id,
+                    claimed_at=now,
+                    heartbeat_at=now,
+                    attempts=ReportJob.attempts + 1,
+                    stage="开始生成"
+                )
+            )
+            await db.commit()
+            return claimed.rowcount == 1
+
+    async def _run(self, job_id: int):
+        from src.services.business_service import business_service
+
+        heartbeat = asyncio.create_task(self._heartbeat_loop(job_id))
+        finished: Optional[asyncio.Event] = None
+        try:
+            async with AsyncSessionLocal() as db:
+                job = (await db.execute(select(ReportJob).where(ReportJob.id == job_id))).scalar_one()
+                finished = self._local.setdefault(job.session_id, asyncio.Event())
+
+                async def on_progress(progress: int, stage: str):
+                    await self._update_job(job_id, progress=progress, stage=stage)
+
+                logger.info(f"Generating report for session {job.session_id} (job {job_id}, attempt {job.attempts})")
+                await business_service.generate_report_content(db, job.session_id, on_progress=on_progress)
+
+            await self._update_job(job_id, status="completed", progress=100, stage="已完成")
+        except asyncio.CancelledError:
+            # 关闭中：保持 running，由心跳超时机制重新入队
+            raise
+        except Exception as e:
+            logger.error(f"Report job {job_id} failed: {e}")
+            await self._update_job(job_id, status="failed", stage="生成失败", error=str(e))
+        finally:
+            heartbeat.cancel()
+            if finished is not None:
+                finished.set()
+                self._local.pop(job.session_id, None)
+
+    async def _heartbeat_loop(self, job_id: int):
+        while True:
+            await asyncio.sleep(settings.REPORT_JOB_HEARTBEAT_SECONDS)
+            await self._update_job(job_id, heartbeat_at=datetime.utcnow())
+
+    async def _update_job(self, job_id: int, **values):
+        """使用独立会话更新任务状态，避免干扰报告生成事务"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ReportJob)
+                .where(ReportJob.id == job_id)
+                .where(ReportJob.worker_id == self.worker_id)
+                .values(**values)
+            )
+            await db.commit()
+
+    async def _maintenance_loop(self):
+        while self._running:
+            await asyncio.sleep(settings.REPORT_JOB_STALE_SECONDS / 2)
+            try:
+                await self._requeue_stale()
+            except Exception as e:
+                logger.error(f"Report job maintenance error: {e}")
+
+    async def _recover(self):
+        """启动时恢复：重新入队心跳超时的任务，并为遗留的 generating 报告补建任务"""
+        await self._requeue_stale()
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Report.session_id)
+                .outerjoin(ReportJob, Report.session_id == ReportJob.session_id)
+                .where(ReportJob.id.is_(None))
+            )
+            orphan_ids = result.scalars().all()
+            if not orphan_ids:
+                return
+            reports = (await db.execute(
+                select(Report).where(Report.session_id.in_(orphan_ids))
+            )).scalars().all()
+            for report in reports:
+                if report.content and report.content.get("status") == "generating":
+                    db.add(ReportJob(session_id=report.session_id, status="pending", progress=0, stage="排队中"))
+            await db.commit()
+
+    async def _requeue_stale(self):
+        """心跳超时的 running 任务：未超过重试次数则重新入队，否则标记失败"""
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.REPORT_JOB_STALE_SECONDS)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ReportJob)
+                .where(ReportJob.status == "running")
+                .where(ReportJob.heartbeat_at < cutoff)
+            )
+            stale_jobs = result.scalars().all()
+            for job in stale_jobs:
+                logger.warning(f"Report job {job.id} heartbeat timed out (worker {job.worker_id})")
+                if job.attempts < settings.REPORT_JOB_MAX_ATTEMPTS:
+                    job.status = "pending"
+                    job.worker_id = None
+                    job.stage = "重新排队"
+                    continue
+
+                job.status = "failed"
+                job.stage = "生成失败"
+                job.error = "Worker heartbeat timed out"
+                report = (await db.execute(
+                    select(Report).where(Report.session_id == job.session_id)
+                )).scalar_one_or_none()
+                if report and report.content and report.content.get("status") == "generating":
+                    report.content = {"status": "error", "error": job.error, "html": ""}
+            if stale_jobs:
+                await db.commit()
+
+report_worker = ReportWorkerPool()
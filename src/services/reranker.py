@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from src.config.settings import settings
+from src.services.keyword_index import tokenize
+from src.utils.metrics import LatencyTracker
+
+logger = logging.getLogger("healthy_rag")
+
+class Reranker(ABC):
+    """重排序模型接口：对 (query, passage) 打分，分数越高越相关；在线程池中同步执行"""
+
+    name: str = ""
+
+    def load(self):
+        """加载模型等资源（在线程池中调用）；默认无需准备"""
+
+    @abstractmethod
+    def score(self, query: str, passages: List[str]) -> List[float]:
+        ...
+
+class LexicalOverlapReranker(Reranker):
+    """
+    词面重合度打分（离线默认）：查询词覆盖率为主，命中词在切片中的密度为辅
+    分词与关键词索引一致，对药名、病名等精确术语敏感。
+    """
+
+    name = "lexical"
+
+    def score(self, query: str, passages: List[str]) -> List[float]:
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return [0.0] * len(passages)
+        scores = []
+        for passage in passages:
+            terms = Counter(tokenize(passage))
+            matched = [t for t in query_terms if t in terms]
+            coverage = len(matched) / len(query_terms)
+            density = sum(terms[t] for t in matched) / math.sqrt(1 + sum(terms.values()))
+            scores.append(coverage + 0.1 * density)
+        return scores
+
+class CrossEncoderReranker(Reranker):
+    """本地 cross-encoder 模型（可选依赖 sentence-transformers，应用启动时或首次使用时在线程池中加载一次）"""
+
+    def __init__(self, model_name: str, batch_size: int):
+        self.model_name = model_name
+        self.name = f"cross_encoder:{model_name}"
+        self.batch_size = batch_size
+        self._model = None
+        self._load_lock = threading.Lock()
+
+    def load(self):
+        with self._load_lock:
+            if self._model is not None:
+                return self._model
+            try:
+                from sentence_transformers import CrossEncoder
+            except ImportError:
+                raise RuntimeError("RERANK_BACKEND=cross_encoder requires 'sentence-transformers' to be installed")
+            self._model = CrossEncoder(self.model_name, device="cpu")
+            logger.info(f"Loaded rerank model {self.model_name}")
+            return self._model
+
+    def score(self, query: str, passages: List[str]) -> List[float]:
+        pairs = [(query, p) for p in passages]
+        return [float(s) for s in self.load().predict(pairs, batch_size=self.batch_size, show_progress_bar=False)]
+
+class RerankService:
+    """
+    两阶段检索的第二阶段：对一阶段候选重排后取前 limit 条
+    超过时间预算时放弃重排，按一阶段顺序返回。已提交的打分无法中断，超时后仍占用线程池：
+    未完成的打分达到 RERANK_MAX_PENDING 时直接跳过重排，避免积压拖慢后续请求。
+    """
+
+    def __init__(self):
+        self._reranker: Optional[Reranker] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0  # 已提交且未完成的打分（含超时放弃的）
+        self._pending_lock = threading.Lock()
+        self.latency = LatencyTracker()
+        self.timeouts = 0
+        self.skipped = 0
+
+    async def start(self):
+        """预先加载重排模型（在线程池中执行，不阻塞事件循环）"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._get_executor(), self._get_reranker().load)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.RERANK_THREADS,
+                thread_name_prefix="rerank"
+            )
+        return self._executor
+
+    def _get_reranker(self) -> Reranker:
+        if self._reranker is None:
+            backend = settings.RERANK_BACKEND
+            if backend == "lexical":
+                self._reranker = LexicalOverlapReranker()
+            elif backend == "cross_encoder":
+                self._reranker = CrossEncoderReranker(settings.RERANK_MODEL, settings.RERANK_BATCH_SIZE)
+            else:
+                raise ValueError(f"Unknown RERANK_BACKEND: {backend}")
+        return self._reranker
+
+    async def rerank(
+        self,
+        query: str,
+        candidates: List[Dict[str, Any]],
+        limit: int,
+        budget_ms: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        if len(candidates) <= 1:
+            return candidates[:limit]
+        with self._pending_lock:
+            if self._pending >= settings.RERANK_MAX_PENDING:
+                self.skipped += 1
+                return candidates[:limit]
+            self._pending += 1
+
+        budget = (budget_ms if budget_ms is not None else settings.RERANK_TIMEOUT_MS) / 1000
+        reranker = self._get_reranker()
+        passages = [c["content"] for c in candidates]
+        started = time.perf_counter()
+        try:
+            future = self._get_executor().submit(reranker.score, query, passages)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        try:
+            scores = await asyncio.wait_for(asyncio.wrap_future(future), timeout=budget)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"Rerank exceeded {budget * 1000:.0f}ms budget, using first-stage order")
+            return candidates[:limit]
+        self.latency.record(time.perf_counter() - started)
+
+        # 稳定排序：分数相同时保持一阶段顺序
+        order = sorted(range(len(candidates)), key=lambda i: -scores[i])
+        return [{**candidates[i], "rerank_score": scores[i]} for i in order[:limit]]
+
+    def _release(self):
+        with self._pending_lock:
+            self._pending -= 1
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+rerank_service = RerankService()
@@ -0,0 +1,123 @@
+import os
+import re
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional
+from src.config.settings import settings
+from src.utils.metrics import LatencyTracker
+
+_EDGE_PUNCT = re.compile(r"^[\W_]+|[\W_]+$")
+
+def normalize_query(query: str) -> str:
+    """全角转半角、统一大小写与空白、去掉首尾标点，使近似相同的查询命中同一缓存"""
+    query = unicodedata.normalize("NFKC", query).lower()
+    query = re.sub(r"\s+", " ", query).strip()
+    return _EDGE_PUNCT.sub("", query)
+
+class KnowledgeGeneration:
+    """
+    知识库版本号：入库完成或删除文件时更新
+    存放在共享文件中，多个 uvicorn 进程都能感知其他进程的更新。
+    每次都重新读取文件：token 只有 32 字节，而 mtime 精度不足或 inode 复用时按 stat 判断会漏掉更新。
+    版本号使用随机 token 而非自增计数，避免并发更新时两个进程写出相同的值。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def current(self) -> str:
+        try:
+            return self.path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return ""
+
+    def bump(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+        tmp.write_text(uuid.uuid4().hex, encoding="utf-8")
+        os.replace(tmp, self.path)
+
+class RetrievalCache:
+    """检索结果缓存：TTL + LRU；key 中包含知识库版本号，知识变更后旧结果自然失效"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        # key -> (写入时间, 检索结果)
+        self._entries: OrderedDict = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.hit_latency = LatencyTracker()
+        self.miss_latency = LatencyTracker()
+
+    def key(
+        self,
+        generation: str,
+        query: str,
+        limit: int,
+        kb_types: Optional[List[str]],
+        tags: Optional[List[str]],
+        mode: str,
+        rerank: bool = False
+    ) -> Hashable:
+        return (
+            generation,
+            normalize_query(query),
+            limit,
+            tuple(sorted(kb_types or [])),
+            tuple(sorted(tags or [])),
+            mode,
+            rerank
+        )
+
+    def get(self, key: Hashable) -> Optional[List[Dict[str, Any]]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, results = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return [dict(r) for r in results]
+
+    def put(self, key: Hashable, results: List[Dict[str, Any]]):
+        self._entries[key] = (time.monotonic() + self.ttl, [dict(r) for r in results])
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def record(self, hit: bool, seconds: float):
+        if hit:
+            self.hits += 1
+            self.hit_latency.record(seconds)
+        else:
+            self.misses += 1
+            self.miss_latency.record(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        hit_p50 = self.hit_latency.percentile(0.5)
+        miss_p50 = self.miss_latency.percentile(0.5)
+        saved = None
+        if hit_p50 is not None and miss_p50 is not None:
+            saved = round(max(0.0, miss_p50 - hit_p50) * self.hits, 3)
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "hit_latency": self.hit_latency.snapshot(),
+            "miss_latency": self.miss_latency.snapshot(),
+            "estimated_seconds_saved": saved,
+        }
+
+knowledge_generation = KnowledgeGeneration(settings.KNOWLEDGE_GENERATION_PATH)
+retrieval_cache = RetrievalCache(
+    max_size=settings.RETRIEVAL_CACHE_SIZE,
+    ttl_seconds=settings.RETRIEVAL_CACHE_TTL_SECONDS
+)
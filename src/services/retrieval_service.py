@@ -0,0 +1,225 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from src.config.settings import settings
+from src.services.embedding_pipeline import query_embedder
+from src.services.keyword_index import keyword_index
+from src.services.reranker import rerank_service
+from src.services.retrieval_cache import knowledge_generation, retrieval_cache
+from src.services.vector_service import vector_service
+from src.utils.singleflight import SingleFlight
+
+SEARCH_MODES = ("vector", "keyword", "hybrid")
+
+def reciprocal_rank_fusion(
+    ranked_lists: List[List[Dict[str, Any]]],
+    limit: int,
+    k: int = 60
+) -> List[Dict[str, Any]]:
+    """RRF 融合多路结果：score = Σ 1 / (k + rank)，同一切片按 (doc_id, content) 合并"""
+    fused: Dict[Tuple[int, str], Dict[str, Any]] = {}
+    for results in ranked_lists:
+        for rank, item in enumerate(results, start=1):
+            key = (item["doc_id"], item["content"])
+            entry = fused.get(key)
+            if entry is None:
+                entry = {**item, "score": 0.0}
+                fused[key] = entry
+            elif entry.get("distance") is None and item.get("distance") is not None:
+                entry["distance"] = item["distance"]
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda r: r["score"], reverse=True)[:limit]
+
+class RetrievalService:
+    """
+    知识检索入口
+    - vector: 向量检索；keyword: BM25 关键词检索；hybrid: 两路各取候选后做 RRF 融合
+    - rerank=True 时一阶段多取 RERANK_CANDIDATES 个候选，经重排序后取前 limit 条
+    - 结果按 (知识库版本, 归一化查询, 过滤条件, limit, mode, rerank) 缓存，相同查询并发未命中时只检索一次
+    """
+
+    def __init__(self):
+        self._flight = SingleFlight()
+
+    async def search(
+        self,
+        query: str,
+        limit: int = 5,
+        kb_types: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None,
+        mode: str = "vector",
+        rerank: bool = False
+    ) -> List[Dict[str, Any]]:
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        if not settings.RETRIEVAL_CACHE_ENABLED:
+            return await self._search(query, limit, kb_types, tags, mode, rerank)
+
+        started = time.perf_counter()
+        key = retrieval_cache.key(knowledge_generation.current(), query, limit, kb_types, tags, mode, rerank)
+        results = retrieval_cache.get(key)
+        if results is not None:
+            retrieval_cache.record(True, time.perf_counter() - started)
+            return results
+
+        async def load():
+            found = await self._search(query, limit, kb_types, tags, mode, rerank)
+            retrieval_cache.put(key, found)
+            return found
+
+        results = await self._flight.do(key, load)
+        retrieval_cache.record(False, time.perf_counter() - started)
+        return [dict(r) for r in results]
+
+    async def search_many(
+        self,
+        queries: List[str],
+        limit: int = 5,
+        kb_types: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None,
+        mode: str = "vector",
+        rerank: bool = False
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        批量检索：未命中缓存的查询去重后一次性向量化，再批量检索
+        返回结果与 queries 一一对应。
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+
+        started = time.perf_counter()
+        use_cache = settings.RETRIEVAL_CACHE_ENABLED
+        results: List[Optional[List[Dict[str, Any]]]] = [None] * len(queries)
+        keys = []
+        if use_cache:
+            generation = knowledge_generation.current()
+            for i, query in enumerate(queries):
+                key = retrieval_cache.key(generation, query, limit, kb_types, tags, mode, rerank)
+                keys.append(key)
+                results[i] = retrieval_cache.get(key)
+                if results[i] is not None:
+                    retrieval_cache.record(True, time.perf_counter() - started)
+
+        missing = list(dict.fromkeys(q for q, r in zip(queries, results) if r is None))
+        if missing:
+            found = dict(zip(missing, await self._search_many(missing, limit, kb_types, tags, mode, rerank)))
+            elapsed = time.perf_counter() - started
+            for i, query in enumerate(queries):
+                if results[i] is not None:
+                    continue
+                results[i] = [dict(r) for r in found[query]]
+                if use_cache:
+                    retrieval_cache.put(keys[i], found[query])
+                    retrieval_cache.record(False, elapsed)
+        return results
+
+    def invalidate(self):
+        """知识库内容变更（入库完成 / 删除文件）后调用，使所有进程的缓存结果失效"""
+        knowledge_generation.bump()
+
+    async def _search(
+        self,
+        query: str,
+        limit: int,
+        kb_types: Optional[List[str]],
+        tags: Optional[List[str]],
+        mode: str,
+        rerank: bool
+    ) -> List[Dict[str, Any]]:
+        if not rerank:
+            return await self._first_stage(query, limit, kb_types, tags, mode)
+        candidates = await self._first_stage(query, max(limit, settings.RERANK_CANDIDATES), kb_types, tags, mode)
+        return await rerank_service.rerank(query, candidates, limit)
+
+    async def _search_many(
+        self,
+        queries: List[str],
+        limit: int,
+        kb_types: Optional[List[str]],
+        tags: Optional[List[str]],
+        mode: str,
+        rerank: bool
+    ) -> List[List[Dict[str, Any]]]:
+        if not rerank:
+            return await self._first_stage_many(queries, limit, kb_types, tags, mode)
+        candidate_lists = await self._first_stage_many(
+            queries, max(limit, settings.RERANK_CANDIDATES), kb_types, tags, mode
+        )
+        return list(await asyncio.gather(*[
+            rerank_service.rerank(q, candidates, limit) for q, candidates in zip(queries, candidate_lists)
+        ]))
+
+    async def _first_stage(
+        self,
+        query: str,
+        limit: int,
+        kb_types: Optional[List[str]],
+        tags: Optional[List[str]],
+        mode: str
+    ) -> List[Dict[str, Any]]:
+        if mode == "keyword":
+            return await keyword_index.search(query, limit, kb_types, tags)
+        if mode == "vector":
+            return await self._vector_search(query, limit, kb_types, tags)
+
+        candidates = max(limit * settings.HYBRID_CANDIDATE_MULTIPLIER, limit)
+        vector_results, keyword_results = await asyncio.gather(
+            self._vector_search(query, candidates, kb_types, tags),
+            keyword_index.search(query, candidates, kb_types, tags)
+        )
+        return reciprocal_rank_fusion([vector_results, keyword_results], limit, k=settings.HYBRID_RRF_K)
+
+    async def _first_stage_many(
+        self,
+        queries: List[str],
+        limit: int,
+        kb_types: Optional[List[str]],
+        tags: Optional[List[str]],
+        mode: str
+    ) -> List[List[Dict[str, Any]]]:
+        if mode == "keyword":
+            return await self._keyword_search_many(queries, limit, kb_types, tags)
+        if mode == "vector":
+            return await self._vector_search_many(queries, limit, kb_types, tags)
+
+        candidates = max(limit * settings.HYBRID_CANDIDATE_MULTIPLIER, limit)
+        vector_lists, keyword_lists = await asyncio.gather(
+            self._vector_search_many(queries, candidates, kb_types, tags),
+            self._keyword_search_many(queries, candidates, kb_types, tags)
+        )
+        return [
+            reciprocal_rank_fusion([v, k], limit, k=settings.HYBRID_RRF_K)
+            for v, k in zip(vector_lists, keyword_lists)
+        ]
+
+    async def _keyword_search_many(
+        self,
+        queries: List[str],
+        limit: int,
+        kb_types: Optional[List[str]],
+        tags: Optional[List[str]]
+    ) -> List[List[Dict[str, Any]]]:
+        return list(await asyncio.gather(*[keyword_index.search(q, limit, kb_types, tags) for q in queries]))
+
+    async def _vector_search_many(
+        self,
+        queries: List[str],
+        limit: int,
+        kb_types: Optional[List[str]],
+        tags: Optional[List[str]]
+    ) -> List[List[Dict[str, Any]]]:
+        query_vectors = await query_embedder.embed_many(queries)
+        return await vector_service.search_many(query_vectors, limit=limit, kb_types=kb_types, tags=tags)
+
+    async def _vector_search(
+        self,
+        query: str,
+        limit: int,
+        kb_types: Optional[List[str]],
+        tags: Optional[List[str]]
+    ) -> List[Dict[str, Any]]:
+        # 并发的查询向量请求合并为一次 API 调用
+        query_vector = await query_embedder.embed(query)
+        return await vector_service.search(query_vector=query_vector, limit=limit, kb_types=kb_types, tags=tags)
+
+retrieval_service = RetrievalService()
@@ -1,37 +1,139 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Iterator, Optional, TypeVar
 import weaviate
 import weaviate.classes.config as config
+import weaviate.classes.query as wq
 from src.config.settings import settings
-from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger("healthy_rag")
+
+T = TypeVar("T")
 
 class VectorService:
-    """Weaviate 向量数据库服务类."""
-    
+    """
+    Weaviate 向量数据库服务类
+    - 进程内共享一个客户端（HTTP + gRPC 连接只建立一次），由 FastAPI lifespan 负责创建与关闭
+    - 同步客户端调用放到有界线程池中执行，不阻塞事件循环
+    - 缓存 collection 句柄；调用失败且连接不可用时自动重连并重试一次
+    """
+
+    DELETE_BATCH = 500  # 按哈希删除时每次过滤的哈希数
+
     def __init__(self):
+        self.collection_name = "KnowledgeChunk"
+        self._client: Optional[weaviate.WeaviateClient] = None
+        self._collection = None
+        self._schema_ready = False
+        self._lock = threading.Lock()
+        # 批量写入上下文与 failed_objects 挂在共享的 collection 句柄上且非线程安全：
+        # 并发入库时串行写入，避免批次交错、失败对象被记到其他上传上
+        self._batch_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.reconnects = 0
+
+    def _connect(self) -> weaviate.WeaviateClient:
         # 解析 WEAVIATE_URL，如果在 Docker 中应该使用容器名 (如 healthy-rag-weaviate)
         weaviate_url = settings.WEAVIATE_URL.replace("http://", "").replace("https://", "")
-        
+
         if ":" in weaviate_url:
             host = weaviate_url.split(":")[0]
             port = int(weaviate_url.split(":")[1])
         else:
             host = weaviate_url
             port = 8080
-            
+
         # 注意：connect_to_local 实际上是用于连接自定义的 host/port，不局限于 localhost
-        self.client = weaviate.connect_to_local(
+        return weaviate.connect_to_local(
             host=host,
             port=port,
             headers={
                 "X-OpenAI-Api-Key": settings.VOLC_API_KEY or ""  # 避免 None 报错
             }
         )
-        self.collection_name = "KnowledgeChunk"
 
-    def close(self):
-        self.client.close()
+    @property
+    def client(self) -> weaviate.WeaviateClient:
+        with self._lock:
+            if self._client is None:
+                self._client = self._connect()
+            return self._client
+
+    def _get_collection(self):
+        if self._collection is None:
+            self._collection = self.client.collections.get(self.collection_name)
+        return self._collection
+
+    def _reset(self):
+        """丢弃当前连接，下次调用时重建"""
+        with self._lock:
+            client, self._client = self._client, None
+            self._collection = None
+            self._schema_ready = False
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    def _is_live(self) -> bool:
+        try:
+            return self._client is not None and self._client.is_live()
+        except Exception:
+            return False
+
+    def _call(self, fn: Callable[[], T]) -> T:
+        try:
+            return fn()
+        except Exception as e:
+            if self._is_live():
+                raise
+            logger.warning(f"Weaviate connection lost ({e}), reconnecting")
+            self._reset()
+            self.reconnects += 1
+            return fn()
+
+    async def _run(self, fn: Callable[[], T]) -> T:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.WEAVIATE_MAX_WORKERS,
+                thread_name_prefix="weaviate"
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn)
+
+    async def start(self):
+        """建立连接并确保 Schema 存在（应用启动时调用）；Weaviate 不可用时不阻止启动，首次调用时再连接"""
+        try:
+            await self.init_schema()
+        except Exception as e:
+            logger.warning(f"Weaviate unavailable at startup: {e}")
+
+    async def close(self):
+        """关闭连接（应用关闭时调用）"""
+        self._reset()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def health(self) -> Dict[str, Any]:
+        def check():
+            try:
+                return self.client.is_ready()
+            except Exception:
+                return False
+
+        ready = await self._run(check)
+        return {"connected": self._client is not None, "ready": ready, "reconnects": self.reconnects}
 
-    def init_schema(self):
+    async def init_schema(self):
         """初始化 Schema."""
+        if not self._schema_ready:
+            await self._run(self._init_schema)
+
+    def _init_schema(self):
         if not self.client.collections.exists(self.collection_name):
             self.client.collections.create(
                 name=self.collection_name,
@@ -42,47 +144,104 @@ class VectorService:
                     config.Property(name="kb_type", data_type=config.DataType.TEXT),
                     config.Property(name="tags", data_type=config.DataType.TEXT_ARRAY),
                     config.Property(name="source", data_type=config.DataType.TEXT),
+                    _chunk_hash_property(),
                 ]
             )
             print(f"Collection {self.collection_name} created.")
+        else:
+            # 旧集合补充 chunk_hash 属性（增量入库按内容哈希删除切片）
+            collection = self.client.collections.get(self.collection_name)
+            if not any(p.name == "chunk_hash" for p in collection.config.get().properties):
+                collection.config.add_property(_chunk_hash_property())
+        self._schema_ready = True
 
-    def add_chunks(self, chunks: List[Dict[str, Any]]):
+    async def add_chunks(self, chunks: List[Dict[str, Any]]):
         """批量添加切片."""
-        collection = self.client.collections.get(self.collection_name)
-        
-        with collection.batch.dynamic() as batch:
-            for chunk in chunks:
-                batch.add_object(
-                    properties={
-                        "content": chunk["content"],
-                        "doc_id": chunk["doc_id"],
-                        "kb_type": chunk["kb_type"],
-                        "tags": chunk["tags"],
-                        "source": chunk["source"],
-                    },
-                    vector=chunk["vector"]
-                )
-        
-        if collection.batch.failed_objects:
-            print(f"Failed to add objects: {collection.batch.failed_objects}")
+        await self._run(lambda: self._add_chunks(chunks))
+
+    def _add_chunks(self, chunks: List[Dict[str, Any]]):
+        collection = self._get_collection()
+
+        with self._batch_lock:
+            with collection.batch.dynamic() as batch:
+                for chunk in chunks:
+                    batch.add_object(
+                        properties={
+                            "content": chunk["content"],
+                            "doc_id": chunk["doc_id"],
+                            "kb_type": chunk["kb_type"],
+                            "tags": chunk["tags"],
+                            "source": chunk["source"],
+                            "chunk_hash": chunk.get("chunk_hash", ""),
+                        },
+                        vector=chunk["vector"]
+                    )
+            failed = collection.batch.failed_objects
+
+        if failed:
+            print(f"Failed to add objects: {failed}")
             raise Exception("Failed to add chunks to Weaviate")
 
-    def search(
-        self, 
-        query_vector: List[float], 
+    def iter_chunks(self) -> Iterator[Dict[str, Any]]:
+        """遍历全部切片（不含向量）；同步调用，供重建关键词索引等离线脚本使用"""
+        for obj in self._get_collection().iterator(include_vector=False):
+            props = obj.properties
+            yield {
+                "content": props["content"],
+                "doc_id": props["doc_id"],
+                "kb_type": props["kb_type"],
+                "tags": props.get("tags") or [],
+                "source": props["source"],
+                "chunk_hash": props.get("chunk_hash") or None,
+            }
+
+    async def search(
+        self,
+        query_vector: List[float],
         limit: int = 5,
-        filters: Optional[Any] = None
+        kb_types: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
         """向量检索."""
-        collection = self.client.collections.get(self.collection_name)
-        
+        filters = self._build_filters(kb_types, tags)
+        return await self._run(lambda: self._search(query_vector, limit, filters))
+
+    async def search_many(
+        self,
+        query_vectors: List[List[float]],
+        limit: int = 5,
+        kb_types: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """批量向量检索：过滤条件只构建一次，各查询在线程池中并发执行"""
+        filters = self._build_filters(kb_types, tags)
+        return list(await asyncio.gather(*[
+            self._run(lambda v=v: self._search(v, limit, filters)) for v in query_vectors
+        ]))
+
+    def _build_filters(self, kb_types: Optional[List[str]], tags: Optional[List[str]]) -> Optional[Any]:
+        """kb_types 之间为 OR，tags 之间为 OR（包含任一即可），两组条件之间为 AND"""
+        conditions = []
+        if kb_types:
+            kb_conditions = [wq.Filter.by_property("kb_type").equal(kb) for kb in kb_types]
+            conditions.append(wq.Filter.any_of(kb_conditions) if len(kb_conditions) > 1 else kb_conditions[0])
+        if tags:
+            conditions.append(wq.Filter.by_property("tags").contains_any(tags))
+
+        if len(conditions) > 1:
+            return wq.Filter.all_of(conditions)
+        return conditions[0] if conditions else None
+
+    def _search(self, query_vector: List[float], limit: int, filters: Optional[Any]) -> List[Dict[str, Any]]:
+        collection = self._get_collection()
+
         response = collection.query.near_vector(
             near_vector=query_vector,
             limit=limit,
             filters=filters,
-            return_metadata=weaviate.classes.query.MetadataQuery(distance=True)
+            return_metadata=wq.MetadataQuery(distance=True)
         )
-        
+
         results = []
         for obj in response.objects:
             results.append({
@@ -92,13 +251,50 @@ class VectorService:
                 "source": obj.properties["source"],
                 "distance": obj.metadata.distance
             })
-            
+
         return results
 
-    def delete_by_doc_id(self, doc_id: int):
+    async def delete_by_doc_id(self, doc_id: int):
         """删除指定文档的所有切片."""
-        collection = self.client.collections.get(self.collection_name)
-        collection.data.delete_many(
-            where=weaviate.classes.query.Filter.by_property("doc_id").equal(doc_id)
+        await self._run(lambda: self._get_collection().data.delete_many(
+            where=wq.Filter.by_property("doc_id").equal(doc_id)
+        ))
+
+    async def delete_chunks(self, doc_id: int, chunk_hashes: List[str]):
+        """删除指定文档中给定内容哈希的切片（增量更新时删除已消失的切片）"""
+        hashes = list(chunk_hashes)
+        for i in range(0, len(hashes), self.DELETE_BATCH):
+            batch = hashes[i:i + self.DELETE_BATCH]
+            await self._run(lambda batch=batch: self._get_collection().data.delete_many(
+                where=wq.Filter.all_of([
+                    wq.Filter.by_property("doc_id").equal(doc_id),
+                    wq.Filter.by_property("chunk_hash").contains_any(batch)
+                ])
+            ))
+
+def _chunk_hash_property():
+    # 按整个字段分词，哈希值作为一个整体匹配
+    return config.Property(
+        name="chunk_hash",
+        data_type=config.DataType.TEXT,
+        tokenization=config.Tokenization.FIELD
+    )
+
+def _create_vector_service():
+    """按 settings.VECTOR_BACKEND 选择向量库后端：weaviate / local (进程内 NumPy 索引)"""
+    backend = settings.VECTOR_BACKEND
+    if backend == "weaviate":
+        return VectorService()
+    if backend == "local":
+        from src.services.local_vector_store import LocalVectorStore
+        return LocalVectorStore(
+            settings.LOCAL_VECTOR_PATH,
+            settings.LOCAL_VECTOR_DTYPE,
+            index=settings.LOCAL_VECTOR_INDEX,
+            nlist=settings.LOCAL_VECTOR_IVF_NLIST,
+            nprobe=settings.LOCAL_VECTOR_IVF_NPROBE,
+            min_rows=settings.LOCAL_VECTOR_IVF_MIN_ROWS
         )
+    raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")
 
+vector_service = _create_vector_service()
@@ -1,37 +1,32 @@
-import httpx
 from typing import List
 from src.config.settings import settings
+from src.services.embedding_cache import embedding_cache
+from src.services.embedding_providers import get_embedding_provider
 
 class VolcService:
-    """火山引擎服务类."""
-    
+    """向量化服务类（后端由 settings.EMBEDDING_BACKEND 选择，默认火山引擎）."""
+
     def __init__(self):
-        self.api_key = settings.VOLC_API_KEY
-        self.model = settings.VOLC_EMBEDDING_MODEL
-        self.base_url = settings.VOLC_API_BASE
-        
+        self.provider = get_embedding_provider()
+        self.model = self.provider.model
+
     async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """获取文本向量 embeddings."""
+        """获取文本向量 embeddings（优先读取缓存，只为未命中的文本调用后端）."""
         if not texts:
             return []
-            
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{self.base_url}/embeddings",
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.api_key}"
-                },
-                json={
-                    "model": self.model,
-                    "input": texts,
-                    "encoding_format": "float"
-                }
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"Volcengine API Error: {response.text}")
-                
-            data = response.json()
-            return [item["embedding"] for item in data["data"]]
 
+        if not settings.EMBEDDING_CACHE_ENABLED or not self.provider.cacheable:
+            return await self._request_embeddings(texts)
+
+        vectors = await embedding_cache.get_many(self.model, texts)
+        # 未命中的文本去重后再请求
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            fetched = await self._request_embeddings(missing)
+            await embedding_cache.put_many(self.model, missing, fetched)
+            by_text = dict(zip(missing, fetched))
+            vectors = [v if v is not None else by_text[t] for t, v in zip(texts, vectors)]
+        return vectors
+
+    async def _request_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self.provider.embed(texts)
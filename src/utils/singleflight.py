@@ -0,0 +1,32 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """
+    进程内按 key 合并并发调用
+    同一 key 正在执行时，后续调用方等待同一个结果，而不是重复执行。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+        # shield：某个等待方被取消时不影响共享的执行
+        return await asyncio.shield(future)
+
+    def in_flight(self, key: Hashable) -> Optional[asyncio.Future]:
+        return self._calls.get(key)
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # 没有等待方时也要取走异常，避免 "exception was never retrieved" 警告
+        if not future.cancelled():
+            future.exception()
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from src.services import embedding_pipeline
+from src.services.embedding_pipeline import EmbeddingMicroBatcher, EmbeddingScheduler
+from src.services.embedding_providers import EmbeddingPayloadError
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(embedding_pipeline.asyncio, "sleep", sleep)
+    return delays
+
+
+def make_scheduler(embed_fn, **kwargs):
+    options = dict(max_in_flight=1, initial_batch_size=8, max_batch_size=8, max_batch_tokens=10 ** 6, max_retries=3)
+    options.update(kwargs)
+    return EmbeddingScheduler(embed_fn, **options)
+
+
+def test_transient_error_retries_whole_batch(no_backoff):
+    calls = []
+
+    async def embed(texts):
+        calls.append(len(texts))
+        if len(calls) <= 2:
+            raise Exception("503 Service Unavailable")
+        return [[float(t)] for t in texts]
+
+    scheduler = make_scheduler(embed)
+    texts = [str(i) for i in range(8)]
+    assert asyncio.run(scheduler.embed(texts)) == [[float(i)] for i in range(8)]
+    assert calls == [8, 8, 8]
+    assert no_backoff == [1, 2]
+    assert scheduler.batch_size == 8
+
+
+def test_transient_error_gives_up_after_max_retries(no_backoff):
+    async def embed(texts):
+        raise Exception("429 Too Many Requests")
+
+    scheduler = make_scheduler(embed, max_retries=2)
+    with pytest.raises(Exception, match="429"):
+        asyncio.run(scheduler.embed(["a", "b"]))
+    assert no_backoff == [1, 2]
+    assert scheduler.batch_size == 8
+
+
+def test_payload_error_splits_batch(no_backoff):
+    calls = []
+
+    async def embed(texts):
+        calls.append(len(texts))
+        if len(texts) > 2:
+            raise EmbeddingPayloadError("input too long")
+        return [[float(t)] for t in texts]
+
+    scheduler = make_scheduler(embed)
+    texts = [str(i) for i in range(8)]
+    assert asyncio.run(scheduler.embed(texts)) == [[float(i)] for i in range(8)]
+    assert calls == [8, 4, 2, 2, 4, 2, 2]
+    assert no_backoff == []
+    assert scheduler.batch_size == 2
+
+
+def test_payload_error_on_single_text_fails(no_backoff):
+    async def embed(texts):
+        raise EmbeddingPayloadError("input too long")
+
+    with pytest.raises(EmbeddingPayloadError):
+        asyncio.run(make_scheduler(embed).embed(["a"]))
+
+
+def test_micro_batcher_fails_every_caller_on_short_result():
+    async def embed(texts):
+        return [[1.0]] * (len(texts) - 1)
+
+    async def run():
+        batcher = EmbeddingMicroBatcher(embed, window_ms=1, max_batch=8)
+        return await asyncio.gather(*[batcher.embed(str(i)) for i in range(3)], return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, Exception) and "mismatch" in str(r) for r in results)
+
+
+def test_micro_batcher_merges_concurrent_queries():
+    calls = []
+
+    async def embed(texts):
+        calls.append(list(texts))
+        return [[float(t)] for t in texts]
+
+    async def run():
+        batcher = EmbeddingMicroBatcher(embed, window_ms=1, max_batch=8)
+        return await asyncio.gather(*[batcher.embed(str(i)) for i in range(3)])
+
+    assert asyncio.run(run()) == [[0.0], [1.0], [2.0]]
+    assert calls == [["0", "1", "2"]]
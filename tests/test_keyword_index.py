@@ -0,0 +1,68 @@
+import asyncio
+import os
+
+from src.services.keyword_index import KeywordIndex
+from src.services.retrieval_cache import KnowledgeGeneration
+
+
+def make_chunks(doc_id, contents):
+    return [
+        {
+            "content": content,
+            "doc_id": doc_id,
+            "kb_type": "science",
+            "tags": [],
+            "source": f"doc{doc_id}",
+            "chunk_hash": f"{doc_id}-{i}",
+        }
+        for i, content in enumerate(contents)
+    ]
+
+
+def search(index, query):
+    return [r["content"] for r in asyncio.run(index.search(query, 5))]
+
+
+def test_index_syncs_writes_from_other_processes(tmp_path):
+    generation = KnowledgeGeneration(tmp_path / "generation")
+    worker_a = KeywordIndex(tmp_path / "keywords.db", generation)
+    worker_b = KeywordIndex(tmp_path / "keywords.db", generation)
+    asyncio.run(worker_a.start())
+    asyncio.run(worker_b.start())
+
+    asyncio.run(worker_a.add_chunks(make_chunks(1, ["diabetes diet guide", "gout purine limits"])))
+    # 版本号未变化时不检查 SQLite
+    assert search(worker_b, "gout") == []
+    generation.bump()
+    assert search(worker_b, "gout") == ["gout purine limits"]
+
+    asyncio.run(worker_a.delete_chunks(1, ["1-1"]))
+    generation.bump()
+    assert search(worker_b, "gout") == []
+    assert search(worker_b, "diabetes") == ["diabetes diet guide"]
+
+
+def test_delete_removes_chunks_written_by_other_processes(tmp_path):
+    generation = KnowledgeGeneration(tmp_path / "generation")
+    worker_a = KeywordIndex(tmp_path / "keywords.db", generation)
+    worker_b = KeywordIndex(tmp_path / "keywords.db", generation)
+    asyncio.run(worker_b.start())
+
+    asyncio.run(worker_a.add_chunks(make_chunks(2, ["blood pressure"])))
+    # 删除前强制同步，即使版本号尚未更新
+    asyncio.run(worker_b.delete_by_doc_id(2))
+    assert asyncio.run(worker_b.doc_ids()) == set()
+
+    reloaded = KeywordIndex(tmp_path / "keywords.db", generation)
+    assert search(reloaded, "blood") == []
+
+
+def test_generation_sees_updates_with_unchanged_mtime(tmp_path):
+    generation = KnowledgeGeneration(tmp_path / "generation")
+    generation.bump()
+    before = generation.current()
+    stat = os.stat(generation.path)
+    generation.bump()
+    # 模拟 mtime 精度不足：两次更新落在同一时间戳内
+    os.utime(generation.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert generation.current() not in ("", before)
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from src.services.ivf_index import IVFIndex
+from src.services.local_vector_store import LocalVectorStore
+
+
+def make_chunks(doc_id, vectors, prefix="c", tags=None, kb_type="science"):
+    return [
+        {
+            "content": f"{prefix}{i}",
+            "doc_id": doc_id,
+            "kb_type": kb_type,
+            "tags": tags or [],
+            "source": f"doc{doc_id}",
+            "chunk_hash": f"{prefix}{i}",
+            "vector": list(map(float, v)),
+        }
+        for i, v in enumerate(vectors)
+    ]
+
+
+def one_hot(dim, index):
+    v = np.zeros(dim, dtype=np.float32)
+    v[index] = 1.0
+    return v
+
+
+def top(store, vector, limit=1, **filters):
+    return asyncio.run(store.search(list(map(float, vector)), limit, **filters))
+
+
+def reopen(store, **kwargs):
+    return LocalVectorStore(store.path, store.dtype, **kwargs)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_reload_returns_same_results(tmp_path, dtype):
+    store = LocalVectorStore(tmp_path, dtype)
+    asyncio.run(store.add_chunks(make_chunks(1, [one_hot(8, i) for i in range(4)], tags=["a"])))
+    asyncio.run(store.add_chunks(make_chunks(2, [one_hot(8, i) for i in range(4, 8)], prefix="d")))
+
+    reloaded = reopen(store)
+    hit = top(reloaded, one_hot(8, 5))[0]
+    assert (hit["doc_id"], hit["content"]) == (2, "d1")
+    assert hit["distance"] == pytest.approx(0.0, abs=1e-2)
+    assert [r["content"] for r in top(reloaded, one_hot(8, 5), 8, tags=["a"])] == ["c0", "c1", "c2", "c3"]
+
+
+def test_uncommitted_tail_is_discarded_on_reload(tmp_path):
+    store = LocalVectorStore(tmp_path)
+    asyncio.run(store.add_chunks(make_chunks(1, [one_hot(4, 0), one_hot(4, 1)])))
+    # 模拟写入记录后、提交 meta.json 前崩溃
+    with open(store._records_file(), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"doc_id": 9, "scale": 1.0, "content": "UNCOMMITTED", "source": "x",
+                            "kb_type": "science", "tags": [], "chunk_hash": None}) + "\n")
+
+    reloaded = reopen(store)
+    reloaded._ensure_loaded()
+    assert reloaded.count == 2
+    asyncio.run(reloaded.add_chunks(make_chunks(2, [one_hot(4, 2)], prefix="d")))
+
+    again = reopen(store)
+    hits = [(r["doc_id"], r["content"]) for r in top(again, one_hot(4, 2), 3)]
+    assert hits[0] == (2, "d0")
+    assert all(content != "UNCOMMITTED" for _, content in hits)
+
+
+def test_failed_write_reloads_committed_state(tmp_path, monkeypatch):
+    store = LocalVectorStore(tmp_path)
+    asyncio.run(store.add_chunks(make_chunks(1, [one_hot(4, 0)])))
+
+    def fail():
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "_commit", fail)
+    with pytest.raises(OSError):
+        asyncio.run(store.add_chunks(make_chunks(2, [one_hot(4, 1)], prefix="d")))
+    monkeypatch.undo()
+
+    assert [r["content"] for r in top(store, one_hot(4, 1), 5)] == ["c0"]
+    asyncio.run(store.add_chunks(make_chunks(3, [one_hot(4, 2)], prefix="e")))
+    assert top(reopen(store), one_hot(4, 2))[0]["content"] == "e0"
+
+
+def test_delete_persists(tmp_path):
+    store = LocalVectorStore(tmp_path)
+    asyncio.run(store.add_chunks(make_chunks(1, [one_hot(4, i) for i in range(4)])))
+    asyncio.run(store.add_chunks(make_chunks(2, [one_hot(4, i) for i in range(4)], prefix="d")))
+    asyncio.run(store.add_chunks(make_chunks(3, [one_hot(4, i) for i in range(4)], prefix="e")))
+    asyncio.run(store.delete_chunks(1, ["c0"]))
+
+    reloaded = reopen(store)
+    contents = {r["content"] for r in top(reloaded, one_hot(4, 0), 12)}
+    assert "c0" not in contents and "c1" in contents
+
+    asyncio.run(reloaded.delete_by_doc_id(2))
+    contents = {r["content"] for r in top(reopen(store), one_hot(4, 0), 12)}
+    assert contents == {"c1", "c2", "c3", "e0", "e1", "e2", "e3"}
+
+
+def test_compaction_rewrites_files_and_survives_reload(tmp_path):
+    store = LocalVectorStore(tmp_path)
+    asyncio.run(store.add_chunks(make_chunks(1, [one_hot(8, i) for i in range(6)])))
+    asyncio.run(store.add_chunks(make_chunks(2, [one_hot(8, i) for i in range(2)], prefix="d")))
+    asyncio.run(store.delete_by_doc_id(1))
+
+    assert store.count == 2 and store._gen == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["meta.json", "records.1.jsonl", "vectors.1.npy"]
+
+    asyncio.run(store.add_chunks(make_chunks(3, [one_hot(8, 5)], prefix="e")))
+    reloaded = reopen(store)
+    reloaded._ensure_loaded()
+    assert reloaded.count == 3
+    assert [(r["doc_id"], r["content"]) for r in top(reloaded, one_hot(8, 1), 3)][0] == (2, "d1")
+    assert top(reloaded, one_hot(8, 5))[0]["content"] == "e0"
+
+
+def test_interrupted_compaction_keeps_previous_generation(tmp_path, monkeypatch):
+    store = LocalVectorStore(tmp_path)
+    asyncio.run(store.add_chunks(make_chunks(1, [one_hot(4, i) for i in range(3)])))
+    asyncio.run(store.add_chunks(make_chunks(2, [one_hot(4, 3)], prefix="d")))
+
+    def crash():
+        raise OSError("crash before commit")
+
+    monkeypatch.setattr(store, "_commit", crash)
+    with pytest.raises(OSError):
+        asyncio.run(store.delete_by_doc_id(1))
+
+    reloaded = reopen(store)
+    assert {r["content"] for r in top(reloaded, one_hot(4, 0), 4)} == {"c0", "c1", "c2", "d0"}
+    assert not (tmp_path / "vectors.1.npy").exists()
+
+
+def test_ivf_index_survives_reload(tmp_path):
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((600, 16)).astype(np.float32)
+    store = LocalVectorStore(tmp_path, index="ivf", nlist=8, nprobe=8, min_rows=200)
+    for s in range(0, 600, 100):
+        asyncio.run(store.add_chunks(make_chunks(s, data[s:s + 100], prefix=f"r{s}_")))
+    assert store._ivf.trained
+
+    reloaded = reopen(store, index="ivf", nlist=8, nprobe=8, min_rows=200)
+    reloaded._ensure_loaded()
+    np.testing.assert_array_equal(reloaded._ivf.assignments, store._ivf.assignments)
+    # nprobe = nlist 时 IVF 检索等价于精确检索
+    assert top(reloaded, data[123])[0]["content"] == "r100_23"
+
+
+def test_ivf_training_runs_outside_lock_and_catches_up(tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    data = rng.standard_normal((400, 16)).astype(np.float32)
+    store = LocalVectorStore(tmp_path, index="ivf", nlist=8, nprobe=8, min_rows=200)
+    asyncio.run(store.add_chunks(make_chunks(0, data[:100], prefix="a")))
+
+    train = IVFIndex.train
+
+    def train_with_concurrent_writes(index, count, read, seed=0):
+        # 训练期间其他线程仍能检索与写入（训练持有存储锁时该线程会阻塞）
+        hits = []
+        worker = threading.Thread(target=lambda: (
+            hits.extend(top(store, data[5])),
+            store._add_chunks(make_chunks(2, data[200:400], prefix="c"))
+        ))
+        worker.start()
+        worker.join(timeout=5)
+        assert not worker.is_alive()
+        assert hits[0]["content"] == "a5"
+        train(index, count, read, seed)
+
+    monkeypatch.setattr(IVFIndex, "train", train_with_concurrent_writes)
+    asyncio.run(store.add_chunks(make_chunks(1, data[100:200], prefix="b")))
+
+    assert store._ivf.trained and store._ivf.trained_rows == 200
+    assert len(store._ivf.assignments) == store.count == 400
+    assert top(store, data[350])[0]["content"] == "c150"
+    reloaded = reopen(store, index="ivf", nlist=8, nprobe=8, min_rows=200)
+    reloaded._ensure_loaded()
+    np.testing.assert_array_equal(reloaded._ivf.assignments, store._ivf.assignments)
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import pytest
+
+from src.services import parse_pool as parse_pool_module
+from src.services.parse_pool import DocumentParsePool
+
+
+# 以下函数在子进程中按模块路径导入执行
+def page_count(path):
+    return 3, 0.0
+
+
+def parse_pages(path, start, end):
+    time.sleep(0.1)
+    return [f"{path}:{start}"], 0.0
+
+
+def parse_document(path, filename):
+    if filename.startswith("hang"):
+        time.sleep(60)
+    return [filename], 0.0
+
+
+@pytest.fixture
+def parser(monkeypatch):
+    monkeypatch.setattr(parse_pool_module.document_parser, "pdf_page_count", page_count)
+    monkeypatch.setattr(parse_pool_module.document_parser, "parse_pdf_pages", parse_pages)
+    monkeypatch.setattr(parse_pool_module.document_parser, "parse_document", parse_document)
+
+
+async def collect(pool, path, filename):
+    try:
+        return [segment async for segment in pool.iter_segments(path, filename)]
+    except Exception as e:
+        return f"error: {e}"
+
+
+def test_timeout_does_not_fail_documents_queued_behind_it(parser):
+    async def run():
+        pool = DocumentParsePool(workers=1, timeout=3, shard_pages=1)
+        try:
+            hung = asyncio.ensure_future(collect(pool, "a", "hang.docx"))
+            await asyncio.sleep(0.1)
+            return await asyncio.gather(hung, collect(pool, "b", "b.pdf"), collect(pool, "c", "c.docx"))
+        finally:
+            pool.close()
+
+    hung, pdf, doc = asyncio.run(run())
+    assert "timed out" in hung
+    assert pdf == ["b:0", "b:1", "b:2"]
+    assert doc == ["c.docx"]
+
+
+def test_tasks_killed_by_another_timeout_are_resubmitted(parser):
+    async def run():
+        pool = DocumentParsePool(workers=2, timeout=3, shard_pages=1)
+        try:
+            results = await asyncio.gather(
+                collect(pool, "a", "hang.docx"),
+                collect(pool, "b", "b.pdf"),
+                collect(pool, "c", "c.pdf"),
+            )
+            return results, [(r["filename"], r["status"]) for r in pool.snapshot()["recent"]]
+        finally:
+            pool.close()
+
+    (hung, first, second), statuses = asyncio.run(run())
+    assert "timed out" in hung
+    assert first == ["b:0", "b:1", "b:2"]
+    assert second == ["c:0", "c:1", "c:2"]
+    assert sorted(statuses) == [("b.pdf", "completed"), ("c.pdf", "completed"), ("hang.docx", "timeout")]